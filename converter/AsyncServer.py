@@ -0,0 +1,195 @@
+import asyncio
+import logging
+from functools import partial
+from time import monotonic
+
+from CamCommandTranslator import CamCommandTranslator as Translator
+from CamInitializer import CamInitializer
+from CamStorage import get_cam_params
+
+logger = logging.getLogger(__name__)
+
+
+class ViscaDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, translator):
+        self.translator = translator
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        tracer = self.translator.tracer
+        trace = None if tracer is None else tracer.start(self.translator.visca_port, monotonic())
+        try:
+            self.__handle(data, addr, trace)
+        finally:
+            if trace is not None:
+                tracer.release(trace)
+
+    def __handle(self, data, addr, trace):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Received %s from %s', data.hex(), addr)
+        self.translator.record_received(((data, addr),))
+        try:
+            if trace is None:
+                visca_response = self.translator.handle_datagram(data, addr)
+            else:
+                visca_response = self.translator.handle_traced_datagram(data, addr, trace)
+        except Exception as e:
+            logger.exception(f'Cannot handle {data.hex()} from {addr}. {e}')
+            return
+        if visca_response is not None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Sending %s to %s', visca_response.hex(), addr)
+            self.translator.record_sent(((visca_response, addr),))
+            send_started = monotonic()
+            self.transport.sendto(visca_response, addr)
+            if trace is not None:
+                trace.add_span('send', send_started, monotonic())
+
+    def error_received(self, exc):
+        logger.error(f'Visca socket error. {exc}')
+
+
+def close_translator(loop, translator):
+    # translator close waits for the onvif call in flight, so it is not waited for in the event loop
+    loop.run_in_executor(None, translator.close)
+
+
+class CamEndpoint:
+    def __init__(self, params, translator, transport):
+        self.params = params
+        self.translator = translator
+        self.transport = transport
+
+    def close(self):
+        self.transport.close()
+        close_translator(asyncio.get_running_loop(), self.translator)
+
+
+class AsyncTranslatorServer:
+    """
+    Serves visca ports of all cameras from a single asyncio event loop.
+    Every camera udp socket is an asyncio datagram endpoint, received datagrams
+    are translated right in the loop, onvif calls are executed by camera command workers
+    """
+    def __init__(self, cam_storage, command_queue_size=32, init_parallel=8, init_deadline=20):
+        self.cam_storage = cam_storage
+        self.command_queue_size = command_queue_size
+        self.cam_initializer = CamInitializer(self.on_cam_ready, max_parallel=init_parallel, deadline=init_deadline)
+        self.endpoints = {}
+        # configured cameras without endpoint because of port conflict, started on the next refresh
+        self.pending_cams = set()
+        # camera address -> params of translators being built in executor, dropped if the camera is altered meanwhile
+        self.opening = {}
+        self.loop = None
+
+    async def serve(self, fetch_cams, wait_change):
+        """
+        :param wait_change:
+            callable blocking until config may have changed, called in executor
+        """
+        self.loop = asyncio.get_running_loop()
+        self.cam_initializer.start()
+        cams = dict()
+        while True:
+            try:
+                cams = await self.loop.run_in_executor(None, fetch_cams)
+            except Exception as e:
+                logger.error('Error occurs during cams fetching. ' + str(e))
+
+            diff = self.cam_storage.set_cams(cams)
+
+            self.stop_altered_endpoints(diff)
+            self.start_new_endpoints(diff)
+            self.log_worker_stats()
+
+            await self.loop.run_in_executor(None, wait_change)
+
+    def get_translators(self):
+        """
+        Translators of served cameras, called from other threads
+        """
+        return [endpoint.translator for endpoint in list(self.endpoints.values())]
+
+    def log_worker_stats(self):
+        for onvif_cam_addr, endpoint in self.endpoints.items():
+            logger.debug(f'{onvif_cam_addr} queue depth {endpoint.translator.worker.queue_depth}, '
+                         f'stats {endpoint.translator.worker.stats.as_dict()}')
+
+    def stop_altered_endpoints(self, diff):
+        altered = list(diff.removed) + list(diff.changed)
+        self.cam_initializer.cancel(altered)
+        self.pending_cams.difference_update(diff.removed)
+        for onvif_cam_addr in altered:
+            self.opening.pop(onvif_cam_addr, None)
+            if onvif_cam_addr in self.endpoints:
+                endpoint = self.endpoints.pop(onvif_cam_addr)
+                logger.info(f'Stopping service {endpoint.translator.visca_port} -> {onvif_cam_addr}')
+                endpoint.close()
+
+    def start_new_endpoints(self, diff):
+        cams = self.cam_storage.get_all()
+        candidates = list(diff.added) + list(diff.changed) + sorted(self.pending_cams)
+        self.pending_cams.clear()
+        wanted = {}
+        used_ports = {endpoint.translator.visca_port for endpoint in self.endpoints.values()}
+        for onvif_cam_addr in candidates:
+            if onvif_cam_addr not in cams or onvif_cam_addr in self.endpoints or onvif_cam_addr in wanted:
+                continue
+            visca_port = cams[onvif_cam_addr]["visca_server_port"]
+            if visca_port in used_ports:
+                logger.error(f'Port "{visca_port}" is already used. '
+                             f'Please define another port in config for {onvif_cam_addr}')
+                self.pending_cams.add(onvif_cam_addr)
+                continue
+            used_ports.add(visca_port)
+            wanted[onvif_cam_addr] = get_cam_params(cams[onvif_cam_addr])
+        self.cam_initializer.request(wanted)
+
+    def on_cam_ready(self, onvif_cam_addr, params, cam, requested_at):
+        asyncio.run_coroutine_threadsafe(self.open_endpoint(onvif_cam_addr, params, cam, requested_at), self.loop)
+
+    async def open_endpoint(self, onvif_cam_addr, params, cam, requested_at):
+        visca_port = params["visca_server_port"]
+        used_ports = {endpoint.translator.visca_port for endpoint in self.endpoints.values()}
+        used_ports.update(opening["visca_server_port"] for opening in self.opening.values())
+        if onvif_cam_addr in self.endpoints or onvif_cam_addr in self.opening or visca_port in used_ports:
+            logger.error(f'Port "{visca_port}" is already used. '
+                         f'Please define another port in config for {onvif_cam_addr}')
+            self.pending_cams.add(onvif_cam_addr)
+            cam.close()
+            return
+        self.opening[onvif_cam_addr] = params
+        try:
+            # translator start binds the socket, resolves the host name and starts threads,
+            # so it is built in executor not to stall the other endpoints
+            translator = await self.loop.run_in_executor(None, partial(
+                Translator, visca_port, onvif_cam_addr, params["onvif_cam_login"], params["onvif_cam_password"],
+                self.cam_storage, self.command_queue_size, cam, requested_at))
+        except Exception as e:
+            logger.error('Check config params.' + str(e))
+            cam.close()
+            self.__end_opening(onvif_cam_addr, params)
+            return
+
+        try:
+            if self.opening.get(onvif_cam_addr) is not params:
+                logger.info(f'{onvif_cam_addr} was altered while its translator was started, it is closed')
+                close_translator(self.loop, translator)
+                return
+            transport, _ = await self.loop.create_datagram_endpoint(lambda: ViscaDatagramProtocol(translator),
+                                                                    sock=translator.visca_socket)
+        except Exception as e:
+            logger.error(f'Cannot serve visca port {visca_port} for {onvif_cam_addr}. {e}')
+            close_translator(self.loop, translator)
+            self.pending_cams.add(onvif_cam_addr)
+            return
+        finally:
+            self.__end_opening(onvif_cam_addr, params)
+        self.endpoints[onvif_cam_addr] = CamEndpoint(params, translator, transport)
+
+    def __end_opening(self, onvif_cam_addr, params):
+        if self.opening.get(onvif_cam_addr) is params:
+            del self.opening[onvif_cam_addr]
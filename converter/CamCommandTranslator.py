@@ -1,28 +1,83 @@
-from visca_tools.ViscaCommandClassificator import classify_visca_command
-from visca_tools.ViscaCommandFormer import form_visca_command
+from visca_tools.ViscaCommandDecoder import decode_visca_command
+from visca_tools.ViscaCommandFormer import form_syntax_error, form_pan_tilt_pos_inq_reply, \
+    form_zoom_pos_inq_reply, form_focus_pos_inq_reply
 from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+from CamCommandWorker import CamCommandWorker
+from PTZStatusPoller import create_status_poller, visca_zoom
+from PresetIndex import PresetIndex
+from PresetWriter import PresetWriter
+from UdpBatchIO import UdpBatchIO
+from Metrics import TranslatorStats
+from Tracing import get_default_tracer, current_trace, set_current_trace
+from PacketRecorder import RECEIVED, SENT, get_default_recorder, make_camera_id
 import socket
 from select import select
+from time import monotonic
 import logging
 
 logger = logging.getLogger(__name__)
 
+# continuous move sets the whole ptz velocity, so the latest one supersedes the waiting one
+DRIVE = 'drive'
+# waiting commands cancelled by stop, executing them after it would move the camera again
+MOTION_COMMANDS = ('move_continuous', 'goto_preset', 'go_home', 'stop')
+# seconds, onvif call in flight ends within the camera read timeout
+WORKER_STOP_TIMEOUT = 5
+
+
+class LoggedDatagrams:
+    """
+    Datagrams batch logged with one record, hex is formatted only when the record is written
+    """
+    __slots__ = ('datagrams', 'preposition')
+
+    def __init__(self, datagrams, preposition):
+        self.datagrams = datagrams
+        self.preposition = preposition
+
+    def __str__(self):
+        return ', '.join(f'{data.hex()} {self.preposition} {addr}' for data, addr in self.datagrams)
+
 
 class CamCommandTranslator:
     def __init__(self, visca_server_port, onvif_cam_addr, onvif_cam_login, onvif_cam_password,
-                 cam_storage, lock=None):
+                 cam_storage, command_queue_size=32, cam=None, started_at=None, recorder=None,
+                 tracer=None):
+        """
+        :param cam:
+            already initialized ONVIFCameraControl, if None then it is created
+        :param started_at:
+            monotonic time the camera bring-up started, used to report time to the first command
+        :param recorder:
+            PacketRecorder the datagrams are recorded to, if None then process wide default one is used if set
+        :param tracer:
+            Tracer timing datagrams handling stages, if None then process wide default one is used if set
+        """
         logger.info(f'Initializing service {socket.gethostbyname(socket.gethostname())}:'
                     f'{visca_server_port} -> {onvif_cam_addr}')
 
+        self.__started_at = monotonic() if started_at is None else started_at
+        self.__first_command_handled = False
         self.__onvif_cam_addr = onvif_cam_addr
         self.__visca_server_port = visca_server_port
         self.__visca_socket = self.__create_socket()
         self.__monitored_socket = [self.__visca_socket]
+        self.__batch_io = UdpBatchIO(self.__visca_socket)
+        self.__recorder = get_default_recorder() if recorder is None else recorder
+        self.__camera_id = make_camera_id(visca_server_port, onvif_cam_addr)
+        self.__stats = TranslatorStats()
+        self.__tracer = get_default_tracer() if tracer is None else tracer
         self.__cam_storage = cam_storage
+        self.__config_version = None
         self.__preset_ranges = {}
         self.__current_preset = {}
-        self.__cam = ONVIFCameraControl(onvif_cam_addr, onvif_cam_login, onvif_cam_password)
-        self.lock = lock
+        self.__cam = ONVIFCameraControl(onvif_cam_addr, onvif_cam_login, onvif_cam_password) if cam is None else cam
+        self.__worker = CamCommandWorker(onvif_cam_addr, command_queue_size, self.__tracer)
+        self.__worker.start()
+        self.__status_poller = create_status_poller(onvif_cam_addr, self.__cam.get_status)
+        self.__preset_index = PresetIndex(self.__status_poller)
+        self.__preset_writer = PresetWriter(onvif_cam_addr, self.__cam, self.__worker, self.__preset_index)
+        self.__preset_writer.load()
         self.__default_addr = 'default'
 
         logger.info(f'Initializing service {socket.gethostbyname(socket.gethostname())}:'
@@ -41,29 +96,105 @@ class CamCommandTranslator:
 
     def run_once(self):
         if self.__is_socket_ready():
-            message, client_addr = self.__receive_visca_message()
-
-            if self.lock is not None:
-                self.lock.acquire()
-
-            cams = self.__cam_storage.get_all()
-
-            if self.lock is not None:
-                self.lock.release()
-
-            self.__preset_ranges = cams[self.__onvif_cam_addr]["preset_client_range"]
-
-            visca_response = None
-            if self.__onvif_cam_addr in cams:
-                self.__update_current_preset_ranges()
-                client_ip = client_addr[0]
-                if client_ip not in self.__current_preset:
-                    client_ip = self.__default_addr
-                if client_ip in self.__current_preset:
-                    visca_response = self.__handle_byte_message(message, client_ip)
+            if self.__tracer is not None:
+                self.__run_once_traced()
+                return
+            replies = []
+            for message, client_addr in self.__receive_visca_messages():
+                try:
+                    visca_response = self.handle_datagram(message, client_addr)
+                except Exception as e:
+                    logger.exception(f'Cannot handle {message.hex()} from {client_addr}. {e}')
+                    continue
+
+                if visca_response is not None:
+                    replies.append((visca_response, client_addr))
+
+            if replies:
+                self.__send_to_visca_controllers(replies)
+
+    def __run_once_traced(self):
+        receive_started = monotonic()
+        datagrams = self.__receive_visca_messages()
+        received_at = monotonic()
+        replies = []
+        traces = []
+        for message, client_addr in datagrams:
+            trace = self.__tracer.start(self.__visca_server_port, receive_started)
+            trace.add_span('receive', receive_started, received_at)
+            traces.append(trace)
+            try:
+                visca_response = self.handle_traced_datagram(message, client_addr, trace)
+            except Exception as e:
+                logger.exception(f'Cannot handle {message.hex()} from {client_addr}. {e}')
+                continue
 
             if visca_response is not None:
-                self.__send_to_visca_controller(visca_response, client_addr)
+                replies.append((visca_response, client_addr))
+
+        send_started = sent_at = None
+        if replies:
+            send_started = monotonic()
+            self.__send_to_visca_controllers(replies)
+            sent_at = monotonic()
+        for trace in traces:
+            if trace.replied and sent_at is not None:
+                trace.add_span('send', send_started, sent_at)
+            self.__tracer.release(trace)
+
+    def handle_traced_datagram(self, message, client_addr, trace):
+        """
+        handle_datagram adding its stages to trace
+        """
+        set_current_trace(trace)
+        started = monotonic()
+        try:
+            visca_response = self.handle_datagram(message, client_addr)
+        except Exception:
+            trace.status = 'error'
+            raise
+        finally:
+            trace.add_span('handle', started, monotonic())
+            set_current_trace(None)
+        trace.replied = visca_response is not None
+        return visca_response
+
+    def handle_datagram(self, message, client_addr):
+        """
+        Translate one received visca datagram and return visca response bytes (or None if nothing to reply)
+        """
+        self.__stats.datagrams += 1
+        snapshot = self.__cam_storage.get_snapshot()
+        cam = snapshot.cams.get(self.__onvif_cam_addr)
+        if cam is None:
+            return None
+
+        if snapshot.version != self.__config_version:
+            self.__config_version = snapshot.version
+            self.__preset_ranges = cam["preset_client_range"]
+            self.__update_current_preset_ranges()
+
+        visca_response = None
+        client_ip = client_addr[0]
+        if client_ip not in self.__current_preset:
+            client_ip = self.__default_addr
+        if client_ip in self.__current_preset:
+            visca_response = self.__handle_byte_message(message, client_ip)
+
+        return visca_response
+
+    def close(self):
+        logger.debug(f'Close socket')
+        if self.__status_poller is not None:
+            self.__status_poller.stop()
+        self.__visca_socket.close()
+        # commands waiting for a camera which is not served anymore are dropped, the call in flight is waited for
+        self.__worker.stop(discard_waiting=True)
+        self.__worker.join(WORKER_STOP_TIMEOUT)
+        if self.__worker.is_alive():
+            logger.warning(f'Commands of {self.__onvif_cam_addr} are not finished in {WORKER_STOP_TIMEOUT} s, '
+                           f'closing the camera anyway')
+        self.__cam.close()
 
     def __update_current_preset_ranges(self):
         for client, preset_range in self.__preset_ranges.items():
@@ -75,7 +206,7 @@ class CamCommandTranslator:
         current_preset_copy = list(self.__current_preset.keys())
         for client_addr in current_preset_copy:
             if client_addr not in self.__preset_ranges:
-                self.__current_preset.pop(client)
+                self.__current_preset.pop(client_addr)
 
     def __is_preset_in_range(self, client_addr, preset_range):
         return preset_range['max'] >= self.__current_preset[client_addr] >= preset_range['min']
@@ -89,18 +220,30 @@ class CamCommandTranslator:
         ready_to_read_socket, _, _ = select(self.__monitored_socket, [], [], 0.01)
         return bool(ready_to_read_socket)
 
-    def __receive_visca_message(self):
-        data, client_addr = self.__visca_socket.recvfrom(16)
-        logger.debug(f'Received {data.hex()} from {client_addr}')
-        return data, client_addr
+    def __receive_visca_messages(self):
+        datagrams = self.__batch_io.receive()
+        if datagrams:
+            logger.debug('Received %s', LoggedDatagrams(datagrams, 'from'))
+            self.record_received(datagrams)
+        return datagrams
+
+    def __send_to_visca_controllers(self, datagrams):
+        logger.debug('Sending %s', LoggedDatagrams(datagrams, 'to'))
+        self.record_sent(datagrams)
+        self.__batch_io.send(datagrams)
+
+    def record_received(self, datagrams):
+        if self.__recorder is not None:
+            self.__recorder.record(RECEIVED, self.__camera_id, datagrams)
 
-    def __send_to_visca_controller(self, data, addr):
-        logger.debug(f'Sending {data.hex()} to {addr}')
-        self.__visca_socket.sendto(data, addr)
+    def record_sent(self, datagrams):
+        if self.__recorder is not None:
+            self.__recorder.record(SENT, self.__camera_id, datagrams)
 
     def __handle_byte_message(self, message, client_addr):
         COMMAND_HANDLER_DEFINER = {
             'unknown': self.__unknown_command_handler,
+            'CommandCancel': self.__CommandCancel_handler,
             'Pan-tiltPosInq': self.__Pan_tiltPosInq_handler,
             'CAM_ZoomPosInq': self.__CAM_ZoomPosInq_handler,
             'CAM_FocusPosInq': self.__CAM_FocusPosInq_handler,
@@ -109,100 +252,118 @@ class CamCommandTranslator:
             'Home': self.__Home_handler
         }
 
-        command = classify_visca_command(message)
+        command = decode_visca_command(message)
         command_name = command['command']
         command_handler = COMMAND_HANDLER_DEFINER[command_name]
+        self.__stats.on_command(command_name)
+        if self.__tracer is not None:
+            trace = current_trace()
+            if trace is not None:
+                trace.name = command_name
+        if not self.__first_command_handled:
+            self.__first_command_handled = True
+            logger.info(f'{self.__onvif_cam_addr}: first command {command_name} handled '
+                        f'{monotonic() - self.__started_at:.3f} s after camera bring-up start')
         return command_handler(command, client_addr)
 
     def __unknown_command_handler(self, command, client_addr):
-        logger.debug(f'Unknown command. Sending Syntax_Error to visca controller.')
+        logger.debug('Unknown command. Sending Syntax_Error to visca controller.')
         if 'x' in command:
             x = command['x']
             z = x + 8
         else:
             z = 1
-        visca_command_description = {
-            'Command': 'Syntax_Error',
-            'z': z
-        }
-        visca_responce = form_visca_command(visca_command_description)
-        return visca_responce
+        return form_syntax_error(z)
 
     def __Pan_tiltPosInq_handler(self, command, client_addr):
-        logger.debug(f'Handling Pan_tiltPosInq.')
+        logger.debug('Handling Pan_tiltPosInq.')
         x = command['x']
         y = x + 8
         self.__evaluate_current_preset(client_addr)
         current_preset = self.__current_preset[client_addr]
-        self.__cam.set_preset(current_preset)
-        visca_command_description = {
-            'Command': 'Pan-tiltPosInq',
-            'wwww': current_preset,
-            'zzzz': 0,
-            'y': y
-        }
-        visca_responce = form_visca_command(visca_command_description)
-        return visca_responce
+        # replied at once, SetPreset is written behind
+        self.__preset_writer.store(current_preset)
+        return form_pan_tilt_pos_inq_reply(y, current_preset)
 
     def __CAM_ZoomPosInq_handler(self, command, client_addr):
-        logger.debug(f'Handling CAM_ZoomPosInq.')
+        logger.debug('Handling CAM_ZoomPosInq.')
         x = command['x']
         y = x + 8
-        visca_command_description = {
-            'Command': 'CAM_ZoomPosInq',
-            'p': 0,
-            'q': 0,
-            'r': 0,
-            's': 0,
-            'y': y
-        }
-        visca_responce = form_visca_command(visca_command_description)
-        return visca_responce
+        if self.__status_poller is None:
+            return form_zoom_pos_inq_reply(y)
+        # answered from polled status interpolated along a goto in progress, the camera is not asked
+        position = self.__preset_index.position()
+        zoom = visca_zoom(None if position is None else position[2])
+        return form_zoom_pos_inq_reply(y, zoom >> 12 & 0x0F, zoom >> 8 & 0x0F, zoom >> 4 & 0x0F, zoom & 0x0F)
 
     def __CAM_FocusPosInq_handler(self, command, client_addr):
-        logger.debug(f'Handling CAM_FocusPosInq.')
+        logger.debug('Handling CAM_FocusPosInq.')
         x = command['x']
         y = x + 8
-        visca_command_description = {
-            'Command': 'CAM_FocusPosInq',
-            'p': 0,
-            'q': 0,
-            'r': 0,
-            's': 0,
-            'y': y
-        }
-        visca_responce = form_visca_command(visca_command_description)
-        return visca_responce
+        return form_focus_pos_inq_reply(y)
 
     def __Pan_tiltDrive_handler(self, command, client_addr):
         if command['function'] == 'AbsolutePosition':
-            logger.debug(f'Handling Pan_tiltDrive AbsolutePosition (as Onvif goto_preset).')
+            logger.debug('Handling Pan_tiltDrive AbsolutePosition (as Onvif goto_preset).')
             preset_num = int.from_bytes(command['YYYY'], 'big')
-            self.__cam.goto_preset(preset_num)
+            if self.__preset_index.is_at(preset_num, self.__worker.queue_depth):
+                logger.debug('Camera is at preset %s, goto is skipped', preset_num)
+                self.__stats.skipped_gotos += 1
+                return
+            seq = self.__on_motion_submitted()
+            self.__worker.submit('goto_preset', self.__goto_preset, preset_num, seq)
         elif command['function'] == 'Stop':
-            logger.debug(f'Handling Pan_tiltDrive Stop (as Onvif stop).')
-            self.__cam.stop()
+            logger.debug('Handling Pan_tiltDrive Stop (as Onvif stop).')
+            self.__submit_stop()
         else:
-            logger.debug(f'Handling Pan_tiltDrive (as Onvif move_continuous).')
+            logger.debug('Handling Pan_tiltDrive (as Onvif move_continuous).')
             pan_velocity, tilt_velocity = self.__get_pan_tilt_velocities_for_move_continuous(command)
             ptz_velocity_vector = (pan_velocity, tilt_velocity, 0)
-            self.__cam.move_continuous(ptz_velocity_vector)
+            self.__worker.submit('move_continuous', self.__cam.move_continuous, ptz_velocity_vector,
+                                 coalesce_key=DRIVE)
+            self.__on_motion_submitted()
 
     def __CAM_Zoom_handler(self, command, client_addr):
         if command['function'] == 'Stop':
-            logger.debug(f'Handling Zoom Stop (as Onvif stop).')
-            self.__cam.stop()
+            logger.debug('Handling Zoom Stop (as Onvif stop).')
+            self.__submit_stop()
         elif command['function'] == 'Tele' or command['function'] == 'Wide':
-            logger.debug(f'Handling Zoom (as Onvif move_continuous).')
+            logger.debug('Handling Zoom (as Onvif move_continuous).')
             zoom_velocity = command['p'] / 7
             if command['function'] == 'Wide':
                 zoom_velocity = -zoom_velocity
             ptz_velocity_vector = (0, 0, zoom_velocity)
-            self.__cam.move_continuous(ptz_velocity_vector)
+            self.__worker.submit('move_continuous', self.__cam.move_continuous, ptz_velocity_vector,
+                                 coalesce_key=DRIVE)
+            self.__on_motion_submitted()
+
+    def __CommandCancel_handler(self, command, client_addr):
+        logger.debug('Handling CommandCancel (as Onvif stop).')
+        self.__submit_stop()
+
+    def __submit_stop(self):
+        # stop goes ahead of waiting commands over a connection of its own
+        self.__worker.submit_priority('stop', self.__cam.stop_priority, preempts=MOTION_COMMANDS)
+        self.__on_motion_submitted()
+
+    def __on_motion_submitted(self):
+        """
+        :return: motion seq of the submitted command
+        """
+        if self.__status_poller is not None:
+            self.__status_poller.wake()
+        return self.__preset_index.on_motion()
+
+    def __goto_preset(self, preset_num, seq):
+        # travel time is estimated from the position the camera starts from
+        self.__preset_index.start_goto(preset_num, seq)
+        self.__cam.goto_preset(preset_num)
+        self.__preset_index.finish_goto(preset_num, seq)
 
     def __Home_handler(self, command, client_addr):
-        logger.debug(f'Handling Home (as Onvif go_home).')
-        self.__cam.go_home()
+        logger.debug('Handling Home (as Onvif go_home).')
+        self.__worker.submit('go_home', self.__cam.go_home)
+        self.__on_motion_submitted()
 
     def __get_pan_tilt_velocities_for_move_continuous(self, command):
         pan_velocity = command['VV'] / 0x18
@@ -230,3 +391,35 @@ class CamCommandTranslator:
     @property
     def visca_port(self):
         return self.__visca_server_port
+
+    @property
+    def onvif_cam_addr(self):
+        return self.__onvif_cam_addr
+
+    @property
+    def tracer(self):
+        return self.__tracer
+
+    @property
+    def stats(self):
+        return self.__stats
+
+    @property
+    def visca_socket(self):
+        return self.__visca_socket
+
+    @property
+    def worker(self):
+        return self.__worker
+
+    @property
+    def status_poller(self):
+        return self.__status_poller
+
+    @property
+    def preset_index(self):
+        return self.__preset_index
+
+    @property
+    def preset_writer(self):
+        return self.__preset_writer
@@ -0,0 +1,459 @@
+import logging
+from collections import deque
+from threading import Thread, Lock, Condition
+from time import monotonic, sleep
+
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControlError
+from Metrics import Histogram
+from Tracing import current_trace, set_current_trace
+
+logger = logging.getLogger(__name__)
+
+# seconds from submit to camera acknowledgement of a priority command
+DEFAULT_PRIORITY_SLO = 0.2
+DEFAULT_MAX_RESENDS = 2
+# seconds, multiplied by the attempt number
+RESEND_INTERVAL = 0.05
+
+
+_priority_defaults = {
+    'slo': DEFAULT_PRIORITY_SLO,
+    'max_resends': DEFAULT_MAX_RESENDS
+}
+
+
+def set_priority_defaults(slo=None, max_resends=None):
+    """
+    Set process wide defaults of priority commands of workers created afterwards
+    :param slo:
+        float seconds, priority commands acknowledged by camera later than that after submit are counted
+        as slo violations
+    :param max_resends:
+        int, how many times a priority command is re-sent if the camera did not acknowledge it
+    """
+    if slo is not None:
+        _priority_defaults['slo'] = slo
+    if max_resends is not None:
+        _priority_defaults['max_resends'] = max_resends
+
+
+class CamCommandWorker(Thread):
+    """
+    Executes onvif calls of one camera in arrival order on a dedicated thread,
+    so visca socket reading never waits for camera http responses.
+    Queue is bounded, command is dropped if the camera can not keep up.
+
+    Commands submitted with the same coalesce_key one after another are coalesced:
+    if the previous one is still waiting at the queue tail, it is replaced by the newer one.
+    Only the queue tail is replaced, so commands are never reordered.
+
+    Priority commands (stop) are executed by a thread of their own ahead of waiting commands,
+    waiting commands they preempt are cancelled. A watchdog re-sends priority command if the camera
+    did not acknowledge it or if a preempted command which was already in flight finished after it
+    """
+    def __init__(self, name, max_queue_size=32, tracer=None):
+        """
+        :param tracer:
+            Tracer continuing traces of the submitting thread with queue wait and onvif call stages
+        """
+        Thread.__init__(self, name=f'CamCommandWorker {name}', daemon=True)
+        self.max_queue_size = max_queue_size
+        self.tracer = tracer
+        self.slo = _priority_defaults['slo']
+        self.max_resends = _priority_defaults['max_resends']
+        self.stats = CamCommandWorkerStats()
+        self.__tail_lock = Lock()
+        self.__ready = Condition(self.__tail_lock)
+        self.__priority_ready = Condition(self.__tail_lock)
+        self.__commands = deque()
+        self.__priority_commands = deque()
+        self.__tail = None
+        self.__priority_tail = None
+        self.__submitted = 0
+        self.__last_submitted = {}
+        self.__last_priority = None
+        self.__priority_thread = Thread(target=self.__run_priority, name=f'{self.name} priority', daemon=True)
+
+    def start(self):
+        Thread.start(self)
+        self.__priority_thread.start()
+
+    def submit(self, command_name, func, *args, coalesce_key=None):
+        """
+        :return: False if command is dropped because of full queue
+        """
+        trace = current_trace() if self.tracer is not None else None
+        with self.__tail_lock:
+            seq = self.__on_submit(command_name)
+            tail = self.__tail
+            if coalesce_key is not None and tail is not None and not tail.started \
+                    and tail.coalesce_key == coalesce_key:
+                self.stats.on_coalesced(tail.command_name)
+                tail.command_name, tail.func, tail.args, tail.seq = command_name, func, args, seq
+                if trace is not None or tail.trace is not None:
+                    self.__replace_trace(tail, trace)
+                return True
+
+            if len(self.__commands) >= self.max_queue_size:
+                self.stats.on_dropped(command_name)
+                logger.warning(f'{self.name}: queue is full, {command_name} dropped')
+                if trace is not None:
+                    trace.status = 'dropped'
+                return False
+            self.__tail = CamCommand(command_name, func, args, coalesce_key, seq=seq)
+            if trace is not None:
+                self.__replace_trace(self.__tail, trace)
+            self.__commands.append(self.__tail)
+            self.__ready.notify()
+            queue_depth = len(self.__commands)
+        self.stats.on_submitted(queue_depth)
+        return True
+
+    def submit_priority(self, command_name, func, *args, preempts=()):
+        """
+        Execute command ahead of waiting ones. The same waiting priority command is coalesced
+
+        :param preempts:
+            names of commands cancelled if waiting, e.g. moves cancelled by stop
+        """
+        trace = current_trace() if self.tracer is not None else None
+        with self.__tail_lock:
+            seq = self.__on_submit(command_name)
+            self.__preempt(preempts)
+            tail = self.__priority_tail
+            if tail is not None and not tail.started and tail.command_name == command_name:
+                self.stats.on_coalesced(command_name)
+                tail.func, tail.args, tail.preempts, tail.seq = func, args, preempts, seq
+                if trace is not None or tail.trace is not None:
+                    self.__replace_trace(tail, trace)
+                return True
+
+            self.__priority_tail = CamCommand(command_name, func, args, preempts=preempts, seq=seq)
+            if trace is not None:
+                self.__replace_trace(self.__priority_tail, trace)
+            self.__priority_commands.append(self.__priority_tail)
+            self.__priority_ready.notify()
+            queue_depth = len(self.__commands) + len(self.__priority_commands)
+        self.stats.on_submitted(queue_depth)
+        return True
+
+    def stop(self, discard_waiting=False):
+        """
+        :param discard_waiting:
+            if True commands waiting in the queue are dropped, otherwise they are executed before the worker
+            stops. Waiting priority commands are executed anyway
+        """
+        with self.__tail_lock:
+            if discard_waiting:
+                self.__discard_waiting()
+            self.__commands.append(None)
+            self.__priority_commands.append(None)
+            self.__ready.notify()
+            self.__priority_ready.notify()
+
+    def join(self, timeout=None):
+        """
+        Wait for the worker and its priority thread to finish
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        Thread.join(self, timeout)
+        self.__priority_thread.join(None if deadline is None else max(0.0, deadline - monotonic()))
+
+    def run(self):
+        while True:
+            command = self.__next(self.__commands, self.__ready)
+            if command is None:
+                break
+            self.__execute(command)
+            self.__check_overtaken(command)
+
+    def __run_priority(self):
+        while True:
+            command = self.__next(self.__priority_commands, self.__priority_ready)
+            if command is None:
+                break
+            acknowledged = self.__execute(command)
+            for attempt in range(1, self.max_resends + 1):
+                if acknowledged:
+                    break
+                sleep(RESEND_INTERVAL * attempt)
+                if self.__is_superseded(command):
+                    break
+                self.stats.on_resent(command.command_name)
+                logger.warning(f'{self.name}: {command.command_name} is not acknowledged, re-sending '
+                               f'({attempt} of {self.max_resends})')
+                acknowledged = self.__execute(command)
+
+            latency = monotonic() - command.enqueued_at
+            self.stats.on_priority_finished(command.command_name, latency, latency > self.slo)
+            if acknowledged:
+                with self.__tail_lock:
+                    self.__last_priority = command
+            elif not self.__is_superseded(command):
+                logger.error(f'{self.name}: {command.command_name} is not acknowledged by camera')
+
+    def __next(self, commands, ready):
+        with self.__tail_lock:
+            while not commands:
+                ready.wait()
+            command = commands.popleft()
+            if command is not None:
+                command.started = True
+            return command
+
+    def __execute(self, command):
+        """
+        :return: True if camera acknowledged the command
+        """
+        with self.__tail_lock:
+            command_name, func, args, trace = command.command_name, command.func, command.args, command.trace
+            # re-sent command is not traced again
+            command.trace = None
+        started_at = monotonic()
+        self.stats.on_started(command_name, started_at - command.enqueued_at)
+        if trace is not None:
+            trace.add_span('queue', command.traced_at, started_at, worker=True)
+            set_current_trace(trace)
+        acknowledged = False
+        try:
+            func(*args)
+            acknowledged = True
+        except ONVIFCameraControlError as e:
+            self.stats.on_error(command_name, e)
+            logger.error(f'{self.name}: {command_name} failed. {e}')
+            if trace is not None:
+                trace.status = 'error'
+        except Exception as e:
+            self.stats.on_error(command_name, e)
+            logger.exception(f'{self.name}: {command_name} failed. {e}')
+            if trace is not None:
+                trace.status = 'error'
+        finally:
+            finished_at = monotonic()
+            self.stats.on_finished(command_name, finished_at - started_at)
+            if trace is not None:
+                trace.add_span(f'onvif {command_name}', started_at, finished_at, worker=True)
+                set_current_trace(None)
+                self.tracer.release(trace)
+        return acknowledged
+
+    def __check_overtaken(self, command):
+        """
+        Command submitted before the last priority command and finished after it was acknowledged
+        may be applied by the camera after it, e.g. a move in flight when stop overtook it.
+        Then the priority command is sent again
+        """
+        with self.__tail_lock:
+            if self.__last_priority is None:
+                return
+            priority = self.__last_priority
+            if command.command_name not in priority.preempts or command.seq > priority.seq:
+                return
+            self.__last_priority = None
+            if self.__is_superseded(priority, locked=True):
+                return
+            logger.info(f'{self.name}: {command.command_name} finished after {priority.command_name}, '
+                        f're-sending {priority.command_name}')
+            self.stats.on_resent(priority.command_name)
+            resend = CamCommand(priority.command_name, priority.func, priority.args,
+                                preempts=priority.preempts, seq=priority.seq)
+            self.__priority_commands.append(resend)
+            self.__priority_ready.notify()
+
+    def __is_superseded(self, command, locked=False):
+        """
+        Command preempting others is superseded if any of them was submitted after it,
+        e.g. stop must not be re-sent when the operator has moved the camera again
+        """
+        if not locked:
+            with self.__tail_lock:
+                return self.__is_superseded(command, locked=True)
+        return any(self.__last_submitted.get(name, 0) > command.seq for name in command.preempts)
+
+    def __on_submit(self, command_name):
+        self.__submitted += 1
+        self.__last_submitted[command_name] = self.__submitted
+        return self.__submitted
+
+    def __preempt(self, preempts):
+        if not preempts or not self.__commands:
+            return
+        kept = deque()
+        for command in self.__commands:
+            if command is not None and command.command_name in preempts:
+                self.stats.on_preempted(command.command_name)
+                if command.trace is not None:
+                    command.trace.status = 'preempted'
+                    self.tracer.release(command.trace)
+                    command.trace = None
+            else:
+                kept.append(command)
+        self.__commands = kept
+        if self.__tail is not None and self.__tail not in kept:
+            self.__tail = None
+
+    def __discard_waiting(self):
+        for command in self.__commands:
+            if command is not None:
+                self.stats.on_dropped(command.command_name)
+                if command.trace is not None:
+                    command.trace.status = 'dropped'
+                    self.tracer.release(command.trace)
+                    command.trace = None
+        if self.__commands:
+            logger.info(f'{self.name}: {len(self.__commands)} waiting commands dropped on stop')
+        self.__commands.clear()
+        self.__tail = None
+
+    def __replace_trace(self, command, trace):
+        """
+        Attach trace to waiting command, trace of the coalesced command is finished
+        """
+        previous = command.trace
+        command.trace, command.traced_at = trace, monotonic()
+        if trace is not None:
+            self.tracer.retain(trace)
+        if previous is not None:
+            previous.status = 'coalesced'
+            self.tracer.release(previous)
+
+    @property
+    def queue_depth(self):
+        return len(self.__commands) + len(self.__priority_commands)
+
+
+class CamCommand:
+    def __init__(self, command_name, func, args, coalesce_key=None, preempts=(), seq=0):
+        self.command_name = command_name
+        self.func = func
+        self.args = args
+        self.coalesce_key = coalesce_key
+        self.preempts = preempts
+        self.seq = seq
+        self.enqueued_at = monotonic()
+        self.started = False
+        self.trace = None
+        self.traced_at = None
+
+
+class CamCommandWorkerStats:
+    def __init__(self):
+        self.__lock = Lock()
+        self.submitted = 0
+        self.executed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.preempted = 0
+        self.resent = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.commands = {}
+        self.latency = {}
+        self.priority_latency = {}
+
+    def on_submitted(self, queue_depth):
+        with self.__lock:
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+    def on_dropped(self, command_name):
+        with self.__lock:
+            self.dropped += 1
+            self.__command(command_name)['dropped'] += 1
+
+    def on_coalesced(self, command_name):
+        with self.__lock:
+            self.coalesced += 1
+            self.__command(command_name)['coalesced'] += 1
+
+    def on_preempted(self, command_name):
+        with self.__lock:
+            self.preempted += 1
+            self.__command(command_name)['preempted'] += 1
+
+    def on_resent(self, command_name):
+        with self.__lock:
+            self.resent += 1
+            self.__command(command_name)['resends'] += 1
+
+    def on_priority_finished(self, command_name, latency, slo_violated):
+        """
+        :param latency:
+            float seconds from submit to camera acknowledgement or giving up
+        """
+        with self.__lock:
+            if command_name not in self.priority_latency:
+                self.priority_latency[command_name] = Histogram()
+            self.priority_latency[command_name].observe(latency)
+            if slo_violated:
+                self.__command(command_name)['slo_violations'] += 1
+
+    def on_started(self, command_name, wait_time):
+        with self.__lock:
+            self.executed += 1
+            command = self.__command(command_name)
+            command['executed'] += 1
+            command['wait_time_total'] += wait_time
+            command['wait_time_max'] = max(command['wait_time_max'], wait_time)
+
+    def on_error(self, command_name, error):
+        with self.__lock:
+            self.errors += 1
+            command = self.__command(command_name)
+            command['errors'] += 1
+            error_type = type(error).__name__
+            command['errors_by_type'][error_type] = command['errors_by_type'].get(error_type, 0) + 1
+
+    def on_finished(self, command_name, duration):
+        with self.__lock:
+            self.__latency(command_name).observe(duration)
+
+    def as_dict(self, with_latency=False):
+        """
+        :param with_latency:
+            add cumulative onvif call duration histogram 'latency' and 'latency_sum' to every command,
+            'priority_latency' and 'priority_latency_sum' to priority ones
+        """
+        with self.__lock:
+            commands = {name: dict(command, errors_by_type=dict(command['errors_by_type']))
+                        for name, command in self.commands.items()}
+            if with_latency:
+                for name, command in commands.items():
+                    latency = self.__latency(name)
+                    command['latency'] = latency.cumulative_counts()
+                    command['latency_sum'] = latency.sum
+                    if name in self.priority_latency:
+                        command['priority_latency'] = self.priority_latency[name].cumulative_counts()
+                        command['priority_latency_sum'] = self.priority_latency[name].sum
+            return {
+                'submitted': self.submitted,
+                'executed': self.executed,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'preempted': self.preempted,
+                'resent': self.resent,
+                'errors': self.errors,
+                'max_queue_depth': self.max_queue_depth,
+                'commands': commands
+            }
+
+    def __latency(self, command_name):
+        if command_name not in self.latency:
+            self.latency[command_name] = Histogram()
+        return self.latency[command_name]
+
+    def __command(self, command_name):
+        if command_name not in self.commands:
+            self.commands[command_name] = {
+                'executed': 0,
+                'dropped': 0,
+                'coalesced': 0,
+                'preempted': 0,
+                'resends': 0,
+                'slo_violations': 0,
+                'errors': 0,
+                'errors_by_type': {},
+                'wait_time_total': 0.0,
+                'wait_time_max': 0.0
+            }
+        return self.commands[command_name]
@@ -0,0 +1,202 @@
+import logging
+from concurrent.futures import Future
+from threading import Thread, Condition, Lock
+from time import monotonic
+
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+
+logger = logging.getLogger(__name__)
+
+
+class CamInitAttempt:
+    def __init__(self, addr, params, number):
+        self.addr = addr
+        self.params = params
+        self.number = number
+        self.started_at = monotonic()
+        self.future = Future()
+
+
+class CamInitializer(Thread):
+    """
+    Brings cameras up concurrently, so one unreachable camera does not block the others.
+    At most max_parallel cameras are initialized at a time, initialization taking longer than
+    deadline is abandoned, its thread still counts toward max_parallel until it returns.
+    Failed cameras are retried with exponential backoff while they are still requested
+    """
+    def __init__(self, on_ready, create_cam=None, max_parallel=8, deadline=20, backoff_min=5, backoff_max=300):
+        """
+        :param on_ready:
+            callable(addr, params, cam, requested_at) called in initializer thread for every ready camera,
+            without holding the initializer lock, cancel waits for the running call to return
+        :param create_cam:
+            callable(addr, params) returning initialized camera, called in separate thread,
+            if None then ONVIFCameraControl is created
+        """
+        Thread.__init__(self, name='CamInitializer', daemon=True)
+        self.create_cam = create_onvif_cam if create_cam is None else create_cam
+        self.on_ready = on_ready
+        self.max_parallel = max_parallel
+        self.deadline = deadline
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.__condition = Condition()
+        # held while on_ready runs, cancel waits for it
+        self.__ready_lock = Lock()
+        self.__requested = {}
+        self.__requested_at = {}
+        self.__running = {}
+        # attempts past the deadline whose threads still run
+        self.__abandoned = []
+        self.__retry = {}
+        # {addr: (attempt, requested_at)} of ready cameras on_ready is not called for yet
+        self.__ready = {}
+        # ready cameras not requested anymore, closed in initializer thread
+        self.__unwanted = []
+
+    def request(self, wanted):
+        """
+        :param wanted:
+            dict {addr: params} of cameras to bring up, already requested camera is restarted
+            if its params differ, cameras not in dict are left as they are
+        """
+        with self.__condition:
+            for addr, params in wanted.items():
+                if addr in self.__ready and self.__ready[addr][0].params == params:
+                    continue
+                if self.__requested.get(addr) != params:
+                    self.__requested[addr] = params
+                    self.__requested_at[addr] = monotonic()
+                    self.__retry.pop(addr, None)
+                    self.__drop_ready(addr)
+            self.__condition.notify()
+
+    def cancel(self, addrs):
+        """
+        :param addrs:
+            cameras not to initialize anymore, camera being initialized is closed when ready
+        """
+        with self.__condition:
+            for addr in addrs:
+                self.__requested.pop(addr, None)
+                self.__requested_at.pop(addr, None)
+                self.__retry.pop(addr, None)
+                self.__drop_ready(addr)
+            self.__condition.notify()
+        # camera on_ready is running for is started when cancel returns
+        with self.__ready_lock:
+            pass
+
+    def run(self):
+        while True:
+            with self.__condition:
+                self.__collect_finished()
+                self.__abandon_expired()
+                self.__launch()
+                if not self.__unwanted and not self.__ready:
+                    self.__condition.wait(timeout=self.__next_event_timeout())
+                unwanted, self.__unwanted = self.__unwanted, []
+            # closing cameras and on_ready may take long, request, cancel and initialization threads
+            # are not blocked by them
+            for cam in unwanted:
+                _close_cam(cam)
+            self.__start_ready()
+
+    def __collect_finished(self):
+        self.__abandoned = [attempt for attempt in self.__abandoned if not attempt.future.done()]
+        for addr, attempt in list(self.__running.items()):
+            if not attempt.future.done():
+                continue
+            self.__running.pop(addr)
+            error = attempt.future.exception()
+            if error is not None:
+                self.__schedule_retry(attempt, error)
+            elif self.__requested.get(addr) != attempt.params:
+                logger.info(f'Camera {addr} is ready but is not requested anymore')
+                self.__unwanted.append(attempt.future.result())
+            else:
+                requested_at = self.__requested_at.pop(addr)
+                self.__requested.pop(addr)
+                self.__retry.pop(addr, None)
+                self.__ready[addr] = (attempt, requested_at)
+                logger.info(f'Camera {addr} is ready in {monotonic() - attempt.started_at:.3f} s, '
+                            f'{monotonic() - requested_at:.3f} s after request (attempt {attempt.number})')
+
+    def __drop_ready(self, addr):
+        ready = self.__ready.pop(addr, None)
+        if ready is not None:
+            logger.info(f'Camera {addr} is ready but is not requested anymore')
+            self.__unwanted.append(ready[0].future.result())
+
+    def __start_ready(self):
+        while True:
+            with self.__ready_lock:
+                with self.__condition:
+                    if not self.__ready:
+                        return
+                    addr = next(iter(self.__ready))
+                    attempt, requested_at = self.__ready.pop(addr)
+                try:
+                    self.on_ready(addr, attempt.params, attempt.future.result(), requested_at)
+                except Exception as e:
+                    logger.exception(f'Cannot start camera {addr}. {e}')
+
+    def __abandon_expired(self):
+        for addr, attempt in list(self.__running.items()):
+            if monotonic() - attempt.started_at > self.deadline:
+                self.__running.pop(addr)
+                self.__abandoned.append(attempt)
+                attempt.future.add_done_callback(_close_abandoned)
+                self.__schedule_retry(attempt, f'Initialization took longer than {self.deadline} s')
+
+    def __launch(self):
+        for addr, params in self.__requested.items():
+            if len(self.__running) + len(self.__abandoned) >= self.max_parallel:
+                break
+            if addr in self.__running:
+                continue
+            number, retry_at = self.__retry.get(addr, (0, 0))
+            if retry_at > monotonic():
+                continue
+            attempt = CamInitAttempt(addr, params, number + 1)
+            self.__running[addr] = attempt
+            Thread(target=self.__init_cam, args=(attempt,), name=f'CamInit {addr}', daemon=True).start()
+
+    def __init_cam(self, attempt):
+        try:
+            attempt.future.set_result(self.create_cam(attempt.addr, attempt.params))
+        except Exception as e:
+            attempt.future.set_exception(e)
+        with self.__condition:
+            self.__condition.notify()
+
+    def __schedule_retry(self, attempt, error):
+        if self.__requested.get(attempt.addr) != attempt.params:
+            return
+        backoff = min(self.backoff_max, self.backoff_min * 2 ** (attempt.number - 1))
+        self.__retry[attempt.addr] = (attempt.number, monotonic() + backoff)
+        logger.error(f'Cannot initialize camera {attempt.addr} (attempt {attempt.number}), '
+                     f'retry in {backoff} s. Check config params. {error}')
+
+    def __next_event_timeout(self):
+        now = monotonic()
+        events = [attempt.started_at + self.deadline for attempt in self.__running.values()]
+        events += [retry_at for addr, (_, retry_at) in self.__retry.items() if addr in self.__requested]
+        if not events:
+            return None
+        return max(0.0, min(events) - now)
+
+
+def create_onvif_cam(addr, params):
+    return ONVIFCameraControl(addr, params['onvif_cam_login'], params['onvif_cam_password'])
+
+
+def _close_cam(cam):
+    close = getattr(cam, 'close', None)
+    if close is not None:
+        close()
+
+
+def _close_abandoned(future):
+    if future.exception() is None:
+        _close_cam(future.result())
@@ -0,0 +1,109 @@
+import logging
+from threading import Lock
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+
+class CamsSnapshot:
+    """
+    Immutable version of cameras config. Readers keep a reference to it without copying or locking,
+    cams is read-only mapping {addr: cam} with read-only nested dicts
+    """
+    __slots__ = ('version', 'cams')
+
+    def __init__(self, version, cams):
+        self.version = version
+        self.cams = cams
+
+
+class CamsDiff:
+    """
+    Difference between two config versions, every field is {addr: cam} of the newer version
+    (of the older one for removed)
+    """
+    def __init__(self, version, added, removed, changed, preset_ranges_changed):
+        """
+        :param changed:
+            cameras whose params requiring reinitialization changed, see get_cam_params
+        :param preset_ranges_changed:
+            cameras whose preset client ranges changed, such cameras are not restarted
+        """
+        self.version = version
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.preset_ranges_changed = preset_ranges_changed
+
+    def is_empty(self):
+        return not (self.added or self.removed or self.changed or self.preset_ranges_changed)
+
+    def __repr__(self):
+        return (f'CamsDiff(version={self.version}, added={list(self.added)}, removed={list(self.removed)}, '
+                f'changed={list(self.changed)}, preset_ranges_changed={list(self.preset_ranges_changed)})')
+
+
+class CamStorage:
+    """
+    Publishes versioned cameras config. set_cams is called by config refresh,
+    get_all and get_snapshot are called for every datagram, so they only return the current reference
+    """
+    def __init__(self, cams={}):
+        self.__write_lock = Lock()
+        self.__snapshot = CamsSnapshot(0, _freeze(cams))
+
+    def get_all(self):
+        return self.__snapshot.cams
+
+    def get_snapshot(self):
+        return self.__snapshot
+
+    def set_cams(self, cams):
+        """
+        Publish new config version, unchanged config is not published
+        :return: CamsDiff against the previous version
+        """
+        with self.__write_lock:
+            previous = self.__snapshot
+            snapshot = CamsSnapshot(previous.version + 1, _freeze(cams))
+            diff = diff_cams(previous.cams, snapshot.cams, snapshot.version)
+            if diff.is_empty():
+                diff.version = previous.version
+                return diff
+            self.__snapshot = snapshot
+        logger.info(f'Config version {snapshot.version}: {diff}')
+        return diff
+
+
+def diff_cams(old, new, version=None):
+    added = {addr: cam for addr, cam in new.items() if addr not in old}
+    removed = {addr: cam for addr, cam in old.items() if addr not in new}
+    changed = {}
+    preset_ranges_changed = {}
+    for addr, cam in new.items():
+        if addr not in old:
+            continue
+        if get_cam_params(old[addr]) != get_cam_params(cam):
+            changed[addr] = cam
+        if old[addr]['preset_client_range'] != cam['preset_client_range']:
+            preset_ranges_changed[addr] = cam
+    return CamsDiff(version, added, removed, changed, preset_ranges_changed)
+
+
+def get_cam_params(cam):
+    """
+    Camera config params which require camera reinitialization when changed
+    """
+    return {
+        'visca_server_port': cam['visca_server_port'],
+        'onvif_cam_login': cam['onvif_cam_login'],
+        'onvif_cam_password': cam['onvif_cam_password']
+    }
+
+
+def _freeze(value):
+    if isinstance(value, (dict, MappingProxyType)):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
@@ -1,50 +1,162 @@
 import json
 from json import JSONDecodeError
 import logging
+import os
+import tempfile
+from time import monotonic
 
 import gspread
+from gspread.exceptions import APIError
 from oauth2client.service_account import ServiceAccountCredentials
 
+from ConfigWatcher import content_hash
+
 logger = logging.getLogger(__name__)
 
 
 class GoogleSheetsCamsParser:
-    def __init__(self, json_keyfile, spreadsheet_name):
-        scope = ["https://spreadsheets.google.com/feeds", 'https://www.googleapis.com/auth/spreadsheets',
-                 "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
-        creds = ServiceAccountCredentials.from_json_keyfile_name(json_keyfile, scope)
-        client = gspread.authorize(creds)
-        self.spreadsheet = client.open(spreadsheet_name)
+    """
+    Reads all camera worksheets with a single spreadsheet request. Spreadsheet revision is checked first,
+    so unchanged spreadsheet costs one drive metadata request per refresh. On quota errors requests are
+    paused with growing interval, previously read cams are returned meanwhile
+    """
+    SHEETS_FIELDS = 'sheets(properties(title,index),data(rowData(values(formattedValue))))'
+
+    def __init__(self, json_keyfile, spreadsheet_name, client=None, backoff_min=60, backoff_max=960):
+        """
+        Google api is connected on the first read, so converter starts while it is unreachable
+        :param client:
+            authorized gspread client, if None then it is authorized with json_keyfile
+        """
+        self.creds = None
+        if client is None:
+            scope = ["https://spreadsheets.google.com/feeds", 'https://www.googleapis.com/auth/spreadsheets',
+                     "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
+            self.creds = ServiceAccountCredentials.from_json_keyfile_name(json_keyfile, scope)
+        self.client = client
+        self.spreadsheet_name = spreadsheet_name
+        self.spreadsheet = None
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.__backoff = 0
+        self.__backoff_until = 0
+        self.__revision = None
+        self.__content_hash = None
+        self.__cams = None
 
     def read_config(self):
-        i = 0
-        cams = {}
-        while True:
-            worksheet = self.spreadsheet.get_worksheet(i)
-            try:
-                data = worksheet.get_all_values()
-            except AttributeError:
-                break
-            if not data:
-                continue
-            ip = data[1][0]
-            port = int(data[1][1])
-            addr = (ip, port)
-            cam = {
-                "onvif_cam_login": data[1][2],
-                "onvif_cam_password": data[1][3],
-                "visca_server_port": int(data[1][4]),
-                "preset_client_range": {}
-            }
-            preset_range = cam["preset_client_range"]
-            for line in data[4:]:
-                preset_range[line[0]] = {}
-                prange = preset_range[line[0]]
-                prange['min'] = int(line[1])
-                prange['max'] = int(line[2])
-            cams[addr] = cam
-            i += 1
-        return cams
+        if monotonic() < self.__backoff_until:
+            return self.__cached_cams()
+
+        try:
+            if self.spreadsheet is None:
+                self.__connect()
+            revision = self.__get_revision()
+            if revision is None or revision != self.__revision:
+                sheets = self.__read_sheets()
+        except APIError as e:
+            if not is_quota_error(e):
+                raise
+            self.__back_off(e)
+            return self.__cached_cams()
+        self.__backoff = 0
+
+        if revision is not None and revision == self.__revision:
+            return self.__cams
+
+        # unchanged values with new revision (e.g. formatting change) are not parsed again
+        sheets_hash = content_hash(sheets)
+        if sheets_hash != self.__content_hash:
+            self.__cams = parse_sheets(sheets)
+            self.__content_hash = sheets_hash
+        self.__revision = revision
+        return self.__cams
+
+    def __connect(self):
+        if self.client is None:
+            self.client = gspread.authorize(self.creds)
+        self.spreadsheet = self.client.open(self.spreadsheet_name)
+
+    def __cached_cams(self):
+        if self.__cams is None:
+            raise ValueError(f'Google api quota is exceeded, next request in '
+                             f'{self.__backoff_until - monotonic():.0f} s')
+        return self.__cams
+
+    def __get_revision(self):
+        get_last_update_time = getattr(self.spreadsheet, 'get_lastUpdateTime', None)
+        if get_last_update_time is None:
+            return None
+        return get_last_update_time()
+
+    def __read_sheets(self):
+        metadata = self.spreadsheet.fetch_sheet_metadata(params={'includeGridData': 'true',
+                                                                 'fields': self.SHEETS_FIELDS})
+        sheets = sorted(metadata.get('sheets', []), key=lambda sheet: sheet['properties'].get('index', 0))
+        return [_sheet_values(sheet) for sheet in sheets]
+
+    def __back_off(self, error):
+        self.__backoff = min(self.backoff_max, max(self.backoff_min, self.__backoff * 2))
+        retry_after = _retry_after(error)
+        delay = self.__backoff if retry_after is None else max(self.__backoff, retry_after)
+        self.__backoff_until = monotonic() + delay
+        logger.warning(f'Google api quota is exceeded, next request in {delay:.0f} s. {error}')
+
+
+def parse_sheets(sheets):
+    """
+    :param sheets:
+        list of worksheets values, every worksheet is list of rows of strings
+    """
+    cams = {}
+    for data in sheets:
+        if not data:
+            continue
+        ip = data[1][0]
+        port = int(data[1][1])
+        addr = (ip, port)
+        cam = {
+            "onvif_cam_login": data[1][2],
+            "onvif_cam_password": data[1][3],
+            "visca_server_port": int(data[1][4]),
+            "preset_client_range": {}
+        }
+        preset_range = cam["preset_client_range"]
+        for line in data[4:]:
+            preset_range[line[0]] = {}
+            prange = preset_range[line[0]]
+            prange['min'] = int(line[1])
+            prange['max'] = int(line[2])
+        cams[addr] = cam
+    return cams
+
+
+def is_quota_error(error):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return False
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and 'rateLimitExceeded' in response.text
+
+
+def _retry_after(error):
+    try:
+        return float(error.response.headers['Retry-After'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _sheet_values(sheet):
+    # the same rows get_all_values returns: trailing empty rows dropped, rows padded to equal length
+    rows = []
+    for grid in sheet.get('data', []):
+        for row in grid.get('rowData', []):
+            rows.append([cell.get('formattedValue', '') for cell in row.get('values', [])])
+    while rows and not any(rows[-1]):
+        rows.pop()
+    width = max((len(row) for row in rows), default=0)
+    return [row + [''] * (width - len(row)) for row in rows]
 
 
 def read_config(conf_path):
@@ -52,8 +164,7 @@ def read_config(conf_path):
         with open(conf_path) as config:
             data = json.load(config)
     except JSONDecodeError as e:
-        logger.error(f'Wrong config format. Check json syntax.' + str(e))
-        data = {"cams": {}}
+        raise ValueError(f'Wrong config format. Check json syntax. {e}')
 
     cams = {}
 
@@ -66,7 +177,84 @@ def read_config(conf_path):
             cams[cam_addr]["onvif_cam_login"] = cam["cam_login"]
             cams[cam_addr]["onvif_cam_password"] = cam["cam_password"]
     except KeyError as e:
-        cams = {}
-        logger.error(f'Wrong config format.' + str(e))
+        raise ValueError(f'Wrong config format. No {e} field')
 
     return cams
+
+
+class LocalConfigCache:
+    """
+    Keeps the last successfully read cameras config in local json file of config file format.
+    On start cameras are served from it right away, config source is read right after that,
+    so converter starts and works while config source is unreachable
+    """
+    def __init__(self, path, fetch_cams, wait_change):
+        """
+        :param fetch_cams:
+            callable returning cams from config source
+        :param wait_change:
+            callable blocking until config source may have changed
+        """
+        self.path = path
+        self.fetch_cams = fetch_cams
+        self.wait_change = wait_change
+        self.__loaded = False
+        self.__refresh_now = False
+        self.__saved = None
+
+    def fetch(self):
+        if not self.__loaded:
+            self.__loaded = True
+            cams = self.__load()
+            if cams is not None:
+                self.__refresh_now = True
+                return cams
+
+        cams = self.fetch_cams()
+        if cams != self.__saved:
+            self.__save(cams)
+        return cams
+
+    def wait(self):
+        if self.__refresh_now:
+            self.__refresh_now = False
+            return
+        self.wait_change()
+
+    def __load(self):
+        try:
+            cams = read_config(self.path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f'Cannot load local config cache {self.path}. {e}')
+            return None
+        logger.info(f'{len(cams)} cams are loaded from local config cache {self.path}')
+        self.__saved = cams
+        return cams
+
+    def __save(self, cams):
+        data = {"cams": [{
+            "cam_ip": addr[0],
+            "cam_port": addr[1],
+            "cam_login": cam["onvif_cam_login"],
+            "cam_password": cam["onvif_cam_password"],
+            "visca_server_port": cam["visca_server_port"],
+            "preset_client_range": cam["preset_client_range"]
+        } for addr, cam in cams.items()]}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = None
+        try:
+            # written next to the cache and renamed, so the cache is never partially written
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cams_cache')
+            with os.fdopen(fd, 'w') as tmp:
+                json.dump(data, tmp, separators=(',', ':'))
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f'Cannot write local config cache {self.path}. {e}')
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        self.__saved = cams
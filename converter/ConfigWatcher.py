@@ -0,0 +1,140 @@
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import os
+import struct
+import sys
+from select import select
+from time import monotonic, sleep
+
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# partially written file is not reported, editors saving through rename are
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+_EVENT = struct.Struct('iIII')
+
+
+def _load_inotify_functions():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        inotify_init1, inotify_add_watch = libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    inotify_init1.argtypes = [ctypes.c_int]
+    inotify_init1.restype = ctypes.c_int
+    inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    inotify_add_watch.restype = ctypes.c_int
+    return inotify_init1, inotify_add_watch
+
+
+_inotify_functions = _load_inotify_functions()
+
+
+class FileConfigWatcher:
+    """
+    Waits for config file changes. Directory of the file is watched with inotify on Linux,
+    so replacing the file by rename is noticed too, elsewhere file stat is polled
+    """
+    def __init__(self, path, poll_interval=1.0, settle_time=0.02):
+        """
+        :param settle_time:
+            float seconds, changes following each other closer than that are reported once
+        """
+        self.path = os.path.abspath(path)
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.__fd = self.__init_inotify()
+        self.__stat = self.__get_stat()
+        if self.__fd is None:
+            logger.info(f'Polling {self.path} for changes every {poll_interval} s')
+
+    def wait(self, timeout=None):
+        """
+        Block until config file changes or timeout expires
+        :return: True if file changed
+        """
+        if self.__fd is None:
+            return self.__poll(timeout)
+        if not self.__wait_inotify(timeout):
+            return False
+        while self.__wait_inotify(self.settle_time):
+            pass
+        return True
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+    def __init_inotify(self):
+        if _inotify_functions is None:
+            return None
+        inotify_init1, inotify_add_watch = _inotify_functions
+        fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            logger.warning(f'Cannot init inotify. {os.strerror(ctypes.get_errno())}')
+            return None
+        if inotify_add_watch(fd, os.path.dirname(self.path).encode(), WATCH_MASK) < 0:
+            logger.warning(f'Cannot watch {self.path}. {os.strerror(ctypes.get_errno())}')
+            os.close(fd)
+            return None
+        return fd
+
+    def __wait_inotify(self, timeout):
+        deadline = None if timeout is None else monotonic() + timeout
+        name = os.path.basename(self.path).encode()
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - monotonic())
+            ready, _, _ = select([self.__fd], [], [], remaining)
+            if not ready:
+                return False
+            try:
+                data = os.read(self.__fd, 4096)
+            except BlockingIOError:
+                continue
+            if name in self.__event_names(data):
+                return True
+
+    @staticmethod
+    def __event_names(data):
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            names.append(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+        return names
+
+    def __poll(self, timeout):
+        deadline = None if timeout is None else monotonic() + timeout
+        while deadline is None or monotonic() < deadline:
+            sleep(self.poll_interval if deadline is None else min(self.poll_interval, max(0.0, deadline - monotonic())))
+            stat = self.__get_stat()
+            if stat != self.__stat:
+                self.__stat = stat
+                return True
+        return False
+
+    def __get_stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def content_hash(data):
+    """
+    Hash of config content fetched from remote source, equal hashes mean unchanged config
+    """
+    return hashlib.sha1(repr(data).encode()).hexdigest()
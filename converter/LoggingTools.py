@@ -1,21 +1,43 @@
+import atexit
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import queue
+from logging.handlers import TimedRotatingFileHandler, QueueHandler
 from pathlib import Path
+from threading import Thread
+from time import sleep
 
+_log_listener = None
 
-def init_logger(logdir='./logs', debug=False):
+
+def init_logger(logdir='./logs', debug=False, use_queue=True):
+    """
+    :param use_queue:
+        if True records are put to in-process queue and formatted and written by a single writer thread,
+        otherwise they are written by the thread which logs them
+    """
+    global _log_listener
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
+    # without debug the level of the root logger makes debug calls return before creating a record
+    logger.setLevel(logging.DEBUG if debug else logging.INFO)
 
-    for handler in logger.handlers:
+    for handler in list(logger.handlers):
         logger.removeHandler(handler)
+        handler.close()
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
 
     logdir = Path(logdir)
     logdir.mkdir(exist_ok=True)
     logfile = logdir / 'index.html'
 
-    file_handler = TimedRotatingFileHandler(filename=str(logfile), when='D', interval=1, backupCount=14, delay=False)
-    console_handler = logging.StreamHandler()
+    file_handler_class, console_handler_class = TimedRotatingFileHandler, logging.StreamHandler
+    if use_queue:
+        file_handler_class, console_handler_class = BatchTimedRotatingFileHandler, BatchStreamHandler
+    file_handler = file_handler_class(filename=str(logfile), when='D', interval=1, backupCount=14, delay=False)
+    console_handler = console_handler_class()
 
     file_log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     console_log_format = '%(asctime)s - %(message)s'
@@ -28,8 +50,148 @@ def init_logger(logdir='./logs', debug=False):
         file_handler.setLevel(logging.INFO)
         console_handler.setLevel(logging.INFO)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    if use_queue:
+        # log formats use none of thread and process attributes, records created by the serving threads
+        # skip collecting them
+        logging.logThreads = False
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+        log_queue = queue.SimpleQueue()
+        _log_listener = BatchQueueListener(log_queue, file_handler, console_handler)
+        _log_listener.start()
+        logger.addHandler(LocalQueueHandler(log_queue))
+    else:
+        logger.addHandler(file_handler)
+        logger.addHandler(console_handler)
+
+
+def stop_log_listener():
+    """
+    Write records left in the queue, called at exit
+    """
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+atexit.register(stop_log_listener)
+
+
+def init_worker_logger(log_queue, debug=False):
+    """
+    Send records of worker process to log_queue, they are written by the supervisor log listener
+    """
+    global _log_listener
+    # writer thread of the supervisor is not copied to the forked worker
+    _log_listener = None
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG if debug else logging.INFO)
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    logger.addHandler(QueueHandler(log_queue))
+
+
+def start_log_listener(log_queue):
+    """
+    Write records of worker processes from log_queue with handlers of the root logger
+    """
+    listener = BatchQueueListener(log_queue, *logging.getLogger().handlers)
+    listener.start()
+    return listener
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    Puts records to in-process queue as they are, so message and html are formatted by the writer thread.
+    Logged arguments must not be changed after the logging call
+    """
+    def prepare(self, record):
+        return record
+
+
+class BatchQueueListener:
+    """
+    Single log writer thread. Handles all records queued at the moment and flushes handlers once per batch
+    """
+    def __init__(self, log_queue, *handlers, max_batch=1024, flush_interval=0.05, yield_every=4):
+        """
+        :param log_queue:
+            queue.SimpleQueue or multiprocessing queue of records, None put to it stops the writer
+        :param flush_interval:
+            float seconds the writer sleeps after a batch, records are written with up to this delay
+        :param yield_every:
+            amount of records after which the writer lets other threads run
+        """
+        self.queue = log_queue
+        self.handlers = handlers
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.yield_every = yield_every
+        self.__thread = None
+
+    def start(self):
+        self.__thread = Thread(target=self.__run, name='BatchQueueListener', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Write records queued before the call and stop the writer thread
+        """
+        if self.__thread is None:
+            return
+        self.queue.put(None)
+        self.__thread.join()
+        self.__thread = None
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def __run(self):
+        stopped = False
+        while not stopped:
+            records = [self.queue.get()]
+            while len(records) < self.max_batch:
+                try:
+                    records.append(self.queue.get(block=False))
+                except queue.Empty:
+                    break
+            for i, record in enumerate(records, 1):
+                if record is None:
+                    stopped = True
+                else:
+                    self.handle(record)
+                if i % self.yield_every == 0:
+                    # gives the gil back to the serving threads instead of holding it for the switch interval
+                    sleep(0)
+            for handler in self.handlers:
+                getattr(handler, 'flush_batch', handler.flush)()
+            if not stopped:
+                # records logged meanwhile are taken as the next batch, serving threads do not wake the writer
+                sleep(self.flush_interval)
+
+
+class BatchFlushMixin:
+    """
+    Stream handler which is not flushed after every record, BatchQueueListener flushes it after a batch
+    """
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class BatchTimedRotatingFileHandler(BatchFlushMixin, TimedRotatingFileHandler):
+    pass
+
+
+class BatchStreamHandler(BatchFlushMixin, logging.StreamHandler):
+    pass
 
 
 class ColoredHtmlFormatter(logging.Formatter):
@@ -0,0 +1,223 @@
+import logging
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+# seconds, onvif calls of cheap cameras take from a few milliseconds to the http read timeout
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """
+    Fixed buckets histogram. observe is not locked, every histogram has a single writer thread,
+    readers may see a sum which is a bit ahead or behind the counts
+    """
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        """
+        :return: list of (upper bound, amount of values not greater than it), the last bound is '+Inf'
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + ('+Inf',), list(self.counts)):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class TranslatorStats:
+    """
+    Counters of one camera visca port, updated by the thread serving the port only
+    """
+    __slots__ = ('datagrams', 'commands', 'skipped_gotos')
+
+    def __init__(self):
+        self.datagrams = 0
+        self.commands = {}
+        self.skipped_gotos = 0
+
+    def on_command(self, command_name):
+        self.commands[command_name] = self.commands.get(command_name, 0) + 1
+
+
+class MetricsServer:
+    """
+    Serves metrics of cameras in Prometheus text format on GET /metrics from a daemon thread
+    """
+    def __init__(self, port, get_translators, host='0.0.0.0'):
+        """
+        :param get_translators:
+            callable returning CamCommandTranslator list of currently served cameras
+        """
+        self.get_translators = get_translators
+        self.__server = ThreadingHTTPServer((host, port), self.__handler_class())
+        self.__server.daemon_threads = True
+        self.__thread = Thread(target=self.__server.serve_forever, name='MetricsServer', daemon=True)
+
+    @property
+    def port(self):
+        return self.__server.server_address[1]
+
+    def start(self):
+        self.__thread.start()
+        logger.info(f'Metrics are served on http://{self.__server.server_address[0]}:{self.port}/metrics')
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __handler_class(self):
+        metrics_server = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = render_metrics(metrics_server.get_translators()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
+
+
+def render_metrics(translators):
+    lines = []
+
+    def family(name, metric_type, description):
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {metric_type}')
+
+    cameras = [(_camera_labels(translator), translator, translator.worker.stats.as_dict(with_latency=True))
+               for translator in translators]
+
+    family('visca_datagrams_received_total', 'counter', 'Visca datagrams received by camera port')
+    for labels, translator, _ in cameras:
+        lines.append(f'visca_datagrams_received_total{{{labels}}} {translator.stats.datagrams}')
+
+    family('visca_commands_total', 'counter', 'Received visca commands by type')
+    for labels, translator, _ in cameras:
+        for command, count in sorted(dict(translator.stats.commands).items()):
+            lines.append(f'visca_commands_total{{{labels},command="{command}"}} {count}')
+
+    family('onvif_call_duration_seconds', 'histogram', 'Onvif call duration by operation')
+    for labels, _, stats in cameras:
+        for operation, command in sorted(stats['commands'].items()):
+            operation_labels = f'{labels},operation="{operation}"'
+            for bound, count in command['latency']:
+                lines.append(f'onvif_call_duration_seconds_bucket{{{operation_labels},le="{bound}"}} {count}')
+            lines.append(f'onvif_call_duration_seconds_sum{{{operation_labels}}} {command["latency_sum"]}')
+            lines.append(f'onvif_call_duration_seconds_count{{{operation_labels}}} {command["latency"][-1][1]}')
+
+    family('onvif_call_errors_total', 'counter', 'Failed onvif calls by operation and error type')
+    for labels, _, stats in cameras:
+        for operation, command in sorted(stats['commands'].items()):
+            for error, count in sorted(command['errors_by_type'].items()):
+                lines.append(f'onvif_call_errors_total{{{labels},operation="{operation}",error="{error}"}} {count}')
+
+    for name, description in (('dropped', 'Onvif commands dropped because of full queue'),
+                              ('coalesced', 'Onvif commands replaced by newer ones while waiting'),
+                              ('preempted', 'Waiting onvif commands cancelled by priority ones (stop)')):
+        family(f'onvif_commands_{name}_total', 'counter', description)
+        for labels, _, stats in cameras:
+            for operation, command in sorted(stats['commands'].items()):
+                lines.append(f'onvif_commands_{name}_total{{{labels},operation="{operation}"}} {command[name]}')
+
+    family('onvif_priority_latency_seconds', 'histogram',
+           'Time from visca datagram to camera acknowledgement of priority commands (stop)')
+    for labels, _, stats in cameras:
+        for operation, command in sorted(stats['commands'].items()):
+            if 'priority_latency' not in command:
+                continue
+            operation_labels = f'{labels},operation="{operation}"'
+            for bound, count in command['priority_latency']:
+                lines.append(f'onvif_priority_latency_seconds_bucket{{{operation_labels},le="{bound}"}} {count}')
+            lines.append(f'onvif_priority_latency_seconds_sum{{{operation_labels}}} {command["priority_latency_sum"]}')
+            lines.append(f'onvif_priority_latency_seconds_count{{{operation_labels}}} '
+                         f'{command["priority_latency"][-1][1]}')
+
+    for name, description in (('slo_violations', 'Priority commands acknowledged later than the latency slo'),
+                              ('resends', 'Priority commands re-sent by the watchdog')):
+        family(f'onvif_priority_{name}_total', 'counter', description)
+        for labels, _, stats in cameras:
+            for operation, command in sorted(stats['commands'].items()):
+                if 'priority_latency' in command:
+                    lines.append(f'onvif_priority_{name}_total{{{labels},operation="{operation}"}} {command[name]}')
+
+    pollers = [(labels, translator.status_poller) for labels, translator, _ in cameras
+               if translator.status_poller is not None]
+    family('onvif_status_age_seconds', 'gauge', 'Seconds since ptz status inquiries are answered from was polled')
+    for labels, poller in pollers:
+        age = poller.age
+        if age is not None:
+            lines.append(f'onvif_status_age_seconds{{{labels}}} {age:.3f}')
+
+    family('onvif_ptz_moving', 'gauge', 'Camera is moving according to the last polled ptz status')
+    for labels, poller in pollers:
+        status = poller.status
+        if status is not None:
+            lines.append(f'onvif_ptz_moving{{{labels}}} {int(status.moving)}')
+
+    for name, field, description in (('polls', 'polls', 'Ptz status polls'),
+                                     ('poll_errors', 'errors', 'Failed ptz status polls')):
+        family(f'onvif_status_{name}_total', 'counter', description)
+        for labels, poller in pollers:
+            lines.append(f'onvif_status_{name}_total{{{labels}}} {getattr(poller, field)}')
+
+    family('onvif_presets_known', 'gauge', 'Presets in the local mirror of camera presets')
+    for labels, translator, _ in cameras:
+        lines.append(f'onvif_presets_known{{{labels}}} {len(translator.preset_index)}')
+
+    family('onvif_preset_stores_total', 'counter', 'Preset stores by result, skipped ones already held the position')
+    for labels, translator, _ in cameras:
+        writer = translator.preset_writer
+        for result in ('written', 'skipped', 'failed'):
+            lines.append(f'onvif_preset_stores_total{{{labels},result="{result}"}} {getattr(writer, result)}')
+
+    family('onvif_preset_store_retries_total', 'counter', 'Failed SetPreset written again')
+    for labels, translator, _ in cameras:
+        lines.append(f'onvif_preset_store_retries_total{{{labels}}} {translator.preset_writer.retried}')
+
+    family('onvif_gotos_skipped_total', 'counter', 'Preset recalls skipped as the camera is at the preset')
+    for labels, translator, _ in cameras:
+        lines.append(f'onvif_gotos_skipped_total{{{labels}}} {translator.stats.skipped_gotos}')
+
+    family('onvif_goto_travel_rate', 'gauge',
+           'Preset recall travel rate in onvif generic space units per second, measured on polled status')
+    for labels, translator, _ in cameras:
+        lines.append(f'onvif_goto_travel_rate{{{labels}}} {translator.preset_index.travel_rate:.4f}')
+
+    family('onvif_command_queue_depth', 'gauge', 'Onvif commands waiting for execution')
+    for labels, translator, _ in cameras:
+        lines.append(f'onvif_command_queue_depth{{{labels}}} {translator.worker.queue_depth}')
+
+    family('onvif_command_queue_depth_max', 'gauge', 'Max onvif commands waiting for execution since start')
+    for labels, _, stats in cameras:
+        lines.append(f'onvif_command_queue_depth_max{{{labels}}} {stats["max_queue_depth"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def _camera_labels(translator):
+    host, port = translator.onvif_cam_addr
+    return f'camera="{host}:{port}",visca_port="{translator.visca_port}"'
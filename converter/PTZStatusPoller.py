@@ -0,0 +1,177 @@
+import logging
+from collections import namedtuple
+from threading import Thread, Event
+from time import monotonic, sleep
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IDLE_INTERVAL = 1.0
+DEFAULT_MOVING_INTERVAL = 0.1
+# seconds of fast polling after a motion command, cameras may report idle before they start moving
+WAKE_PERIOD = 1.0
+# visca zoom position of the tele end, onvif generic zoom space is [0, 1]
+VISCA_ZOOM_TELE = 0x4000
+
+PTZStatus = namedtuple('PTZStatus', 'pan tilt zoom moving updated_at')
+
+_poller_defaults = {
+    'idle_interval': DEFAULT_IDLE_INTERVAL,
+    'moving_interval': DEFAULT_MOVING_INTERVAL
+}
+
+
+def set_poller_defaults(idle_interval=None, moving_interval=None):
+    """
+    Set process wide poll intervals of pollers created by create_status_poller,
+    idle interval 0 disables status polling
+    """
+    if idle_interval is not None:
+        _poller_defaults['idle_interval'] = idle_interval
+    if moving_interval is not None:
+        _poller_defaults['moving_interval'] = moving_interval
+
+
+def create_status_poller(name, get_status):
+    """
+    :return: started PTZStatusPoller with process wide intervals or None if polling is disabled
+    """
+    if not _poller_defaults['idle_interval']:
+        return None
+    poller = PTZStatusPoller(name, get_status, _poller_defaults['idle_interval'], _poller_defaults['moving_interval'])
+    poller.start()
+    return poller
+
+
+class PTZStatusPoller(Thread):
+    """
+    Polls onvif ptz status of one camera and keeps the last one, so inquiries are answered
+    without a camera request. Polls every moving_interval while the camera moves or has just
+    been commanded and every idle_interval otherwise, polls are never closer than moving_interval.
+    Status is replaced as a whole, readers take it without locking
+    """
+    def __init__(self, name, get_status, idle_interval=DEFAULT_IDLE_INTERVAL,
+                 moving_interval=DEFAULT_MOVING_INTERVAL):
+        """
+        :param get_status:
+            callable returning onvif PTZStatus, e.g. ONVIFCameraControl.get_status
+        """
+        Thread.__init__(self, name=f'PTZStatusPoller {name}', daemon=True)
+        self.get_status = get_status
+        self.idle_interval = idle_interval
+        self.moving_interval = moving_interval
+        self.status = None
+        self.polls = 0
+        self.errors = 0
+        # callables getting every polled PTZStatus on the poller thread
+        self.listeners = []
+        self.__awake_until = None
+        self.__wake = Event()
+        self.__stopped = False
+
+    def wake(self, period=WAKE_PERIOD):
+        """
+        Keep polling fast for period seconds, called when a motion command is submitted.
+        Idle poller polls at once, fast polling one keeps its interval
+        """
+        now = monotonic()
+        previous = self.__awake_until
+        if previous is None or previous < now + period:
+            self.__awake_until = now + period
+        status = self.status
+        if (previous is None or previous <= now) and (status is None or not status.moving):
+            self.__wake.set()
+
+    def stop(self):
+        self.__stopped = True
+        self.__wake.set()
+
+    def run(self):
+        failing = False
+        while not self.__stopped:
+            polled_at = monotonic()
+            try:
+                self.status = parse_status(self.get_status(), monotonic())
+                self.polls += 1
+                if failing:
+                    logger.info(f'{self.name}: status is polled again')
+                failing = False
+            except Exception as e:
+                self.errors += 1
+                if not failing:
+                    logger.warning(f'{self.name}: cannot get status. {e}')
+                failing = True
+            else:
+                self.__notify(self.status)
+            self.__wake.clear()
+            # stop during the poll may have been cleared above
+            if self.__stopped:
+                break
+            self.__wake.wait(self.__interval(failing))
+            # woken idle poller still keeps moving_interval after the previous poll
+            rest = polled_at + self.moving_interval - monotonic()
+            if rest > 0 and not self.__stopped:
+                sleep(rest)
+
+    def __notify(self, status):
+        for listener in self.listeners:
+            try:
+                listener(status)
+            except Exception as e:
+                logger.exception(f'{self.name}: status listener failed. {e}')
+
+    def __interval(self, failing):
+        if failing:
+            return self.idle_interval
+        status = self.status
+        awake_until = self.__awake_until
+        if (status is not None and status.moving) or (awake_until is not None and monotonic() < awake_until):
+            return self.moving_interval
+        return self.idle_interval
+
+    @property
+    def age(self):
+        """
+        Seconds since the last successful poll, None if status has not been polled yet
+        """
+        status = self.status
+        return None if status is None else monotonic() - status.updated_at
+
+    @property
+    def visca_zoom_position(self):
+        """
+        Zoom position in visca units [0, VISCA_ZOOM_TELE], 0 if status is unknown
+        """
+        status = self.status
+        return visca_zoom(None if status is None else status.zoom)
+
+
+def visca_zoom(zoom):
+    """
+    :return: zoom of onvif generic space as visca zoom position [0, VISCA_ZOOM_TELE], 0 if zoom is unknown
+    """
+    if zoom is None:
+        return 0
+    return round(min(1.0, max(0.0, zoom)) * VISCA_ZOOM_TELE)
+
+
+def parse_status(status, updated_at):
+    """
+    :return: PTZStatus of onvif status, missing values are None
+    """
+    pan, tilt, zoom = parse_position(getattr(status, 'Position', None))
+    move_status = getattr(status, 'MoveStatus', None)
+    moving = any(str(getattr(move_status, axis, None)).upper() == 'MOVING' for axis in ('PanTilt', 'Zoom'))
+    return PTZStatus(pan, tilt, zoom, moving, updated_at)
+
+
+def parse_position(position):
+    """
+    :return: (pan, tilt, zoom) of onvif PTZVector, missing values are None
+    """
+    pan_tilt = getattr(position, 'PanTilt', None)
+    zoom = getattr(position, 'Zoom', None)
+    return _float(getattr(pan_tilt, 'x', None)), _float(getattr(pan_tilt, 'y', None)), _float(getattr(zoom, 'x', None))
+
+
+def _float(value):
+    return None if value is None else float(value)
@@ -0,0 +1,142 @@
+import logging
+import mmap
+import os
+import socket
+import struct
+from collections import namedtuple
+from threading import Lock
+from time import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'VISCAREC'
+FORMAT_VERSION = 1
+# magic, format version, record size, capacity, amount of records ever written
+HEADER = struct.Struct('<8sHHIQ')
+HEADER_SIZE = 64
+# sequence number, unix time, camera id, client ipv4, client port, direction, datagram length, datagram
+RECORD = struct.Struct('<Qd8s4sHBB32s')
+# visca server port, onvif camera ipv4 and port (zeros if camera host is not ipv4 address)
+CAMERA_ID = struct.Struct('<H4sH')
+MAX_DATA_SIZE = 32
+
+RECEIVED = 0
+SENT = 1
+
+PacketRecord = namedtuple('PacketRecord', 'seq time visca_port cam_addr client_addr direction data')
+
+_recorder_defaults = {
+    'recorder': None
+}
+
+
+def set_recorder_defaults(path=None, capacity=None):
+    """
+    Open process wide packet recorder used by translators created afterwards
+    """
+    if path:
+        _recorder_defaults['recorder'] = PacketRecorder(path, capacity or PacketRecorder.DEFAULT_CAPACITY)
+
+
+def get_default_recorder():
+    return _recorder_defaults['recorder']
+
+
+class PacketRecorder:
+    """
+    Appends visca datagrams to a ring of fixed size records in a memory mapped file. When the ring is full
+    the oldest records are overwritten. Existing file of the same capacity is continued after restart
+    """
+    DEFAULT_CAPACITY = 262144
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        """
+        :param capacity:
+            amount of records in the ring, the file takes 64 bytes per record
+        """
+        self.path = path
+        self.capacity = capacity
+        self.__lock = Lock()
+        self.__map, self.__written = self.__open()
+        logger.info(f'Recording visca packets to {path}, {capacity} records ring, '
+                    f'{self.__written} records written before')
+
+    def record(self, direction, camera_id, datagrams):
+        """
+        :param direction:
+            RECEIVED or SENT
+        :param camera_id:
+            bytes returned by make_camera_id
+        :param datagrams:
+            list of (data, (client ip, client port))
+        """
+        now = time()
+        with self.__lock:
+            if self.__map is None:
+                return
+            written = self.__written
+            for data, (client_ip, client_port) in datagrams:
+                offset = HEADER_SIZE + (written % self.capacity) * RECORD.size
+                RECORD.pack_into(self.__map, offset, written, now, camera_id, socket.inet_aton(client_ip),
+                                 client_port, direction, min(len(data), MAX_DATA_SIZE), data)
+                written += 1
+            self.__written = written
+            HEADER.pack_into(self.__map, 0, MAGIC, FORMAT_VERSION, RECORD.size, self.capacity, written)
+
+    def close(self):
+        with self.__lock:
+            if self.__map is not None:
+                self.__map.flush()
+                self.__map.close()
+                self.__map = None
+
+    def __open(self):
+        size = HEADER_SIZE + self.capacity * RECORD.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            written = 0
+            header = os.read(fd, HEADER.size)
+            if len(header) == HEADER.size and os.fstat(fd).st_size == size:
+                magic, version, record_size, capacity, previous = HEADER.unpack(header)
+                if (magic, version, record_size, capacity) == (MAGIC, FORMAT_VERSION, RECORD.size, self.capacity):
+                    written = previous
+            if not written:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            recording_map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(recording_map, 0, MAGIC, FORMAT_VERSION, RECORD.size, self.capacity, written)
+        return recording_map, written
+
+
+def make_camera_id(visca_port, cam_addr):
+    try:
+        cam_ip = socket.inet_aton(cam_addr[0])
+    except OSError:
+        cam_ip, cam_addr = bytes(4), (None, 0)
+    return CAMERA_ID.pack(visca_port, cam_ip, cam_addr[1])
+
+
+def read_records(path):
+    """
+    :return: list of PacketRecord of the ring from the oldest to the newest
+    """
+    with open(path, 'rb') as recording:
+        data = recording.read()
+    magic, version, record_size, capacity, written = HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.size:
+        raise ValueError(f'{path} is not a visca packet recording of format version {FORMAT_VERSION}')
+
+    records = []
+    for seq in range(max(0, written - capacity), written):
+        offset = HEADER_SIZE + (seq % capacity) * RECORD.size
+        record_seq, timestamp, camera_id, client_ip, client_port, direction, length, datagram = \
+            RECORD.unpack_from(data, offset)
+        if record_seq != seq:
+            # record was being written when the process stopped
+            continue
+        visca_port, cam_ip, cam_port = CAMERA_ID.unpack(camera_id)
+        records.append(PacketRecord(seq, timestamp, visca_port, (socket.inet_ntoa(cam_ip), cam_port),
+                                    (socket.inet_ntoa(client_ip), client_port), direction, datagram[:length]))
+    return records
@@ -0,0 +1,295 @@
+from collections import namedtuple
+from threading import Lock
+from time import monotonic
+
+from PTZStatusPoller import WAKE_PERIOD, parse_position
+
+# onvif generic space, positions this close are the same, cameras stop a bit off the preset
+POSITION_TOLERANCE = 0.005
+# onvif generic space units per second, used until a goto is measured
+DEFAULT_TRAVEL_RATE = 1.0
+# weight of the last measured goto in the travel rate
+TRAVEL_RATE_WEIGHT = 0.3
+# shorter gotos are not measured, their time is mostly camera latency
+MIN_MEASURED_DISTANCE = 0.05
+
+PresetEntry = namedtuple('PresetEntry', 'token name position')
+Goto = namedtuple('Goto', 'token start target started_at estimate seq')
+
+
+class PresetIndex:
+    """
+    Positions of presets of one camera, mirrored from GetPresets and kept in sync with stores.
+    Positions the camera did not report are completed from settled ptz status after a store or goto.
+
+    Motion commands submitted to the camera are counted, so the index knows the preset the camera
+    sits at: the one stored or recalled with no motion command submitted since, or the one at the settled
+    polled position. Goto travel time is estimated from the distance and the travel rate measured
+    on previous gotos, position during a goto is moved with it from the last polled one.
+    Entries are replaced as a whole, readers take them without locking
+    """
+    def __init__(self, status_poller=None):
+        """
+        :param status_poller:
+            PTZStatusPoller of the camera or None, without it positions are the mirrored ones only
+        """
+        self.status_poller = status_poller
+        self.loaded = False
+        self.travel_rate = DEFAULT_TRAVEL_RATE
+        self.gotos_measured = 0
+        self.__presets = {}
+        self.__lock = Lock()
+        self.__motion_seq = 0
+        self.__motion_at = None
+        # token -> motion seq the camera was put at the preset
+        self.__held = {}
+        # token -> motion seq of presets waiting for settled status to get their position
+        self.__unplaced = {}
+        self.__goto = None
+        if status_poller is not None:
+            status_poller.listeners.append(self.on_status)
+
+    def load(self, presets):
+        """
+        :param presets:
+            list of onvif PTZPreset
+        """
+        self.__presets = {entry.token: entry for entry in map(parse_preset, presets or ())}
+        self.loaded = True
+
+    def update(self, token, position):
+        """
+        :param position:
+            (pan, tilt, zoom) the preset is at, None if unknown
+        """
+        previous = self.__presets.get(str(token))
+        name = str(token) if previous is None else previous.name
+        self.__presets[str(token)] = PresetEntry(str(token), name, position)
+
+    def get(self, token):
+        """
+        :return: PresetEntry or None if the preset is not known
+        """
+        return self.__presets.get(str(token))
+
+    def __len__(self):
+        return len(self.__presets)
+
+    @property
+    def motion_seq(self):
+        return self.__motion_seq
+
+    def on_motion(self):
+        """
+        Called when a motion command is submitted, the camera leaves the preset it was at
+        :return: motion seq of the command
+        """
+        with self.__lock:
+            self.__motion_seq += 1
+            self.__motion_at = monotonic()
+            self.__goto = None
+            return self.__motion_seq
+
+    def hold(self, token, seq=None):
+        """
+        Camera is at the preset since motion seq, e.g. the preset is stored there.
+        Ignored if a motion command was submitted after seq
+        :return: motion seq the preset is held at
+        """
+        with self.__lock:
+            seq = self.__motion_seq if seq is None else seq
+            if seq == self.__motion_seq:
+                self.__held[token] = seq
+            return seq
+
+    def release(self, token, seq):
+        """
+        Preset held at seq is not at the camera position, e.g. its store failed
+        """
+        with self.__lock:
+            if self.__held.get(token) == seq:
+                del self.__held[token]
+
+    def is_at(self, token, queue_depth=0):
+        """
+        Settled polled position decides if there is one: the camera may be moved by its web ui, another
+        controller or a power cycle, which this index does not see. A preset stored or recalled with no
+        motion command since is trusted only until the status settles, or if status is not polled
+        :param queue_depth:
+            commands waiting for the camera, polled position is not compared while they wait
+        :return: True if the camera sits at the preset or is already on its way there
+        """
+        entry = self.get(token)
+        status = self.settled_status()
+        with self.__lock:
+            held = self.__held.get(token) == self.__motion_seq
+            goto = self.__goto
+        if status is None:
+            return held and (self.__polled_idle() or (goto is not None and goto.token == token))
+        if (queue_depth and not held) or entry is None or entry.position is None:
+            return False
+        return _near(entry.position, (status.pan, status.tilt, status.zoom))
+
+    def on_stored(self, token, seq):
+        """
+        Called when the camera acknowledged the preset store submitted at motion seq
+        """
+        status = self.settled_status()
+        with self.__lock:
+            current = seq == self.__motion_seq
+            if current and status is None:
+                self.__unplaced[token] = seq
+        self.update(token, (status.pan, status.tilt, status.zoom) if current and status is not None else None)
+
+    def start_goto(self, token, seq):
+        """
+        Called right before the goto submitted at motion seq is sent to the camera
+        :return: estimated travel seconds, None if the preset position is unknown
+        """
+        start = self.position()
+        entry = self.get(token)
+        target = None if entry is None else entry.position
+        estimate = self.estimate_travel(start, target)
+        with self.__lock:
+            if seq != self.__motion_seq:
+                return None
+            self.__goto = Goto(token, start, target, monotonic(), estimate, seq)
+        if estimate is not None and self.status_poller is not None:
+            self.status_poller.wake(estimate + WAKE_PERIOD)
+        return estimate
+
+    def finish_goto(self, token, seq):
+        """
+        Called when the camera acknowledged the goto submitted at motion seq
+        """
+        entry = self.get(token)
+        with self.__lock:
+            if seq != self.__motion_seq:
+                return
+            self.__held[token] = seq
+            if entry is None or entry.position is None:
+                self.__unplaced[token] = seq
+
+    def estimate_travel(self, start, target):
+        """
+        :param start:
+            (pan, tilt, zoom) or None
+        :return: seconds to travel from start to target at the measured travel rate, None if unknown
+        """
+        if start is None or target is None:
+            return None
+        distance = _distance(start, target)
+        return None if distance is None else distance / self.travel_rate
+
+    def estimate_arrival(self, token):
+        """
+        :return: seconds the camera needs to reach the preset from its current position, None if unknown
+        """
+        entry = self.get(token)
+        return self.estimate_travel(self.position(), None if entry is None else entry.position)
+
+    def position(self):
+        """
+        :return: (pan, tilt, zoom) of the camera, during a goto moved from the last polled position towards
+            the preset at the travel rate, None if status is unknown
+        """
+        status = None if self.status_poller is None else self.status_poller.status
+        current = None if status is None else (status.pan, status.tilt, status.zoom)
+        goto = self.__goto
+        if goto is None or goto.target is None:
+            return current
+        if status is not None and status.updated_at > goto.started_at:
+            anchor, anchored_at = current, status.updated_at
+        elif goto.start is not None:
+            anchor, anchored_at = goto.start, goto.started_at
+        else:
+            return current
+        step = self.travel_rate * (monotonic() - anchored_at)
+        return tuple(_step(position, target, step) for position, target in zip(anchor, goto.target))
+
+    def settled_status(self):
+        """
+        :return: polled status if the camera is idle and it was polled long enough after the last motion
+            command, cameras may report idle before they start moving. Otherwise None
+        """
+        return self.__settled(None if self.status_poller is None else self.status_poller.status)
+
+    def on_status(self, status):
+        """
+        Status listener: measures travel rate of the goto in progress and completes unknown positions
+        """
+        position = (status.pan, status.tilt, status.zoom)
+        with self.__lock:
+            goto = self.__goto
+            if goto is not None and not status.moving and status.updated_at > goto.started_at:
+                if goto.target is not None and _near(position, goto.target):
+                    self.__goto = None
+                    distance = None if goto.start is None else _distance(goto.start, goto.target)
+                    if distance is not None and distance >= MIN_MEASURED_DISTANCE:
+                        self.__measure(distance, status.updated_at - goto.started_at)
+                elif status.updated_at > goto.started_at + WAKE_PERIOD:
+                    # stopped elsewhere or target is unknown
+                    self.__goto = None
+            if not self.__unplaced or self.__settled(status) is None:
+                return
+            placed = [token for token, seq in self.__unplaced.items() if seq == self.__motion_seq]
+            self.__unplaced = {}
+        for token in placed:
+            self.update(token, position)
+
+    def __measure(self, distance, seconds):
+        if seconds <= 0:
+            return
+        if self.gotos_measured:
+            self.travel_rate += TRAVEL_RATE_WEIGHT * (distance / seconds - self.travel_rate)
+        else:
+            self.travel_rate = distance / seconds
+        self.gotos_measured += 1
+
+    def __polled_idle(self):
+        """
+        :return: False if polled status shows the camera moving, True if it does not or status is unknown
+        """
+        status = None if self.status_poller is None else self.status_poller.status
+        return status is None or not status.moving
+
+    def __settled(self, status):
+        if status is None or status.moving:
+            return None
+        motion_at = self.__motion_at
+        if motion_at is not None and status.updated_at < motion_at + WAKE_PERIOD:
+            return None
+        return status
+
+
+def parse_preset(preset):
+    """
+    :return: PresetEntry of onvif PTZPreset, position is None if the camera did not report it
+    """
+    position = parse_position(getattr(preset, 'PTZPosition', None))
+    return PresetEntry(str(preset.token), getattr(preset, 'Name', None),
+                       None if all(value is None for value in position) else position)
+
+
+def _step(position, target, step):
+    """
+    :return: axis position moved by step towards target, axes of the camera travel independently
+    """
+    if position is None or target is None:
+        return position
+    if abs(target - position) <= step:
+        return target
+    return position + step if target > position else position - step
+
+
+def _near(a, b):
+    distance = _distance(a, b)
+    return distance is not None and distance <= POSITION_TOLERANCE
+
+
+def _distance(a, b):
+    """
+    :return: the largest axis distance of positions, axes move at the same time. None if no axis is known
+    """
+    distances = [abs(x - y) for x, y in zip(a, b) if x is not None and y is not None]
+    return max(distances) if distances else None
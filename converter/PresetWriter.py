@@ -0,0 +1,97 @@
+import logging
+from time import sleep
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRIES = 2
+# seconds, multiplied by the attempt number
+RETRY_INTERVAL = 0.2
+
+_writer_defaults = {
+    'retries': DEFAULT_RETRIES
+}
+
+
+def set_preset_defaults(retries=None):
+    """
+    Set process wide defaults of preset writers created afterwards
+    :param retries:
+        int, how many times a failed SetPreset is written again
+    """
+    if retries is not None:
+        _writer_defaults['retries'] = retries
+
+
+class PresetWriter:
+    """
+    Write-behind of preset stores of one camera. The caller answers the controller at once and SetPreset
+    is written by the camera command worker in order with motion commands, so the preset gets the position
+    the camera has when the controller stored it.
+
+    Store is skipped if the index knows the camera sits at the preset: the same preset was stored
+    with no motion command submitted since, or its mirrored position equals the settled polled status.
+    Failed SetPreset is retried while no motion command waits behind it
+    """
+    def __init__(self, name, cam, worker, index, retries=None):
+        """
+        :param cam:
+            ONVIFCameraControl
+        :param worker:
+            CamCommandWorker executing commands of the camera
+        :param index:
+            PresetIndex of the camera, loaded and kept in sync with stores by the writer
+        """
+        self.name = name
+        self.cam = cam
+        self.worker = worker
+        self.index = index
+        self.retries = _writer_defaults['retries'] if retries is None else retries
+        self.written = 0
+        self.skipped = 0
+        self.retried = 0
+        self.failed = 0
+
+    def load(self):
+        """
+        Mirror camera presets, GetPresets is queued to the worker so it does not delay the translator start
+        """
+        self.worker.submit('get_presets', self.__load)
+
+    def store(self, token):
+        """
+        :return: False if the store is skipped as redundant
+        """
+        if self.index.is_at(token, self.worker.queue_depth):
+            self.skipped += 1
+            return False
+        seq = self.index.hold(token)
+        if not self.worker.submit('set_preset', self.__write, token, seq):
+            self.index.release(token, seq)
+        return True
+
+    def __load(self):
+        self.index.load(self.cam.get_presets())
+        logger.info(f'{self.name}: {len(self.index)} presets mirrored')
+
+    def __write(self, token, seq):
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                sleep(RETRY_INTERVAL * attempt)
+                if self.index.motion_seq != seq:
+                    logger.warning(f'{self.name}: preset {token} is not retried, motion commands are waiting')
+                    break
+                self.retried += 1
+            try:
+                self.cam.set_preset(token)
+            except Exception as e:
+                error = e
+                logger.warning(f'{self.name}: storing preset {token} failed, attempt {attempt + 1}. {e}')
+                continue
+            self.written += 1
+            self.index.on_stored(token, seq)
+            return
+
+        self.failed += 1
+        self.index.release(token, seq)
+        raise error
@@ -0,0 +1,150 @@
+import logging
+import multiprocessing
+import os
+import queue
+from time import monotonic
+from zlib import crc32
+
+from LoggingTools import start_log_listener
+
+logger = logging.getLogger(__name__)
+
+
+class ShardSupervisor:
+    """
+    Spreads cameras across worker processes, so translation is not limited by a single GIL.
+    Every worker owns visca sockets and onvif clients of its cameras, supervisor only fetches config,
+    sends every worker its cameras and restarts dead workers. Camera is always assigned to the same worker
+    """
+    def __init__(self, workers, run_worker, worker_args=()):
+        """
+        :param workers:
+            amount of worker processes
+        :param run_worker:
+            callable(shard, cams_queue, log_queue, *worker_args) run in worker process,
+            it takes {addr: cam} dicts of its cameras from cams_queue, records of its loggers go to log_queue
+        """
+        self.workers = workers
+        self.run_worker = run_worker
+        self.worker_args = worker_args
+        self.log_queue = multiprocessing.Queue()
+        self.processes = [None] * workers
+        self.cams_queues = [None] * workers
+        self.shards = [{} for _ in range(workers)]
+        self.log_listener = None
+
+    def serve(self, fetch_cams, wait_change):
+        """
+        :param wait_change:
+            callable blocking until config may have changed
+        """
+        self.log_listener = start_log_listener(self.log_queue)
+        cams = dict()
+        while True:
+            try:
+                cams = fetch_cams()
+            except Exception as e:
+                logger.error('Error occurs during cams fetching. ' + str(e))
+
+            shards = self.split_cams(cams)
+            started = self.ensure_workers()
+            for shard, shard_cams in enumerate(shards):
+                if shard in started or shard_cams != self.shards[shard]:
+                    self.cams_queues[shard].put(shard_cams)
+            self.shards = shards
+
+            wait_change()
+
+    def split_cams(self, cams):
+        shards = [{} for _ in range(self.workers)]
+        used_ports = set()
+        for onvif_cam_addr, cam in cams.items():
+            visca_port = cam["visca_server_port"]
+            if visca_port in used_ports:
+                logger.error(f'Port "{visca_port}" is already used. '
+                             f'Please define another port in config for {onvif_cam_addr}')
+                continue
+            used_ports.add(visca_port)
+            shards[get_shard(onvif_cam_addr, self.workers)][onvif_cam_addr] = cam
+        return shards
+
+    def ensure_workers(self):
+        """
+        Start workers which are not running
+        :return: set of started shards
+        """
+        started = set()
+        for shard, process in enumerate(self.processes):
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                logger.error(f'Worker {shard} exited with code {process.exitcode}, restarting')
+            self.cams_queues[shard] = multiprocessing.Queue()
+            self.processes[shard] = multiprocessing.Process(
+                target=self.run_worker, args=(shard, self.cams_queues[shard], self.log_queue) + tuple(self.worker_args),
+                name=f'Worker {shard}', daemon=True)
+            self.processes[shard].start()
+            started.add(shard)
+            logger.info(f'Worker {shard} started with pid {self.processes[shard].pid}')
+        return started
+
+    def stop(self):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join()
+        if self.log_listener is not None:
+            self.log_listener.stop()
+
+
+def get_shard(onvif_cam_addr, workers):
+    """
+    Stable worker index of camera, the same in every process and run
+    """
+    ip, port = onvif_cam_addr
+    return crc32(f'{ip}:{port}'.encode()) % workers
+
+
+class ShardCamsReceiver:
+    """
+    Cameras sent by supervisor to worker process. Worker process exits if supervisor is dead,
+    so orphaned worker does not hold visca ports
+    """
+    def __init__(self, cams_queue, refresh_every_sec):
+        """
+        :param refresh_every_sec:
+            wait returns after that time even if nothing is sent, so worker retries cameras which could not be started
+        """
+        self.cams_queue = cams_queue
+        self.refresh_every_sec = refresh_every_sec
+        self.cams = None
+
+    def fetch(self):
+        """
+        :return: the latest sent cameras, blocks until the first cameras are sent
+        """
+        while self.cams is None:
+            self.wait()
+        try:
+            while True:
+                self.cams = self.cams_queue.get_nowait()
+        except queue.Empty:
+            pass
+        return self.cams
+
+    def wait(self):
+        """
+        Block until supervisor sends cameras or refresh time expires
+        """
+        deadline = monotonic() + self.refresh_every_sec
+        while monotonic() < deadline:
+            try:
+                self.cams = self.cams_queue.get(timeout=min(1.0, max(0.0, deadline - monotonic())))
+                return
+            except queue.Empty:
+                if not multiprocessing.parent_process().is_alive():
+                    logger.error('Supervisor is dead, worker exits')
+                    logging.shutdown()
+                    os._exit(1)
@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import random
+from threading import Lock, local
+from time import monotonic
+
+from zeep import Plugin
+
+logger = logging.getLogger(__name__)
+
+# serving thread and command worker of a camera are shown as separate rows of the trace viewer
+WORKER_ROW_OFFSET = 100000
+
+_current = local()
+_tracing_defaults = {
+    'tracer': None
+}
+
+
+def set_tracing_defaults(path=None, sample_rate=None, slow_ms=None):
+    """
+    Create process wide tracer used by translators created afterwards. Tracing is enabled
+    if trace file path or slow command threshold is given
+    """
+    if path or slow_ms:
+        _tracing_defaults['tracer'] = Tracer(path, 0.01 if sample_rate is None else sample_rate,
+                                             slow_ms / 1000 if slow_ms else None)
+
+
+def get_default_tracer():
+    return _tracing_defaults['tracer']
+
+
+def current_trace():
+    return getattr(_current, 'trace', None)
+
+
+def set_current_trace(trace):
+    _current.trace = trace
+
+
+class Trace:
+    """
+    Stage timestamps of one visca datagram from its arrival to the end of the onvif call it caused.
+    Spans are (stage name, monotonic start, monotonic end, row)
+    """
+    __slots__ = ('id', 'visca_port', 'name', 'started_at', 'spans', 'pending', 'status', 'sampled', 'replied')
+
+    def __init__(self, trace_id, visca_port, started_at, sampled):
+        self.id = trace_id
+        self.visca_port = visca_port
+        self.name = 'datagram'
+        self.started_at = started_at
+        self.spans = []
+        self.pending = 1
+        self.status = 'ok'
+        self.sampled = sampled
+        self.replied = False
+
+    def add_span(self, name, start, end, worker=False):
+        self.spans.append((name, start, end, self.visca_port + WORKER_ROW_OFFSET if worker else self.visca_port))
+
+    @property
+    def duration(self):
+        return max(end for _, _, end, _ in self.spans) - self.started_at if self.spans else 0.0
+
+
+class Tracer:
+    """
+    Collects traces of datagrams. Every datagram is timed, sampled and slow traces are appended
+    to the file in Chrome trace event format (open it in chrome://tracing or ui.perfetto.dev),
+    slow ones are also logged with their stage breakdown
+    """
+    def __init__(self, path=None, sample_rate=0.01, slow_threshold=None):
+        """
+        :param sample_rate:
+            float in range [0, 1], part of traces written to the file
+        :param slow_threshold:
+            float seconds, traces longer than that are logged and written regardless of sampling
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.__lock = Lock()
+        self.__next_id = 0
+        self.__named_rows = set()
+        self.__file = None
+        if path:
+            self.__file = open(path, 'a')
+            if self.__file.tell() == 0:
+                # closing bracket is optional in the json array trace format, so events are just appended
+                self.__file.write('[\n')
+            logger.info(f'Tracing {sample_rate:.2%} of visca datagrams to {path}')
+
+    def start(self, visca_port, started_at):
+        with self.__lock:
+            self.__next_id += 1
+            trace_id = self.__next_id
+        return Trace(trace_id, visca_port, started_at, random.random() < self.sample_rate)
+
+    def retain(self, trace):
+        """
+        Trace is continued by another thread and is finished after one more release
+        """
+        with self.__lock:
+            trace.pending += 1
+
+    def release(self, trace):
+        with self.__lock:
+            trace.pending -= 1
+            if trace.pending:
+                return
+        slow = self.slow_threshold is not None and trace.duration >= self.slow_threshold
+        if slow:
+            logger.warning(f'Slow visca command {trace.name} on port {trace.visca_port}: {format_stages(trace)}')
+        if self.__file is not None and (slow or trace.sampled):
+            self.__write(trace)
+
+    def close(self):
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+    def __write(self, trace):
+        events = []
+        for name, start, end, row in trace.spans:
+            events.append({'name': name, 'cat': trace.name, 'ph': 'X', 'pid': os.getpid(), 'tid': row,
+                           'ts': round(start * 1e6, 1), 'dur': round((end - start) * 1e6, 1),
+                           'args': {'trace': trace.id, 'status': trace.status}})
+        with self.__lock:
+            if self.__file is None:
+                return
+            for _, _, _, row in trace.spans:
+                if row not in self.__named_rows:
+                    self.__named_rows.add(row)
+                    kind = 'onvif worker' if row >= WORKER_ROW_OFFSET else 'visca port'
+                    port = row - WORKER_ROW_OFFSET if row >= WORKER_ROW_OFFSET else row
+                    events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': row,
+                                   'args': {'name': f'{kind} {port}'}})
+            self.__file.write(''.join(json.dumps(event) + ',\n' for event in events))
+            self.__file.flush()
+
+
+class TracingPlugin(Plugin):
+    """
+    Zeep plugin adding a span from sending soap request to receiving its response to the current trace
+    """
+    def egress(self, envelope, http_headers, operation, binding_options):
+        trace = current_trace()
+        if trace is not None:
+            _current.sent_at = monotonic()
+        return envelope, http_headers
+
+    def ingress(self, envelope, http_headers, operation):
+        trace = current_trace()
+        if trace is not None:
+            trace.add_span(f'http {operation.name}', _current.sent_at, monotonic(), worker=True)
+        return envelope, http_headers
+
+
+def format_stages(trace):
+    stages = ', '.join(f'{name} {(end - start) * 1000:.1f}' for name, start, end, _ in
+                       sorted(trace.spans, key=lambda span: span[1]))
+    return f'total {trace.duration * 1000:.1f} ms ({stages}), {trace.status}'
@@ -0,0 +1,233 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import socket
+import struct
+import sys
+
+logger = logging.getLogger(__name__)
+
+MSG_DONTWAIT = 0x40
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_iovec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+def _load_mmsg_functions():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        recvmmsg, sendmmsg = libc.recvmmsg, libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return recvmmsg, sendmmsg
+
+
+_mmsg_functions = _load_mmsg_functions()
+
+_MMSGHDR_SIZE = ctypes.sizeof(_mmsghdr)
+_MSG_LEN_OFFSET = _mmsghdr.msg_len.offset
+_MSG_LEN = struct.Struct('I')
+_MSG_NAME_OFFSET = _mmsghdr.msg_hdr.offset + _msghdr.msg_name.offset
+_MSG_NAME = struct.Struct('P')
+_IOVEC_SIZE = ctypes.sizeof(_iovec)
+_IOV_LEN_OFFSET = _iovec.iov_len.offset
+_IOV_LEN = struct.Struct('N')
+
+
+_batch_defaults = {
+    'use_mmsg': False
+}
+
+
+def is_mmsg_available():
+    return _mmsg_functions is not None
+
+
+def set_batch_defaults(use_mmsg=None):
+    """
+    Set process wide defaults used by UdpBatchIO
+    """
+    if use_mmsg is not None:
+        _batch_defaults['use_mmsg'] = use_mmsg
+
+
+class UdpBatchIO:
+    """
+    Receives all pending datagrams of ipv4 udp socket at once and sends replies in batches.
+    Non-blocking recvfrom/sendto loop drains the socket, on Linux recvmmsg/sendmmsg can be
+    called through ctypes instead (one syscall per batch)
+    """
+    SOCKADDR_IN_SIZE = 16
+    SEND_SLOT_SIZE = 64
+
+    def __init__(self, sock, max_batch=64, max_datagram_size=16, use_mmsg=None):
+        """
+        :param use_mmsg:
+            bool, use recvmmsg/sendmmsg if available, if None then process default is used.
+            Off by default: on loopback the drain loop was measured as fast, see benchmarks/bench_udp_batch.py
+        """
+        sock.setblocking(False)
+        self.sock = sock
+        self.max_batch = max_batch
+        self.max_datagram_size = max_datagram_size
+        use_mmsg = _batch_defaults['use_mmsg'] if use_mmsg is None else use_mmsg
+        self.use_mmsg = use_mmsg and is_mmsg_available()
+        if self.use_mmsg:
+            self.__init_mmsg_buffers()
+
+    def receive(self):
+        """
+        :return: list of (data, addr) of all pending datagrams, at most max_batch
+        """
+        if self.use_mmsg:
+            return self.__receive_mmsg()
+        datagrams = []
+        try:
+            while len(datagrams) < self.max_batch:
+                datagrams.append(self.sock.recvfrom(self.max_datagram_size))
+        except (BlockingIOError, InterruptedError):
+            pass
+        return datagrams
+
+    def send(self, datagrams):
+        """
+        :param datagrams:
+            list of (data, addr)
+        """
+        if self.use_mmsg:
+            for data, addr in datagrams:
+                if len(data) > self.SEND_SLOT_SIZE:
+                    self.__sendto(data, addr)
+            datagrams = [datagram for datagram in datagrams if len(datagram[0]) <= self.SEND_SLOT_SIZE]
+            for start in range(0, len(datagrams), self.max_batch):
+                self.__send_mmsg(datagrams[start:start + self.max_batch])
+            return
+        for data, addr in datagrams:
+            self.__sendto(data, addr)
+
+    def __sendto(self, data, addr):
+        try:
+            self.sock.sendto(data, addr)
+        except OSError as e:
+            logger.error(f'Cannot send {data.hex()} to {addr}. {e}')
+
+    def __init_mmsg_buffers(self):
+        # contiguous ctypes buffers, read and patched through memoryview with struct,
+        # since ctypes field access per datagram costs more than the syscalls saved
+        n = self.max_batch
+        self.__recv_data = ctypes.create_string_buffer(n * self.max_datagram_size)
+        self.__recv_names = ctypes.create_string_buffer(n * self.SOCKADDR_IN_SIZE)
+        self.__recv_iovecs = (_iovec * n)()
+        self.__recv_msgs = (_mmsghdr * n)()
+        self.__send_data = ctypes.create_string_buffer(n * self.SEND_SLOT_SIZE)
+        self.__send_iovecs = (_iovec * n)()
+        self.__send_msgs = (_mmsghdr * n)()
+        for i in range(n):
+            self.__recv_iovecs[i].iov_base = ctypes.addressof(self.__recv_data) + i * self.max_datagram_size
+            self.__recv_iovecs[i].iov_len = self.max_datagram_size
+            header = self.__recv_msgs[i].msg_hdr
+            header.msg_name = ctypes.addressof(self.__recv_names) + i * self.SOCKADDR_IN_SIZE
+            header.msg_namelen = self.SOCKADDR_IN_SIZE
+            header.msg_iov = ctypes.pointer(self.__recv_iovecs[i])
+            header.msg_iovlen = 1
+            self.__send_iovecs[i].iov_base = ctypes.addressof(self.__send_data) + i * self.SEND_SLOT_SIZE
+            header = self.__send_msgs[i].msg_hdr
+            header.msg_namelen = self.SOCKADDR_IN_SIZE
+            header.msg_iov = ctypes.pointer(self.__send_iovecs[i])
+            header.msg_iovlen = 1
+        self.__recv_msgs_view = memoryview(self.__recv_msgs).cast('B')
+        self.__send_data_view = memoryview(self.__send_data).cast('B')
+        self.__send_iovecs_view = memoryview(self.__send_iovecs).cast('B')
+        self.__send_msgs_view = memoryview(self.__send_msgs).cast('B')
+        self.__addrs = {}
+        self.__sockaddrs = {}
+
+    def __receive_mmsg(self):
+        recvmmsg, _ = _mmsg_functions
+        count = recvmmsg(self.sock.fileno(), self.__recv_msgs, self.max_batch, MSG_DONTWAIT, None)
+        if count < 0:
+            error = ctypes.get_errno()
+            if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(error, f'recvmmsg failed. {errno.errorcode.get(error, error)}')
+        # kernel writes msg_namelen back, it stays sizeof(sockaddr_in) for ipv4 socket
+        lengths = _MSG_LEN.unpack_from
+        msgs = self.__recv_msgs_view
+        data = self.__recv_data.raw
+        names = self.__recv_names.raw
+        size = self.max_datagram_size
+        datagrams = []
+        for i in range(count):
+            offset = i * size
+            name = i * self.SOCKADDR_IN_SIZE
+            length, = lengths(msgs, i * _MMSGHDR_SIZE + _MSG_LEN_OFFSET)
+            datagrams.append((data[offset:offset + length], self.__addr(names[name + 2:name + 8])))
+        return datagrams
+
+    def __addr(self, port_and_ip):
+        addr = self.__addrs.get(port_and_ip)
+        if addr is None:
+            addr = (socket.inet_ntoa(port_and_ip[2:]), int.from_bytes(port_and_ip[:2], 'big'))
+            if len(self.__addrs) >= 1024:
+                self.__addrs.clear()
+            self.__addrs[port_and_ip] = addr
+        return addr
+
+    def __send_mmsg(self, datagrams):
+        _, sendmmsg = _mmsg_functions
+        slot = self.SEND_SLOT_SIZE
+        data_view = self.__send_data_view
+        names = []
+        for i, (data, addr) in enumerate(datagrams):
+            data_view[i * slot:i * slot + len(data)] = data
+            _IOV_LEN.pack_into(self.__send_iovecs_view, i * _IOVEC_SIZE + _IOV_LEN_OFFSET, len(data))
+            name = self.__sockaddr(addr)
+            names.append(name)
+            _MSG_NAME.pack_into(self.__send_msgs_view, i * _MMSGHDR_SIZE + _MSG_NAME_OFFSET, ctypes.addressof(name))
+        sent = 0
+        while sent < len(datagrams):
+            count = sendmmsg(self.sock.fileno(), ctypes.byref(self.__send_msgs[sent]), len(datagrams) - sent, 0)
+            if count < 0:
+                error = ctypes.get_errno()
+                if error == errno.EINTR:
+                    continue
+                # send the rest one by one to log failed datagram
+                for data, addr in datagrams[sent:]:
+                    self.__sendto(data, addr)
+                return
+            sent += count
+
+    def __sockaddr(self, addr):
+        name = self.__sockaddrs.get(addr)
+        if name is None:
+            raw = socket.AF_INET.to_bytes(2, sys.byteorder) + addr[1].to_bytes(2, 'big') \
+                  + socket.inet_aton(addr[0]) + bytes(8)
+            name = ctypes.create_string_buffer(raw, self.SOCKADDR_IN_SIZE)
+            if len(self.__sockaddrs) >= 1024:
+                self.__sockaddrs.clear()
+            self.__sockaddrs[addr] = name
+        return name
@@ -0,0 +1,322 @@
+import logging
+import random
+import xml.etree.ElementTree as ElementTree
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+from time import monotonic, sleep
+
+logger = logging.getLogger(__name__)
+
+SOAP_ENV = 'http://www.w3.org/2003/05/soap-envelope'
+TDS = 'http://www.onvif.org/ver10/device/wsdl'
+TRT = 'http://www.onvif.org/ver10/media/wsdl'
+TPTZ = 'http://www.onvif.org/ver20/ptz/wsdl'
+TIMG = 'http://www.onvif.org/ver20/imaging/wsdl'
+TT = 'http://www.onvif.org/ver10/schema'
+
+POSITION_SPACE = 'http://www.onvif.org/ver10/tptz/PanTiltSpaces/PositionGenericSpace'
+ZOOM_SPACE = 'http://www.onvif.org/ver10/tptz/ZoomSpaces/PositionGenericSpace'
+
+ENVELOPE = (f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<env:Envelope xmlns:env="{SOAP_ENV}" xmlns:tds="{TDS}" xmlns:trt="{TRT}" '
+            f'xmlns:tptz="{TPTZ}" xmlns:timg="{TIMG}" xmlns:tt="{TT}">'
+            f'<env:Body>{{body}}</env:Body></env:Envelope>')
+
+FAULT = ('<env:Fault><env:Code><env:Value>env:Receiver</env:Value></env:Code>'
+         '<env:Reason><env:Text xml:lang="en">{reason}</env:Text></env:Reason></env:Fault>')
+
+
+class FakePTZState:
+    """
+    Pan, tilt and zoom of the fake camera. Continuous move is integrated over time, preset recall
+    travels to the preset at travel_rate units per second, all axes at once, or jumps there if it is None
+    """
+    def __init__(self, travel_rate=None):
+        self.lock = Lock()
+        self.position = [0.0, 0.0, 0.0]
+        self.velocity = [0.0, 0.0, 0.0]
+        self.target = None
+        self.travel_rate = travel_rate
+        self.presets = {}
+        self.updated_at = monotonic()
+
+    def update(self):
+        now = monotonic()
+        dt = now - self.updated_at
+        self.updated_at = now
+        for i in range(3):
+            low = 0.0 if i == 2 else -1.0
+            self.position[i] = min(1.0, max(low, self.position[i] + self.velocity[i] * dt))
+        if self.target is not None:
+            step = self.travel_rate * dt
+            self.position = [target if abs(target - current) <= step
+                             else current + (step if target > current else -step)
+                             for current, target in zip(self.position, self.target)]
+            if self.position == self.target:
+                self.target = None
+
+    def goto(self, position):
+        self.velocity = [0.0, 0.0, 0.0]
+        if self.travel_rate is None:
+            self.position = list(position)
+        else:
+            self.target = list(position)
+
+    @property
+    def moving(self):
+        return any(self.velocity) or self.target is not None
+
+
+class FakeOnvifCamera:
+    """
+    Local http server emulating the onvif device, media, ptz and imaging services
+    just enough for onvif_zeep and ONVIFCameraControl.
+    Received soap requests are kept in `requests` as (operation name, raw body) tuples,
+    their monotonic arrival times in `received_at`
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, travel_rate=None):
+        """
+        :param port:
+            int, 0 to choose free port
+        :param latency:
+            float seconds added to every response
+        :param jitter:
+            float seconds, mean of exponentially distributed delay added to latency,
+            cheap cameras answer most requests fast but some of them much slower
+        :param travel_rate:
+            float units per second preset recall travels at, if None then the camera jumps to the preset
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.state = FakePTZState(travel_rate)
+        self.requests = []
+        self.received_at = []
+        self.__stalls = {}
+        self.__failures = {}
+        self.connections = 0
+        self.__lock = Lock()
+        self.__server = ThreadingHTTPServer((host, port), self.__handler_class())
+        self.__server.daemon_threads = True
+        self.__thread = Thread(target=self.__server.serve_forever, name='FakeOnvifCamera', daemon=True)
+
+    @property
+    def host(self):
+        return self.__server.server_address[0]
+
+    @property
+    def port(self):
+        return self.__server.server_address[1]
+
+    @property
+    def addr(self):
+        return self.host, self.port
+
+    def start(self):
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def on_connection(self):
+        with self.__lock:
+            self.connections += 1
+
+    def operations(self):
+        return [operation for operation, _ in self.requests]
+
+    def timed_operations(self, start=0):
+        """
+        :return: list of (monotonic arrival time, operation name) of requests starting from index start
+        """
+        with self.__lock:
+            return [(received_at, operation) for received_at, (operation, _) in
+                    zip(self.received_at[start:], self.requests[start:])]
+
+    def stall_next(self, operation, seconds):
+        """
+        Next request of the operation is answered seconds later, e.g. to check client timeouts
+        """
+        with self.__lock:
+            self.__stalls[operation] = seconds
+
+    def fail_next(self, operation, count=1):
+        """
+        Next count requests of the operation are answered with a soap fault, e.g. to check client retries
+        """
+        with self.__lock:
+            self.__failures[operation] = count
+
+    def response_delay(self):
+        if self.jitter:
+            return self.latency + random.expovariate(1 / self.jitter)
+        return self.latency
+
+    def handle(self, raw_body, received_at=None):
+        """
+        :return: (http status, response envelope) for raw soap request
+        """
+        envelope = ElementTree.fromstring(raw_body)
+        body = envelope.find(f'{{{SOAP_ENV}}}Body')
+        request = body[0]
+        operation = request.tag.split('}')[-1]
+        with self.__lock:
+            self.requests.append((operation, raw_body))
+            self.received_at.append(monotonic() if received_at is None else received_at)
+            stall = self.__stalls.pop(operation, 0)
+            failing = self.__failures.get(operation, 0)
+            if failing:
+                self.__failures[operation] = failing - 1
+        if stall:
+            sleep(stall)
+        if failing:
+            return 500, ENVELOPE.format(body=FAULT.format(reason=f'{operation} failure injected'))
+
+        handler = getattr(self, f'_op_{operation}', None)
+        if handler is None:
+            return 500, ENVELOPE.format(body=FAULT.format(reason=f'{operation} is not supported'))
+        with self.state.lock:
+            self.state.update()
+            return 200, ENVELOPE.format(body=handler(request))
+
+    def _op_GetSystemDateAndTime(self, request):
+        return ('<tds:GetSystemDateAndTimeResponse><tds:SystemDateAndTime>'
+                '<tt:DateTimeType>NTP</tt:DateTimeType><tt:DaylightSavings>false</tt:DaylightSavings>'
+                '</tds:SystemDateAndTime></tds:GetSystemDateAndTimeResponse>')
+
+    def _op_GetCapabilities(self, request):
+        url = f'http://{self.host}:{self.port}/onvif'
+        return (f'<tds:GetCapabilitiesResponse><tds:Capabilities>'
+                f'<tt:Device><tt:XAddr>{url}/device_service</tt:XAddr></tt:Device>'
+                f'<tt:Imaging><tt:XAddr>{url}/imaging_service</tt:XAddr></tt:Imaging>'
+                f'<tt:Media><tt:XAddr>{url}/media_service</tt:XAddr></tt:Media>'
+                f'<tt:PTZ><tt:XAddr>{url}/ptz_service</tt:XAddr></tt:PTZ>'
+                f'</tds:Capabilities></tds:GetCapabilitiesResponse>')
+
+    def _op_GetProfiles(self, request):
+        return ('<trt:GetProfilesResponse><trt:Profiles token="profile_1" fixed="true">'
+                '<tt:Name>main</tt:Name>'
+                '<tt:PTZConfiguration token="ptz_1"><tt:Name>ptz</tt:Name><tt:UseCount>1</tt:UseCount>'
+                '<tt:NodeToken>node_1</tt:NodeToken></tt:PTZConfiguration>'
+                '</trt:Profiles></trt:GetProfilesResponse>')
+
+    def _op_GetVideoSources(self, request):
+        return ('<trt:GetVideoSourcesResponse><trt:VideoSources token="video_source_1">'
+                '<tt:Framerate>25</tt:Framerate>'
+                '<tt:Resolution><tt:Width>1920</tt:Width><tt:Height>1080</tt:Height></tt:Resolution>'
+                '</trt:VideoSources></trt:GetVideoSourcesResponse>')
+
+    def _op_GetStatus(self, request):
+        state = 'MOVING' if self.state.moving else 'IDLE'
+        return (f'<tptz:GetStatusResponse><tptz:PTZStatus>{self.__ptz_vector("Position", self.state.position)}'
+                f'<tt:MoveStatus><tt:PanTilt>{state}</tt:PanTilt><tt:Zoom>{state}</tt:Zoom></tt:MoveStatus>'
+                f'<tt:UtcTime>2020-01-01T00:00:00Z</tt:UtcTime>'
+                f'</tptz:PTZStatus></tptz:GetStatusResponse>')
+
+    def _op_ContinuousMove(self, request):
+        velocity = _find(request, 'Velocity')
+        pan_tilt = _find(velocity, 'PanTilt')
+        zoom = _find(velocity, 'Zoom')
+        self.state.target = None
+        self.state.velocity = [
+            float(pan_tilt.get('x', 0)) if pan_tilt is not None else 0.0,
+            float(pan_tilt.get('y', 0)) if pan_tilt is not None else 0.0,
+            float(zoom.get('x', 0)) if zoom is not None else 0.0
+        ]
+        return '<tptz:ContinuousMoveResponse/>'
+
+    def _op_Stop(self, request):
+        self.state.velocity = [0.0, 0.0, 0.0]
+        self.state.target = None
+        return '<tptz:StopResponse/>'
+
+    def _op_GotoHomePosition(self, request):
+        self.state.goto([0.0, 0.0, 0.0])
+        return '<tptz:GotoHomePositionResponse/>'
+
+    def _op_SetPreset(self, request):
+        token = _text(request, 'PresetToken') or str(len(self.state.presets) + 1)
+        self.state.presets[token] = list(self.state.position)
+        return f'<tptz:SetPresetResponse><tptz:PresetToken>{token}</tptz:PresetToken></tptz:SetPresetResponse>'
+
+    def _op_GotoPreset(self, request):
+        token = _text(request, 'PresetToken')
+        if token in self.state.presets:
+            self.state.goto(self.state.presets[token])
+        return '<tptz:GotoPresetResponse/>'
+
+    def _op_GetPresets(self, request):
+        presets = ''.join(f'<tptz:Preset token="{token}"><tt:Name>{token}</tt:Name>'
+                          f'{self.__ptz_vector("PTZPosition", position)}</tptz:Preset>'
+                          for token, position in self.state.presets.items())
+        return f'<tptz:GetPresetsResponse>{presets}</tptz:GetPresetsResponse>'
+
+    def _op_GetImagingSettings(self, request):
+        return ('<timg:GetImagingSettingsResponse><timg:ImagingSettings>'
+                '<tt:Brightness>50</tt:Brightness><tt:ColorSaturation>50</tt:ColorSaturation>'
+                '<tt:Contrast>50</tt:Contrast><tt:Sharpness>50</tt:Sharpness>'
+                '</timg:ImagingSettings></timg:GetImagingSettingsResponse>')
+
+    def _op_SetImagingSettings(self, request):
+        return '<timg:SetImagingSettingsResponse/>'
+
+    def __ptz_vector(self, name, position):
+        return (f'<tt:{name}><tt:PanTilt x="{position[0]}" y="{position[1]}" space="{POSITION_SPACE}"/>'
+                f'<tt:Zoom x="{position[2]}" space="{ZOOM_SPACE}"/></tt:{name}>')
+
+    def __handler_class(self):
+        camera = self
+
+        class FakeOnvifRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                camera.on_connection()
+
+            def do_POST(self):
+                raw_body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                received_at = monotonic()
+                delay = camera.response_delay()
+                if delay:
+                    sleep(delay)
+                status, response = camera.handle(raw_body, received_at)
+                response = response.encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/soap+xml; charset=utf-8')
+                self.send_header('Content-Length', str(len(response)))
+                if self.close_connection:
+                    self.send_header('Connection', 'close')
+                self.end_headers()
+                try:
+                    self.wfile.write(response)
+                except (BrokenPipeError, ConnectionResetError):
+                    # client timed out waiting for a stalled response
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return FakeOnvifRequestHandler
+
+
+def _find(element, local_name):
+    if element is None:
+        return None
+    for child in element.iter():
+        if child.tag.split('}')[-1] == local_name:
+            return child
+    return None
+
+
+def _text(element, local_name):
+    child = _find(element, local_name)
+    return None if child is None else child.text
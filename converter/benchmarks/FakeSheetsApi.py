@@ -0,0 +1,143 @@
+"""
+In-process stub of google sheets v4 and drive v3 endpoints used by gspread. It is mounted on
+requests session as transport adapter, so gspread client works offline:
+
+    api = FakeSheetsApi()
+    api.set_sheets([('cam 1', rows), ...])
+    client = gspread.Client(None, session=api.session())
+"""
+import json
+from collections import deque
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, unquote, parse_qs
+
+import requests
+from requests.adapters import BaseAdapter
+
+SHEETS_URL = 'https://sheets.googleapis.com/'
+DRIVE_URL = 'https://www.googleapis.com/'
+
+
+class FakeSheetsApi(BaseAdapter):
+    def __init__(self, spreadsheet_name='cams', quota_per_minute=60):
+        """
+        :param quota_per_minute:
+            sheets api read requests allowed per minute of clock, exceeding ones are answered with 429
+        """
+        BaseAdapter.__init__(self)
+        self.spreadsheet_id = 'fake-spreadsheet-id'
+        self.spreadsheet_name = spreadsheet_name
+        self.quota_per_minute = quota_per_minute
+        self.clock = 0.0
+        self.sheets = []
+        self.revision = 0
+        self.requests = []
+        self.fail_next = 0
+        self.retry_after = None
+        self.__sheets_reads = deque()
+
+    def session(self):
+        session = requests.Session()
+        session.mount(SHEETS_URL, self)
+        session.mount(DRIVE_URL, self)
+        return session
+
+    def set_sheets(self, sheets):
+        """
+        :param sheets:
+            list of (title, rows), rows are lists of strings
+        """
+        self.sheets = [(title, [list(row) for row in rows]) for title, rows in sheets]
+        self.revision += 1
+
+    def set_cell(self, sheet, row, column, value):
+        self.sheets[sheet][1][row][column] = value
+        self.revision += 1
+
+    def count(self, api):
+        return sum(1 for request_api, _ in self.requests if request_api == api)
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = unquote(url.path)
+        api = 'sheets' if request.url.startswith(SHEETS_URL) else 'drive'
+        self.requests.append((api, path))
+
+        if self.fail_next:
+            self.fail_next -= 1
+            return self.__error(request, 429, 'RESOURCE_EXHAUSTED', 'Quota exceeded (forced)')
+        if api == 'sheets' and not self.__take_quota():
+            return self.__error(request, 429, 'RESOURCE_EXHAUSTED', "Quota exceeded for quota metric 'Read requests'")
+
+        if path == '/drive/v3/files':
+            return self.__json(request, {'files': [self.__file()]})
+        if path == f'/drive/v3/files/{self.spreadsheet_id}':
+            return self.__json(request, self.__file())
+        if path == f'/v4/spreadsheets/{self.spreadsheet_id}':
+            return self.__json(request, self.__spreadsheet(params.get('includeGridData') == 'true'))
+        prefix = f'/v4/spreadsheets/{self.spreadsheet_id}/values/'
+        if path.startswith(prefix):
+            return self.__values(request, path[len(prefix):])
+        return self.__error(request, 404, 'NOT_FOUND', f'{path} is not emulated')
+
+    def close(self):
+        pass
+
+    def __take_quota(self):
+        while self.__sheets_reads and self.__sheets_reads[0] <= self.clock - 60:
+            self.__sheets_reads.popleft()
+        if len(self.__sheets_reads) >= self.quota_per_minute:
+            return False
+        self.__sheets_reads.append(self.clock)
+        return True
+
+    def __file(self):
+        modified = datetime(2020, 1, 1) + timedelta(seconds=self.revision)
+        return {'id': self.spreadsheet_id, 'name': self.spreadsheet_name,
+                'createdTime': '2020-01-01T00:00:00.000Z', 'modifiedTime': modified.isoformat() + '.000Z'}
+
+    def __spreadsheet(self, include_grid_data):
+        sheets = []
+        for index, (title, rows) in enumerate(self.sheets):
+            sheet = {'properties': {
+                'sheetId': index, 'title': title, 'index': index, 'sheetType': 'GRID',
+                'gridProperties': {'rowCount': max(len(rows), 1000), 'columnCount': 26}
+            }}
+            if include_grid_data:
+                sheet['data'] = [{'rowData': [
+                    {'values': [{'formattedValue': value} if value != '' else {} for value in row]} for row in rows
+                ]}]
+            sheets.append(sheet)
+        return {'spreadsheetId': self.spreadsheet_id,
+                'properties': {'title': self.spreadsheet_name, 'locale': 'en_US', 'timeZone': 'Etc/GMT'},
+                'sheets': sheets}
+
+    def __values(self, request, cell_range):
+        title = cell_range.split('!')[0].strip("'")
+        for sheet_title, rows in self.sheets:
+            if sheet_title == title:
+                values = [list(row) for row in rows]
+                for row in values:
+                    while row and row[-1] == '':
+                        row.pop()
+                while values and not values[-1]:
+                    values.pop()
+                return self.__json(request, {'range': cell_range, 'majorDimension': 'ROWS', 'values': values})
+        return self.__error(request, 400, 'INVALID_ARGUMENT', f'Unable to parse range: {cell_range}')
+
+    def __json(self, request, body, status=200, headers=None):
+        response = requests.Response()
+        response.status_code = status
+        response.request = request
+        response.url = request.url
+        response.headers['Content-Type'] = 'application/json'
+        response.headers.update(headers or {})
+        response._content = json.dumps(body).encode()
+        response.encoding = 'utf-8'
+        return response
+
+    def __error(self, request, status, reason, message):
+        headers = {} if self.retry_after is None or status != 429 else {'Retry-After': str(self.retry_after)}
+        return self.__json(request, {'error': {'code': status, 'message': message, 'status': reason}},
+                           status, headers)
@@ -0,0 +1,233 @@
+"""
+Visca udp load generator replaying operator patterns of vMix against converter visca ports.
+Every camera is driven by a pattern - generator of (delay, datagram, onvif group, reply expected):
+
+* joystick - the stick is held in some direction for a while with the drive command repeated
+  at the controller rate and speed ramping up to the target one, then released to stop.
+  Sometimes zoom is held instead. Position inquiries are sent while the stick is idle
+* preset - preset recalls with pauses of a few seconds, sometimes preset store or home
+
+Onvif group is the onvif operation the datagram results in, drive commands and stops are one
+group as they supersede each other in the command worker queue
+"""
+import heapq
+import random
+import socket
+from select import select
+from time import monotonic
+
+DRIVE_GROUP = 'ContinuousMove/Stop'
+# onvif operations of every group, used to match requests received by fake cameras to sent datagrams
+GROUP_OPERATIONS = {
+    DRIVE_GROUP: ('ContinuousMove', 'Stop'),
+    'GotoPreset': ('GotoPreset',),
+    'SetPreset': ('SetPreset',),
+    'GotoHomePosition': ('GotoHomePosition',),
+}
+
+PAN_TILT_POS_INQ = b'\x81\x09\x06\x12\xFF'
+ZOOM_POS_INQ = b'\x81\x09\x04\x47\xFF'
+PAN_TILT_STOP = b'\x81\x01\x06\x01\x01\x01\x03\x03\xFF'
+ZOOM_STOP = b'\x81\x01\x04\x07\x00\xFF'
+HOME = b'\x81\x01\x06\x04\xFF'
+# pan and tilt direction bytes
+DIRECTIONS = [(0x03, 0x01), (0x03, 0x02), (0x01, 0x03), (0x02, 0x03),
+              (0x01, 0x01), (0x02, 0x01), (0x01, 0x02), (0x02, 0x02)]
+MAX_PAN_SPEED = 0x18
+MAX_TILT_SPEED = 0x14
+
+
+def pan_tilt_drive(direction, speed):
+    pan, tilt = direction
+    return bytes([0x81, 0x01, 0x06, 0x01, speed, min(speed, MAX_TILT_SPEED), pan, tilt, 0xFF])
+
+
+def zoom_variable(tele, speed):
+    return bytes([0x81, 0x01, 0x04, 0x07, (0x20 if tele else 0x30) | speed, 0xFF])
+
+
+def preset_recall(preset):
+    """
+    Pan-tilt absolute position with preset number as pan position, vMix way to recall presets
+    """
+    nibbles = [preset >> shift & 0x0F for shift in (12, 8, 4, 0)]
+    return bytes([0x81, 0x01, 0x06, 0x02, MAX_PAN_SPEED, MAX_TILT_SPEED, *nibbles, 0, 0, 0, 0, 0xFF])
+
+
+def joystick_pattern(rng, rate, presets):
+    interval = 1 / rate
+    while True:
+        hold = max(1, int(rng.uniform(0.3, 2.0) * rate))
+        if rng.random() < 0.2:
+            command = zoom_variable(rng.random() < 0.5, rng.randint(1, 7))
+            for _ in range(hold):
+                yield interval, command, DRIVE_GROUP, False
+            yield interval, ZOOM_STOP, DRIVE_GROUP, False
+        else:
+            direction = rng.choice(DIRECTIONS)
+            target = rng.randint(4, MAX_PAN_SPEED)
+            speed = 1
+            for _ in range(hold):
+                speed = min(target, speed + 3)
+                yield interval, pan_tilt_drive(direction, speed), DRIVE_GROUP, False
+            yield interval, PAN_TILT_STOP, DRIVE_GROUP, False
+        yield rng.uniform(0.2, 1.5), ZOOM_POS_INQ, None, True
+
+
+def preset_pattern(rng, rate, presets):
+    while True:
+        delay = rng.uniform(0.5, 3.0)
+        choice = rng.random()
+        if choice < 0.1:
+            # position inquiry stores the next preset of the client range
+            yield delay, PAN_TILT_POS_INQ, 'SetPreset', True
+        elif choice < 0.15:
+            yield delay, HOME, 'GotoHomePosition', False
+        else:
+            yield delay, preset_recall(rng.randint(1, presets)), 'GotoPreset', False
+
+
+PATTERNS = {
+    'joystick': joystick_pattern,
+    'preset': preset_pattern,
+}
+
+
+class CameraLoad:
+    """
+    Pattern datagrams of one visca port sent from a socket of its own, replies are expected in order
+    """
+    def __init__(self, port, pattern, host='127.0.0.1'):
+        self.port = port
+        self.pattern = pattern
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect((host, port))
+        self.sock.setblocking(False)
+        self.sent = 0
+        # (monotonic send time, onvif group) of datagrams resulting in onvif requests
+        self.actions = []
+        self.reply_latencies = []
+        self.waiting_replies = []
+
+    def send(self, datagram, group, expects_reply):
+        now = monotonic()
+        try:
+            self.sock.send(datagram)
+        except (BlockingIOError, ConnectionRefusedError):
+            return
+        self.sent += 1
+        if group is not None:
+            self.actions.append((now, group))
+        if expects_reply:
+            self.waiting_replies.append(now)
+
+    def receive(self):
+        try:
+            while True:
+                self.sock.recv(64)
+                if self.waiting_replies:
+                    self.reply_latencies.append(monotonic() - self.waiting_replies.pop(0))
+        except (BlockingIOError, ConnectionRefusedError):
+            pass
+
+    def result(self):
+        return {'port': self.port, 'sent': self.sent, 'actions': self.actions,
+                'reply_latencies': self.reply_latencies, 'unanswered': len(self.waiting_replies)}
+
+
+def generate_load(loads, seconds, seed=None):
+    """
+    Send pattern datagrams of all loads for given seconds from the calling thread
+
+    :param loads:
+        list of (visca port, pattern name, joystick repeat rate, presets amount)
+    :return: list of CameraLoad.result() dicts
+    """
+    rng = random.Random(seed)
+    cameras = []
+    schedule = []
+    started = monotonic()
+    for i, (port, pattern_name, rate, presets) in enumerate(loads):
+        camera = CameraLoad(port, PATTERNS[pattern_name](random.Random(rng.random()), rate, presets))
+        cameras.append(camera)
+        # operators do not start at the same moment
+        heapq.heappush(schedule, (started + rng.uniform(0, 1), i, next(camera.pattern)))
+
+    by_socket = {camera.sock: camera for camera in cameras}
+    deadline = started + seconds
+    while True:
+        due, i, (_, datagram, group, expects_reply) = schedule[0]
+        if due >= deadline:
+            break
+        timeout = due - monotonic()
+        if timeout > 0:
+            ready, _, _ = select(list(by_socket), [], [], timeout)
+            for sock in ready:
+                by_socket[sock].receive()
+            continue
+        camera = cameras[i]
+        camera.send(datagram, group, expects_reply)
+        next_step = next(camera.pattern)
+        heapq.heapreplace(schedule, (due + next_step[0], i, next_step))
+
+    # replies of the last inquiries
+    reply_deadline = monotonic() + 1
+    while monotonic() < reply_deadline and any(camera.waiting_replies for camera in cameras):
+        ready, _, _ = select(list(by_socket), [], [], 0.05)
+        for sock in ready:
+            by_socket[sock].receive()
+    for camera in cameras:
+        camera.sock.close()
+    return [camera.result() for camera in cameras]
+
+
+def wait_ready(ports, timeout=120):
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(0.2)
+    deadline = monotonic() + timeout
+    waiting = set(ports)
+    while waiting and monotonic() < deadline:
+        for port in list(waiting):
+            client.sendto(PAN_TILT_POS_INQ, ('127.0.0.1', port))
+        try:
+            while True:
+                _, (_, port) = client.recvfrom(32)
+                waiting.discard(port)
+        except socket.timeout:
+            pass
+    client.close()
+    if waiting:
+        raise RuntimeError(f'Visca ports {sorted(waiting)} are not ready in {timeout} s')
+
+
+def match_latencies(actions, timed_operations):
+    """
+    Latency of every sent datagram is the time to the first onvif request of its group received
+    by the camera after the datagram was sent. Coalesced drive commands get the latency of
+    the command which superseded them
+
+    :param actions:
+        list of (monotonic send time, onvif group)
+    :param timed_operations:
+        list of (monotonic arrival time, onvif operation name) of the camera
+    :return: (list of latencies in seconds, amount of datagrams without onvif request)
+    """
+    arrivals = {}
+    for received_at, operation in sorted(timed_operations):
+        for group, operations in GROUP_OPERATIONS.items():
+            if operation in operations:
+                arrivals.setdefault(group, []).append(received_at)
+    latencies = []
+    lost = 0
+    positions = {}
+    for sent_at, group in sorted(actions):
+        times = arrivals.get(group, [])
+        position = positions.get(group, 0)
+        while position < len(times) and times[position] < sent_at:
+            position += 1
+        positions[group] = position
+        if position < len(times):
+            latencies.append(times[position] - sent_at)
+        else:
+            lost += 1
+    return latencies, lost
@@ -0,0 +1,62 @@
+"""
+Time-to-ready of N cameras initialized one after another, with wsdl parsed for every
+camera service (previous behaviour) and with wsdl documents shared across cameras.
+Every camera is a local FakeOnvifCamera:
+
+    cd converter
+    python -m benchmarks.bench_camera_startup --cams 30
+"""
+import argparse
+from time import perf_counter
+
+from onvif import ONVIFCamera
+
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+from onvif_tools.ONVIFClientCache import clear_wsdl_documents
+from onvif_tools.ONVIFTransport import create_transport
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Onvif camera startup benchmark")
+    parser.add_argument("--cams", type=int, default=10, help="Amount of cameras")
+    return parser.parse_args()
+
+
+def init_uncached_camera(addr):
+    # the same requests ONVIFCameraControl does on init, wsdl parsed for every service
+    cam = ONVIFCamera(addr[0], addr[1], 'admin', 'password', transport=create_transport())
+    media_service = cam.create_media_service()
+    ptz_service = cam.create_ptz_service()
+    cam.create_imaging_service()
+    profile = media_service.GetProfiles()[0]
+    media_service.GetVideoSources()
+    ptz_service.GetStatus({'ProfileToken': profile.token})
+
+
+def init_cached_camera(addr):
+    ONVIFCameraControl(addr, 'admin', 'password')
+
+
+def run_variant(name, init_camera, fakes):
+    started = perf_counter()
+    first_ready = None
+    for fake in fakes:
+        init_camera(fake.addr)
+        if first_ready is None:
+            first_ready = perf_counter() - started
+    total = perf_counter() - started
+    print(f'{name:<20} first camera ready {first_ready:7.3f} s   '
+          f'all {len(fakes)} ready {total:7.3f} s   per camera {total / len(fakes):7.3f} s')
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    fakes = [FakeOnvifCamera().start() for _ in range(args.cams)]
+    try:
+        run_variant('wsdl per camera', init_uncached_camera, fakes)
+        clear_wsdl_documents()
+        run_variant('shared wsdl', init_cached_camera, fakes)
+    finally:
+        for fake in fakes:
+            fake.stop()
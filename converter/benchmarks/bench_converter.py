@@ -0,0 +1,209 @@
+"""
+End-to-end converter benchmark for N cameras, runs fully offline. Converter is started as
+`main.py --conf ...` against FakeOnvifCamera instances with response latency and jitter hosted
+in separate processes, load generator processes replay joystick and preset operator patterns
+to every visca port. Reported per camera and in total: datagrams and onvif command requests
+per second (status polls are not counted), latency from sending a datagram to the camera receiving
+its onvif request and visca reply round trip (p50/p99), converter cpu. Recalls of the preset the
+camera sits at are skipped by the converter and counted as lost. Exits with status 1 if
+a camera got no onvif requests or command p99 is over --max-p99-ms, so it can run as a CI check:
+
+    cd converter
+    python -m benchmarks.bench_converter --cams 8 --pattern mixed --seconds 10 --latency-ms 20 --jitter-ms 10
+    python -m benchmarks.bench_converter --cams 16 --converter-args=--asyncio --max-p99-ms 500
+"""
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+from multiprocessing import Process, Pipe
+from time import monotonic, sleep
+
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from benchmarks.LoadGenerator import GROUP_OPERATIONS, PATTERNS, generate_load, match_latencies, wait_ready
+from benchmarks.stats import percentile, process_tree_cpu
+
+FIRST_VISCA_PORT = 17000
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Converter end-to-end benchmark")
+    parser.add_argument("--cams", type=int, default=8, help="Amount of cameras")
+    parser.add_argument("--pattern", choices=sorted(PATTERNS) + ['mixed'], default='mixed',
+                        help="Operator pattern, mixed alternates joystick and preset cameras")
+    parser.add_argument("--seconds", type=float, default=10, help="Measured load duration")
+    parser.add_argument("--rate", type=float, default=10, help="Joystick drive command repeats per second")
+    parser.add_argument("--presets", type=int, default=16, help="Presets recalled by preset pattern")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Fake camera response latency")
+    parser.add_argument("--jitter-ms", type=float, default=10,
+                        help="Mean of exponentially distributed delay added to fake camera latency")
+    parser.add_argument("--fake-hosts", type=int, default=2, help="Amount of processes hosting fake cameras")
+    parser.add_argument("--clients", type=int, default=1, help="Amount of load generator processes")
+    parser.add_argument("--converter-args", default='',
+                        help="Extra main.py arguments, e.g. --converter-args=\"--workers 2\"")
+    parser.add_argument("--seed", type=int, help="Load patterns random seed")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if command latency p99 of any camera is over it")
+    return parser.parse_args()
+
+
+def host_fake_cams(count, latency, jitter, conn):
+    # converter is terminated with open keep-alive connections, their tracebacks are not interesting
+    sys.stderr = open(os.devnull, 'w')
+    fakes = [FakeOnvifCamera(latency=latency, jitter=jitter).start() for _ in range(count)]
+    conn.send([fake.addr for fake in fakes])
+    marks = [0] * count
+    while True:
+        request = conn.recv()
+        if request == 'stop':
+            break
+        elif request == 'mark':
+            marks = [len(fake.requests) for fake in fakes]
+            conn.send(None)
+        elif request == 'collect':
+            conn.send([fake.timed_operations(mark) for fake, mark in zip(fakes, marks)])
+    for fake in fakes:
+        fake.stop()
+
+
+def run_load(loads, seconds, seed, conn):
+    conn.send(generate_load(loads, seconds, seed))
+
+
+def call_hosts(hosts, request):
+    for conn, _ in hosts:
+        conn.send(request)
+    return [conn.recv() for conn, _ in hosts]
+
+
+def start_converter(cams, args, tmpdir):
+    config_path = os.path.join(tmpdir, 'cams.json')
+    with open(config_path, 'w') as config:
+        json.dump({'cams': cams}, config)
+    command = [sys.executable, 'main.py', '--conf', config_path, '--logdir', os.path.join(tmpdir, 'logs'),
+               '--config-cache', ''] + shlex.split(args.converter_args)
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def generate(ports, cam_patterns, args):
+    loads = [(port, pattern, args.rate, args.presets) for port, pattern in zip(ports, cam_patterns)]
+    generators = []
+    for i in range(args.clients):
+        conn, child_conn = Pipe()
+        seed = None if args.seed is None else args.seed + i
+        generator = Process(target=run_load, args=(loads[i::args.clients], args.seconds, seed, child_conn),
+                            daemon=True)
+        generator.start()
+        generators.append((conn, generator))
+    results = []
+    for conn, generator in generators:
+        results.extend(conn.recv())
+        generator.join()
+    return {result['port']: result for result in results}
+
+
+def commanded(timed_operations):
+    """
+    Onvif requests sent for visca commands, status polls and initialization requests are left out
+    """
+    operations = {operation for group in GROUP_OPERATIONS.values() for operation in group}
+    return [(received_at, operation) for received_at, operation in timed_operations if operation in operations]
+
+
+def ms(values, percent):
+    return f'{percentile(values, percent) * 1000:8.1f}' if values else f'{"-":>8}'
+
+
+def report(cams, cam_patterns, results, operations, elapsed, cpu):
+    print(f'{"camera":>8} {"pattern":>9} {"dgram/s":>8} {"onvif/s":>8} {"cmd p50":>8} {"cmd p99":>8} '
+          f'{"lost":>5} {"rtt p50":>8} {"rtt p99":>8} {"no rtt":>6}')
+    all_latencies, all_replies = [], []
+    worst_p99 = 0.0
+    idle_cameras = []
+    operations = [commanded(timed_operations) for timed_operations in operations]
+    for cam, pattern, timed_operations in zip(cams, cam_patterns, operations):
+        port = cam['visca_server_port']
+        result = results[port]
+        latencies, lost = match_latencies(result['actions'], timed_operations)
+        all_latencies.extend(latencies)
+        all_replies.extend(result['reply_latencies'])
+        if latencies:
+            worst_p99 = max(worst_p99, percentile(latencies, 99))
+        if result['actions'] and not timed_operations:
+            idle_cameras.append(port)
+        print(f'{port:>8} {pattern:>9} {result["sent"] / elapsed:8.1f} {len(timed_operations) / elapsed:8.1f} '
+              f'{ms(latencies, 50)} {ms(latencies, 99)} {lost:5} '
+              f'{ms(result["reply_latencies"], 50)} {ms(result["reply_latencies"], 99)} {result["unanswered"]:6}')
+
+    sent = sum(result['sent'] for result in results.values())
+    executed = sum(len(timed_operations) for timed_operations in operations)
+    print(f'{"total":>8} {"":>9} {sent / elapsed:8.1f} {executed / elapsed:8.1f} '
+          f'{ms(all_latencies, 50)} {ms(all_latencies, 99)} {"":5} {ms(all_replies, 50)} {ms(all_replies, 99)}')
+    if cpu is not None:
+        print(f'converter cpu {cpu / elapsed:.3f} cores, {cpu / elapsed / len(cams) * 1000:.1f} millicores per camera, '
+              f'{cpu / max(1, sent) * 1e6:.0f} us per datagram')
+    return worst_p99, idle_cameras
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    print(f'{os.cpu_count()} cpu cores, {args.cams} cameras, {args.pattern} pattern, '
+          f'fake camera latency {args.latency_ms} ms + jitter {args.jitter_ms} ms')
+
+    hosts = []
+    for i in range(args.fake_hosts):
+        conn, child_conn = Pipe()
+        process = Process(target=host_fake_cams, args=(len(range(i, args.cams, args.fake_hosts)),
+                                                       args.latency_ms / 1000, args.jitter_ms / 1000, child_conn),
+                          daemon=True)
+        process.start()
+        hosts.append((conn, process))
+    # cameras in the order of hosts, so collected operations are in the same order
+    addrs = [addr for conn, _ in hosts for addr in conn.recv()]
+
+    patterns = sorted(PATTERNS) if args.pattern == 'mixed' else [args.pattern]
+    cam_patterns = [patterns[i % len(patterns)] for i in range(args.cams)]
+    cams = [{
+        'cam_ip': ip,
+        'cam_port': port,
+        'cam_login': 'admin',
+        'cam_password': 'password',
+        'visca_server_port': FIRST_VISCA_PORT + i,
+        'preset_client_range': {'default': {'min': 1, 'max': args.presets}}
+    } for i, (ip, port) in enumerate(addrs)]
+
+    worst_p99, idle_cameras = 0.0, []
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            converter = start_converter(cams, args, tmpdir)
+            try:
+                ports = [cam['visca_server_port'] for cam in cams]
+                wait_ready(ports)
+                # requests of the readiness check are not counted
+                sleep(0.5)
+                call_hosts(hosts, 'mark')
+
+                cpu = process_tree_cpu(converter.pid)
+                started = monotonic()
+                results = generate(ports, cam_patterns, args)
+                elapsed = monotonic() - started
+                cpu = None if cpu is None else process_tree_cpu(converter.pid) - cpu
+                # onvif requests still waiting in command worker queues
+                sleep(1)
+                operations = [timed for host in call_hosts(hosts, 'collect') for timed in host]
+            finally:
+                converter.terminate()
+                converter.wait()
+
+        worst_p99, idle_cameras = report(cams, cam_patterns, results, operations, elapsed, cpu)
+    finally:
+        for conn, process in hosts:
+            conn.send('stop')
+            process.join()
+
+    if idle_cameras:
+        raise SystemExit(f'Cameras of visca ports {idle_cameras} got no onvif requests')
+    if args.max_p99_ms is not None and worst_p99 * 1000 > args.max_p99_ms:
+        raise SystemExit(f'Command latency p99 {worst_p99 * 1000:.1f} ms is over {args.max_p99_ms} ms')
@@ -0,0 +1,97 @@
+"""
+Per-datagram cost of CamCommandTranslator with logging off and with debug logging written
+synchronously by the serving thread or by the single writer thread of the queue logging mode.
+Bursts of zoom and focus position inquiries are sent to the translator of FakeOnvifCamera,
+reported are serving thread time per datagram (mean, p50 and p99 of bursts) and process cpu
+per datagram including the log writer thread:
+
+    cd converter
+    python -m benchmarks.bench_logging --bursts 2000
+"""
+import argparse
+import contextlib
+import os
+import socket
+import tempfile
+from time import perf_counter, process_time
+
+import LoggingTools
+from CamCommandTranslator import CamCommandTranslator
+from CamStorage import CamStorage
+from LoggingTools import init_logger
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from benchmarks.stats import percentile
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+
+INQUIRIES = [b'\x81\x09\x04\x47\xFF', b'\x81\x09\x04\x48\xFF']
+DEVNULL = open(os.devnull, 'w')
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Logging cost per visca datagram benchmark")
+    parser.add_argument("--bursts", type=int, default=2000, help="Bursts per variant")
+    parser.add_argument("--burst", type=int, default=16, help="Datagrams per burst")
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_variant(translator, port, logdir, debug, use_queue, args):
+    # console handler writes to devnull, it stays open until the next variant
+    with contextlib.redirect_stderr(DEVNULL):
+        init_logger(logdir, debug=debug, use_queue=use_queue)
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(1)
+
+    per_datagram = []
+    cpu_started = process_time()
+    for i in range(args.bursts):
+        for j in range(args.burst):
+            client.sendto(INQUIRIES[j % 2], ('127.0.0.1', port))
+        started = perf_counter()
+        translator.run_once()
+        per_datagram.append((perf_counter() - started) / args.burst)
+        for _ in range(args.burst):
+            client.recv(64)
+    # records left in the queue are written before cpu is taken
+    LoggingTools.stop_log_listener()
+    cpu = (process_time() - cpu_started) / (args.bursts * args.burst)
+    client.close()
+
+    mean = sum(per_datagram) / len(per_datagram)
+    return mean, percentile(per_datagram, 50), percentile(per_datagram, 99), cpu
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    if args.burst > 64:
+        raise SystemExit('--burst is limited by UdpBatchIO batch of 64 datagrams')
+
+    fake = FakeOnvifCamera().start()
+    cam = ONVIFCameraControl(fake.addr, 'admin', 'password')
+    port = free_port()
+    storage = CamStorage({fake.addr: {
+        'visca_server_port': port, 'onvif_cam_login': 'admin', 'onvif_cam_password': 'password',
+        'preset_client_range': {'default': {'min': 1, 'max': 10}}
+    }})
+    translator = CamCommandTranslator(port, fake.addr, 'admin', 'password', storage, cam=cam)
+
+    variants = [
+        ('logging off', False, False),
+        ('logging off, queue', False, True),
+        ('debug, sync', True, False),
+        ('debug, queue', True, True),
+    ]
+    print(f'{args.bursts} bursts of {args.burst} datagrams, serving thread us per datagram and process cpu us')
+    with tempfile.TemporaryDirectory() as logdir:
+        for name, debug, use_queue in variants:
+            mean, p50, p99, cpu = run_variant(translator, port, logdir, debug, use_queue, args)
+            print(f'{name:20} mean {mean * 1e6:6.1f}  p50 {p50 * 1e6:6.1f}  p99 {p99 * 1e6:6.1f}  '
+                  f'cpu {cpu * 1e6:6.1f}')
+        translator.close()
+        LoggingTools.stop_log_listener()
+    fake.stop()
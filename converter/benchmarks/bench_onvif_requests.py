@@ -0,0 +1,87 @@
+"""
+Client side cost of ONVIFCameraControl calls. Loopback: requests are answered by FakeOnvifCamera
+handlers in process without http, so requests built (and replies parsed) per second are measured
+alone. Http: calls go over the pooled keep-alive session to FakeOnvifCamera hosted in another
+process, reported are calls per second and converter process cpu per call. Camera requests per call
+show imaging setters which read settings before every set:
+
+    cd converter
+    python -m benchmarks.bench_onvif_requests --seconds 2
+"""
+import argparse
+import logging
+from multiprocessing import Process, Pipe
+from time import perf_counter, process_time
+
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+from tests.fakes import LoopbackTransport
+
+CALLS = (
+    ('move_continuous', lambda cam, i: cam.move_continuous((0.1 * (i % 10), -0.05, 0))),
+    ('goto_preset', lambda cam, i: cam.goto_preset(i % 8 + 1)),
+    ('set_preset', lambda cam, i: cam.set_preset(i % 8 + 1)),
+    ('go_home', lambda cam, i: cam.go_home()),
+    ('stop', lambda cam, i: cam.stop()),
+    ('set_brightness', lambda cam, i: cam.set_brightness(i % 100)),
+)
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Onvif request building benchmark")
+    parser.add_argument("--seconds", type=float, default=2, help="Duration of every call measurement")
+    return parser.parse_args()
+
+
+def host_fake_cam(conn):
+    with FakeOnvifCamera() as fake:
+        conn.send(fake.addr)
+        while conn.recv() != 'stop':
+            conn.send(len(fake.requests))
+
+
+def measure(cam, call, seconds, count_requests):
+    """
+    :return: (calls per second, cpu microseconds per call, camera requests per call)
+    """
+    call(cam, 0)
+    requests_before = count_requests()
+    calls = 0
+    started, cpu_started = perf_counter(), process_time()
+    while perf_counter() - started < seconds:
+        call(cam, calls)
+        calls += 1
+    elapsed, cpu = perf_counter() - started, process_time() - cpu_started
+    return calls / elapsed, cpu / calls * 1e6, (count_requests() - requests_before) / calls
+
+
+def report(title, cam, seconds, count_requests):
+    print(title)
+    print(f'{"call":>16} {"calls/s":>9} {"cpu us":>8} {"requests":>9}')
+    for name, call in CALLS:
+        rate, cpu, requests = measure(cam, call, seconds, count_requests)
+        print(f'{name:>16} {rate:9.0f} {cpu:8.1f} {requests:9.2f}')
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    fake = FakeOnvifCamera()
+    cam = ONVIFCameraControl(fake.addr, 'admin', 'password', transport=LoopbackTransport(fake))
+    report('loopback, requests built and replies parsed in process', cam, args.seconds, lambda: len(fake.requests))
+
+    conn, child_conn = Pipe()
+    host = Process(target=host_fake_cam, args=(child_conn,), daemon=True)
+    host.start()
+    addr = conn.recv()
+
+    def count_requests():
+        conn.send('count')
+        return conn.recv()
+
+    cam = ONVIFCameraControl(addr, 'admin', 'password')
+    report('http to fake camera process, cpu of this process', cam, args.seconds, count_requests)
+    cam.close()
+    conn.send('stop')
+    host.join()
@@ -0,0 +1,57 @@
+"""
+Per-call ContinuousMove latency of onvif_zeep default transport (previous behaviour,
+one requests session per service, no timeouts) against pooled keep-alive transport
+shared by all camera services. Runs against local FakeOnvifCamera:
+
+    cd converter
+    python -m benchmarks.bench_onvif_transport --calls 500 --latency-ms 2
+"""
+import argparse
+from time import perf_counter
+
+from onvif import ONVIFCamera
+
+import onvif_tools.ONVIFCameraControl  # noqa: F401 applies zeep monkey patch
+from onvif_tools.ONVIFTransport import create_transport
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from benchmarks.stats import percentile
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Onvif transport latency benchmark")
+    parser.add_argument("--calls", type=int, default=500, help="ContinuousMove calls per variant")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Fake camera response latency")
+    return parser.parse_args()
+
+
+def run_variant(name, calls, latency, transport=None, close_connection=False):
+    with FakeOnvifCamera(latency=latency) as fake:
+        cam = ONVIFCamera(fake.host, fake.port, 'admin', 'password', transport=transport)
+        ptz = cam.create_ptz_service()
+        cam.create_media_service()
+        cam.create_imaging_service()
+        profile_token = cam.media.GetProfiles()[0].token
+        if close_connection:
+            ptz.zeep_client.transport.session.headers['Connection'] = 'close'
+
+        connections_before = fake.connections
+        timings = []
+        for i in range(calls):
+            request = {'ProfileToken': profile_token,
+                       'Velocity': {'PanTilt': {'x': 0.5, 'y': 0}, 'Zoom': {'x': 0}}}
+            started = perf_counter()
+            ptz.ContinuousMove(request)
+            timings.append(perf_counter() - started)
+
+        print(f'{name:<28} mean {1000 * sum(timings) / calls:7.3f} ms   '
+              f'p50 {1000 * percentile(timings, 50):7.3f} ms   '
+              f'p99 {1000 * percentile(timings, 99):7.3f} ms   '
+              f'tcp connections {fake.connections - connections_before} (total {fake.connections})')
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    latency = args.latency_ms / 1000
+    run_variant('new connection per call', args.calls, latency, close_connection=True)
+    run_variant('onvif_zeep default', args.calls, latency)
+    run_variant('pooled shared transport', args.calls, latency, transport=create_transport())
@@ -0,0 +1,99 @@
+"""
+Preset recalls with the preset position index. FakeOnvifCamera travels to recalled presets at
+--travel-rate units per second, CamCommandTranslator recalls presets far from each other in turn
+and is asked for zoom position while the camera travels. Reported are estimated travel time against
+the measured one (the first recall uses the default travel rate, later ones the measured rate),
+zoom position answer error interpolated along the goto against the polled status one. Skipping
+recalls of the preset the camera sits at is checked by tests/test_preset_index:
+
+    cd converter
+    python -m benchmarks.bench_preset_goto --travel-rate 0.5 --latency-ms 30
+"""
+import argparse
+import logging
+from time import monotonic, sleep
+
+from PTZStatusPoller import VISCA_ZOOM_TELE, WAKE_PERIOD, visca_zoom
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from benchmarks.LoadGenerator import preset_recall
+from benchmarks.stats import percentile
+from tests.fakes import create_translator
+
+ZOOM_POS_INQ = b'\x81\x09\x04\x47\xFF'
+CLIENT = ('127.0.0.1', 50000)
+PRESETS = {
+    '1': [0.0, 0.0, 0.0],
+    '2': [0.8, 0.3, 0.6],
+    '3': [-0.6, -0.2, 1.0],
+}
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Preset position index benchmark")
+    parser.add_argument("--latency-ms", type=float, default=30, help="Fake camera response latency")
+    parser.add_argument("--travel-rate", type=float, default=0.5, help="Fake camera preset recall travel rate")
+    parser.add_argument("--recalls", type=int, default=9, help="Preset recalls in turn")
+    return parser.parse_args()
+
+
+def reply_zoom(reply):
+    return reply[2] << 12 | reply[3] << 8 | reply[4] << 4 | reply[5]
+
+
+def recall(fake, translator, token):
+    """
+    :return: (estimated travel seconds, measured travel seconds, interpolated zoom errors, polled zoom errors)
+    """
+    estimate = translator.preset_index.estimate_arrival(token)
+    start = len(fake.requests)
+    translator.handle_datagram(preset_recall(int(token)), CLIENT)
+    interpolated, polled = [], []
+    deadline = monotonic() + 30
+    while monotonic() < deadline:
+        reply = translator.handle_datagram(ZOOM_POS_INQ, CLIENT)
+        with fake.state.lock:
+            fake.state.update()
+            actual = round(fake.state.position[2] * VISCA_ZOOM_TELE)
+            arrived = fake.state.target is None
+            arrived_at = fake.state.updated_at
+        if arrived and 'GotoPreset' in fake.operations()[start:]:
+            break
+        if 'GotoPreset' in fake.operations()[start:]:
+            interpolated.append(abs(reply_zoom(reply) - actual))
+            polled.append(abs(translator.status_poller.visca_zoom_position - actual))
+        sleep(0.01)
+    sent_at = [received_at for received_at, operation in fake.timed_operations(start) if operation == 'GotoPreset']
+    # settled status completes the goto and measures travel rate
+    sleep(WAKE_PERIOD + 0.3)
+    return estimate, arrived_at - sent_at[0], interpolated, polled
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    logging.getLogger().setLevel(logging.ERROR)
+    with FakeOnvifCamera(latency=args.latency_ms / 1000, travel_rate=args.travel_rate) as fake:
+        fake.state.presets.update({token: list(position) for token, position in PRESETS.items()})
+        translator = create_translator(fake, presets=len(PRESETS))
+        index = translator.preset_index
+        while not index.loaded or translator.status_poller.status is None:
+            sleep(0.01)
+
+        print(f'{"recall":>6} {"estimate s":>10} {"travel s":>9} {"zoom error interpolated":>24} {"polled":>8}')
+        interpolated_errors, polled_errors, estimate_errors = [], [], []
+        tokens = sorted(PRESETS)
+        for i in range(args.recalls):
+            token = tokens[(i + 1) % len(tokens)]
+            estimate, travel, interpolated, polled = recall(fake, translator, token)
+            if i:
+                estimate_errors.append(abs(estimate - travel))
+            interpolated_errors.extend(interpolated)
+            polled_errors.extend(polled)
+            print(f'{token:>6} {estimate:10.2f} {travel:9.2f} {percentile(interpolated, 50):24} '
+                  f'{percentile(polled, 50):8}')
+        print(f'travel rate measured {index.travel_rate:.3f} of fake {args.travel_rate}, '
+              f'{index.gotos_measured} gotos measured, estimate error p50 after the first recall '
+              f'{percentile(estimate_errors, 50) * 1000:.0f} ms')
+        print(f'zoom answer error during goto: interpolated p50 {percentile(interpolated_errors, 50)} '
+              f'p99 {percentile(interpolated_errors, 99)}, polled status p50 {percentile(polled_errors, 50)} '
+              f'p99 {percentile(polled_errors, 99)} of {visca_zoom(1.0)}')
+        translator.close()
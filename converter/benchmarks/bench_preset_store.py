@@ -0,0 +1,63 @@
+"""
+Preset stores written behind the Pan-tiltPosInq reply. CamCommandTranslator of FakeOnvifCamera with
+response latency gets preset store inquiries (vMix stores the next preset of the client range with it).
+Reported is reply time compared to a SetPreset soap round trip. Skipping redundant stores, retries
+and the order of stores between motion commands are checked by tests/test_preset_writer:
+
+    cd converter
+    python -m benchmarks.bench_preset_store --latency-ms 30
+"""
+import argparse
+import logging
+from time import perf_counter, sleep
+
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from benchmarks.stats import percentile
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+from tests.fakes import create_translator, wait_idle
+
+PRESET_STORE = b'\x81\x09\x06\x12\xFF'
+DRIVE_LEFT = b'\x81\x01\x06\x01\x08\x08\x01\x03\xFF'
+DRIVE_RIGHT = b'\x81\x01\x06\x01\x08\x08\x02\x03\xFF'
+DRIVE_STOP = b'\x81\x01\x06\x01\x08\x08\x03\x03\xFF'
+CLIENT = ('127.0.0.1', 50000)
+PRESETS = 4
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Preset store write-behind benchmark")
+    parser.add_argument("--latency-ms", type=float, default=30, help="Fake camera response latency")
+    parser.add_argument("--stores", type=int, default=50, help="Preset stores of the reply time phase")
+    return parser.parse_args()
+
+
+def measure_reply(fake, translator, stores):
+    cam = ONVIFCameraControl(fake.addr, 'admin', 'password')
+    round_trips = []
+    for _ in range(20):
+        started = perf_counter()
+        cam.set_preset(PRESETS + 1)
+        round_trips.append(perf_counter() - started)
+    cam.close()
+    replies = []
+    for _ in range(stores):
+        # every store follows a move, so none of them is skipped
+        translator.handle_datagram(DRIVE_LEFT, CLIENT)
+        started = perf_counter()
+        translator.handle_datagram(PRESET_STORE, CLIENT)
+        replies.append(perf_counter() - started)
+        translator.handle_datagram(DRIVE_STOP, CLIENT)
+        sleep(0.01)
+    wait_idle(translator)
+    print(f'SetPreset soap round trip p50 {percentile(round_trips, 50) * 1000:.1f} ms, '
+          f'Pan-tiltPosInq reply p50 {percentile(replies, 50) * 1e6:.1f} us  '
+          f'p99 {percentile(replies, 99) * 1e6:.1f} us')
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    logging.getLogger().setLevel(logging.CRITICAL)
+    with FakeOnvifCamera(latency=args.latency_ms / 1000) as fake:
+        translator = create_translator(fake, presets=PRESETS)
+        measure_reply(fake, translator, args.stores)
+        translator.close()
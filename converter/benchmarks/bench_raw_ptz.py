@@ -0,0 +1,64 @@
+"""
+Converter cpu per call of ContinuousMove, Stop and GotoPreset sent as raw soap envelopes against zeep,
+loopback (requests answered by FakeOnvifCamera handlers in process) and over http to a fake camera
+process. Envelopes equal to zeep ones and calls against the fake camera are checked by tests/test_raw_ptz:
+
+    cd converter
+    python -m benchmarks.bench_raw_ptz --seconds 2
+"""
+import argparse
+import logging
+from multiprocessing import Process, Pipe
+
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from benchmarks.bench_onvif_requests import host_fake_cam, measure
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+from tests.fakes import LoopbackTransport
+
+CALLS = (
+    ('move_continuous', lambda cam, i: cam.move_continuous((0.1 * (i % 10), -0.05, 0))),
+    ('goto_preset', lambda cam, i: cam.goto_preset(i % 8 + 1)),
+    ('stop', lambda cam, i: cam.stop()),
+)
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Raw ptz soap envelopes benchmark")
+    parser.add_argument("--seconds", type=float, default=2, help="Duration of every call measurement")
+    return parser.parse_args()
+
+
+def report(title, cams, seconds, count_requests):
+    print(title)
+    print(f'{"call":>16} {"zeep cpu us":>12} {"raw cpu us":>11} {"calls/s zeep":>13} {"raw":>7}')
+    for name, call in CALLS:
+        (zeep_rate, zeep_cpu, _), (raw_rate, raw_cpu, _) = (measure(cam, call, seconds, count_requests)
+                                                            for cam in cams)
+        print(f'{name:>16} {zeep_cpu:12.1f} {raw_cpu:11.1f} {zeep_rate:13.0f} {raw_rate:7.0f}')
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    fake = FakeOnvifCamera()
+    cams = [ONVIFCameraControl(fake.addr, 'admin', 'password', transport=LoopbackTransport(fake), raw_ptz=raw)
+            for raw in (False, True)]
+    report('loopback, requests built and replies parsed in process', cams, args.seconds,
+           lambda: len(fake.requests))
+
+    conn, child_conn = Pipe()
+    host = Process(target=host_fake_cam, args=(child_conn,), daemon=True)
+    host.start()
+    addr = conn.recv()
+
+    def count_requests():
+        conn.send('count')
+        return conn.recv()
+
+    cams = [ONVIFCameraControl(addr, 'admin', 'password', raw_ptz=raw) for raw in (False, True)]
+    report('http to fake camera process, cpu of this process', cams, args.seconds, count_requests)
+    for cam in cams:
+        cam.close()
+    conn.send('stop')
+    host.join()
@@ -0,0 +1,143 @@
+"""
+Onvif command throughput of the whole converter for different amount of worker processes.
+Converter is started as `main.py --conf ... --workers N` (0 is single process mode),
+every camera is a local FakeOnvifCamera hosted in separate processes, load generator processes
+send joystick pan-tilt drive commands to every visca port at fixed rate. Reports onvif
+ContinuousMove/Stop calls executed per second and cpu seconds used by converter processes:
+
+    cd converter
+    python -m benchmarks.bench_shard_scaling --cams 32 --workers 0 1 2 4
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+from multiprocessing import Process, Pipe, Event
+from time import monotonic, sleep
+
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from benchmarks.LoadGenerator import wait_ready
+from benchmarks.stats import process_tree_cpu
+
+FIRST_VISCA_PORT = 16000
+DRIVE_COMMANDS = [
+    b'\x81\x01\x06\x01\x0C\x0C\x01\x03\xFF',
+    b'\x81\x01\x06\x01\x0C\x0C\x02\x03\xFF',
+    b'\x81\x01\x06\x01\x0C\x0C\x03\x03\xFF',
+]
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Converter worker processes scaling benchmark")
+    parser.add_argument("--cams", type=int, default=32, help="Amount of cameras")
+    parser.add_argument("--workers", type=int, nargs='+', default=[0, 1, 2, 4], help="Worker amounts to run")
+    parser.add_argument("--rate", type=float, default=50, help="Drive commands per second per camera")
+    parser.add_argument("--seconds", type=float, default=10, help="Measured load duration")
+    parser.add_argument("--fake-hosts", type=int, default=4, help="Amount of processes hosting fake cameras")
+    parser.add_argument("--clients", type=int, default=2, help="Amount of load generator processes")
+    return parser.parse_args()
+
+
+def host_fake_cams(count, conn):
+    # converter is terminated with open keep-alive connections, their tracebacks are not interesting
+    sys.stderr = open(os.devnull, 'w')
+    fakes = [FakeOnvifCamera().start() for _ in range(count)]
+    conn.send([fake.addr for fake in fakes])
+    while conn.recv() != 'stop':
+        conn.send(sum(op in ('ContinuousMove', 'Stop') for fake in fakes for op in fake.operations()))
+    for fake in fakes:
+        fake.stop()
+
+
+def generate_load(ports, rate, stop):
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    interval = 1 / rate
+    sent = 0
+    started = monotonic()
+    while not stop.is_set():
+        for port in ports:
+            client.sendto(DRIVE_COMMANDS[sent % len(DRIVE_COMMANDS)], ('127.0.0.1', port))
+        sent += 1
+        delay = started + sent * interval - monotonic()
+        if delay > 0:
+            sleep(delay)
+
+
+def count_executed(hosts):
+    for conn, _ in hosts:
+        conn.send('count')
+    return sum(conn.recv() for conn, _ in hosts)
+
+
+def run_variant(workers, cams, hosts, args, tmpdir):
+    config_path = os.path.join(tmpdir, f'cams_{workers}.json')
+    with open(config_path, 'w') as config:
+        json.dump({'cams': cams}, config)
+    ports = [cam['visca_server_port'] for cam in cams]
+
+    converter = subprocess.Popen([sys.executable, 'main.py', '--conf', config_path, '--workers', str(workers),
+                                  '--logdir', os.path.join(tmpdir, f'logs_{workers}'), '--config-cache', ''],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(ports)
+        stop = Event()
+        generators = [Process(target=generate_load, args=(ports[i::args.clients], args.rate, stop), daemon=True)
+                      for i in range(args.clients)]
+        for generator in generators:
+            generator.start()
+        sleep(1)
+
+        executed = count_executed(hosts)
+        cpu = process_tree_cpu(converter.pid)
+        started = monotonic()
+        sleep(args.seconds)
+        executed = count_executed(hosts) - executed
+        elapsed = monotonic() - started
+        cpu = None if cpu is None else process_tree_cpu(converter.pid) - cpu
+
+        stop.set()
+        for generator in generators:
+            generator.join()
+    finally:
+        converter.terminate()
+        converter.wait()
+
+    offered = len(ports) * args.rate
+    cpu_report = '' if cpu is None else f'   converter cpu {cpu / elapsed:5.2f} cores'
+    print(f'workers {workers:<3} offered {offered:8.0f} cmd/s   executed {executed / elapsed:8.0f} cmd/s'
+          + cpu_report)
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    print(f'{os.cpu_count()} cpu cores, {args.cams} cameras')
+
+    hosts = []
+    for i in range(args.fake_hosts):
+        conn, child_conn = Pipe()
+        process = Process(target=host_fake_cams, args=(len(range(i, args.cams, args.fake_hosts)), child_conn),
+                          daemon=True)
+        process.start()
+        hosts.append((conn, process))
+    addrs = [addr for conn, _ in hosts for addr in conn.recv()]
+
+    cams = [{
+        'cam_ip': ip,
+        'cam_port': port,
+        'cam_login': 'admin',
+        'cam_password': 'password',
+        'visca_server_port': FIRST_VISCA_PORT + i,
+        'preset_client_range': {'default': {'min': 1, 'max': 4}}
+    } for i, (ip, port) in enumerate(addrs)]
+
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for workers in args.workers:
+                run_variant(workers, cams, hosts, args, tmpdir)
+    finally:
+        for conn, process in hosts:
+            conn.send('stop')
+            process.join()
@@ -0,0 +1,74 @@
+"""
+Google sheets config fetching against FakeSheetsApi, a local stub of sheets and drive apis with
+sheets read quota. Counts api requests of the first read against the previous worksheet by worksheet
+reading and of an hour of refreshes with occasional edits. Equal cams, revision skip and quota back off
+are checked by tests/test_sheets_parser:
+
+    cd converter
+    python -m benchmarks.bench_sheets_fetch --cams 250
+"""
+import argparse
+
+import gspread
+from gspread.exceptions import APIError
+
+from CamsParser import GoogleSheetsCamsParser, parse_sheets
+from benchmarks.FakeSheetsApi import FakeSheetsApi
+from tests.fakes import REFRESH_EVERY_SEC, camera_sheet, legacy_read_config, requests_made
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Google sheets config fetching benchmark")
+    parser.add_argument("--cams", type=int, default=250, help="Amount of camera worksheets")
+    parser.add_argument("--quota", type=int, default=60, help="Sheets api read requests per minute")
+    parser.add_argument("--refreshes", type=int, default=120, help="Simulated refreshes, 30 s each")
+    parser.add_argument("--edit-every", type=int, default=10, help="Spreadsheet is edited every N refreshes")
+    return parser.parse_args()
+
+
+def count_first_read(args):
+    api = FakeSheetsApi(quota_per_minute=10 ** 9)
+    api.set_sheets([camera_sheet(i) for i in range(args.cams)])
+    client = gspread.Client(None, session=api.session())
+    spreadsheet = client.open(api.spreadsheet_name)
+
+    legacy, legacy_sheets, _ = requests_made(api, lambda: legacy_read_config(spreadsheet))
+    parser = GoogleSheetsCamsParser(None, api.spreadsheet_name, client=client)
+    cams, sheets, drive = requests_made(api, parser.read_config)
+    print(f'{len(cams)} cams, {len(legacy)} read worksheet by worksheet')
+    print(f'worksheet by worksheet refresh: {legacy_sheets} sheets requests, '
+          f'{legacy_sheets * 60 // REFRESH_EVERY_SEC} per minute with {REFRESH_EVERY_SEC} s refresh')
+    print(f'batched first read:             {sheets} sheets requests, {drive} drive requests')
+
+
+def simulate_hour(args):
+    api = FakeSheetsApi(quota_per_minute=args.quota)
+    api.set_sheets([camera_sheet(i) for i in range(args.cams)])
+    client = gspread.Client(None, session=api.session())
+    parser = GoogleSheetsCamsParser(None, api.spreadsheet_name, client=client)
+    sheets_before, drive_before = api.count('sheets'), api.count('drive')
+    stale = 0
+
+    for refresh in range(args.refreshes):
+        api.clock += REFRESH_EVERY_SEC
+        if refresh % args.edit_every == args.edit_every - 1:
+            api.set_cell(refresh % args.cams, 4, 2, str(5 + refresh))
+        if parser.read_config() != parse_sheets([rows for _, rows in api.sheets]):
+            stale += 1
+
+    sheets = api.count('sheets') - sheets_before
+    drive = api.count('drive') - drive_before
+    print(f'{args.refreshes} refreshes with edit every {args.edit_every}: {sheets} sheets requests, '
+          f'{drive} drive requests, {stale} stale refreshes with {args.quota} sheets requests per minute')
+
+    try:
+        legacy_read_config(client.open(api.spreadsheet_name))
+        print('worksheet by worksheet refresh fits in quota')
+    except APIError as e:
+        print(f'worksheet by worksheet refresh exceeds quota: {e}')
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    count_first_read(args)
+    simulate_hour(args)
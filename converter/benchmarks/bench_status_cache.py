@@ -0,0 +1,115 @@
+"""
+Zoom position inquiries answered from polled ptz status. CamCommandTranslator of FakeOnvifCamera
+with response latency gets CAM_ZoomPosInq datagrams while the fake zooms in and while it is idle.
+Reported are inquiry handling time compared to a GetStatus soap round trip, difference of the
+answered zoom position from the fake camera one, status age and GetStatus polls per second
+while moving and idle, and GetStatus polls per second while the camera is driven by a sustained stream
+of zoom datagrams, as a held joystick sends them. Answering from polled status and keeping polls within
+the moving interval are checked by tests/test_status_poller:
+
+    cd converter
+    python -m benchmarks.bench_status_cache --latency-ms 30
+"""
+import argparse
+import logging
+from time import monotonic, perf_counter, sleep
+
+from PTZStatusPoller import VISCA_ZOOM_TELE, set_poller_defaults
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from benchmarks.stats import percentile
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+from tests.fakes import create_translator
+
+ZOOM_POS_INQ = b'\x81\x09\x04\x47\xFF'
+ZOOM_TELE = b'\x81\x01\x04\x07\x21\xFF'
+ZOOM_STOP = b'\x81\x01\x04\x07\x00\xFF'
+ZOOM_TELE_SPEEDS = (b'\x81\x01\x04\x07\x20\xFF', b'\x81\x01\x04\x07\x21\xFF')
+CLIENT = ('127.0.0.1', 50000)
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Cached ptz status inquiry benchmark")
+    parser.add_argument("--latency-ms", type=float, default=30, help="Fake camera response latency")
+    parser.add_argument("--seconds", type=float, default=3, help="Duration of moving and idle phases")
+    parser.add_argument("--idle-interval", type=float, default=1.0)
+    parser.add_argument("--moving-interval", type=float, default=0.1)
+    parser.add_argument("--datagram-rate", type=float, default=50, help="Motion datagrams per second while driven")
+    return parser.parse_args()
+
+
+def reply_zoom(reply):
+    return reply[2] << 12 | reply[3] << 8 | reply[4] << 4 | reply[5]
+
+
+def sample(translator, fake, seconds):
+    """
+    :return: (inquiry handling seconds, answered zoom errors in visca units, status ages, GetStatus polls)
+    """
+    handling, errors, ages = [], [], []
+    polls = fake.operations().count('GetStatus')
+    deadline = monotonic() + seconds
+    while monotonic() < deadline:
+        started = perf_counter()
+        reply = translator.handle_datagram(ZOOM_POS_INQ, CLIENT)
+        handling.append(perf_counter() - started)
+        with fake.state.lock:
+            fake.state.update()
+            actual = round(fake.state.position[2] * VISCA_ZOOM_TELE)
+        errors.append(abs(reply_zoom(reply) - actual))
+        ages.append(translator.status_poller.age)
+        sleep(0.01)
+    return handling, errors, ages, fake.operations().count('GetStatus') - polls
+
+
+def drive(translator, fake, seconds, rate):
+    """
+    :return: GetStatus polls while motion datagrams are sent at rate per second
+    """
+    polls = fake.operations().count('GetStatus')
+    deadline = monotonic() + seconds
+    sent = 0
+    while monotonic() < deadline:
+        # zoom tele at alternating slow speeds, so the fake stays below the tele end
+        translator.handle_datagram(ZOOM_TELE_SPEEDS[sent % len(ZOOM_TELE_SPEEDS)], CLIENT)
+        sent += 1
+        sleep(1 / rate)
+    return fake.operations().count('GetStatus') - polls
+
+
+def report(name, seconds, handling, errors, ages, polls):
+    print(f'{name:<8} inquiry p50 {percentile(handling, 50) * 1e6:6.1f} us  '
+          f'p99 {percentile(handling, 99) * 1e6:6.1f} us  '
+          f'zoom error p50 {percentile(errors, 50):5}  max {max(errors):5}  '
+          f'status age p99 {percentile(ages, 99) * 1000:6.1f} ms  polls {polls / seconds:5.1f}/s')
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    logging.getLogger().setLevel(logging.ERROR)
+    set_poller_defaults(args.idle_interval, args.moving_interval)
+    with FakeOnvifCamera(latency=args.latency_ms / 1000) as fake:
+        cam = ONVIFCameraControl(fake.addr, 'admin', 'password')
+        round_trips = []
+        for _ in range(20):
+            started = perf_counter()
+            cam.get_status()
+            round_trips.append(perf_counter() - started)
+        print(f'GetStatus soap round trip p50 {percentile(round_trips, 50) * 1000:.1f} ms')
+
+        translator = create_translator(fake, cam=cam, presets=10)
+        while translator.status_poller.status is None:
+            sleep(0.01)
+        # slow enough to stay below the tele end for the whole phase
+        fake.state.position[2] = 0.0
+        translator.handle_datagram(ZOOM_TELE, CLIENT)
+        report('moving', args.seconds, *sample(translator, fake, args.seconds))
+        translator.handle_datagram(ZOOM_STOP, CLIENT)
+        sleep(2)
+        report('idle', args.seconds, *sample(translator, fake, args.seconds))
+
+        fake.state.position[2] = 0.0
+        polls = drive(translator, fake, args.seconds, args.datagram_rate) / args.seconds
+        translator.handle_datagram(ZOOM_STOP, CLIENT)
+        translator.close()
+        print(f'driven by {args.datagram_rate:.0f} datagrams/s: polls {polls:.1f}/s, '
+              f'moving interval allows {1 / args.moving_interval:.1f}/s')
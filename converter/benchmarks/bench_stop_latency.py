@@ -0,0 +1,105 @@
+"""
+Stop latency of a camera with queued motion commands. Every trial queues a preset recall and
+drive commands interleaved with preset stores (so they are not coalesced) on CamCommandWorker of
+FakeOnvifCamera and then submits stop either in arrival order on the shared connection (previous
+behaviour) or as priority command over the dedicated connection. Reported are time from stop submit
+to the camera receiving Stop, motion requests the camera received after Stop and trials which
+left the camera moving. Preempting queued motion and the watchdog re-sending stops are checked
+by tests/test_command_worker:
+
+    cd converter
+    python -m benchmarks.bench_stop_latency --trials 20 --latency-ms 50
+"""
+import argparse
+import logging
+from time import monotonic, sleep
+
+from CamCommandTranslator import DRIVE, MOTION_COMMANDS
+from CamCommandWorker import CamCommandWorker
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from benchmarks.stats import percentile
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+from onvif_tools.ONVIFTransport import set_transport_defaults
+
+MOTION_OPERATIONS = ('ContinuousMove', 'GotoPreset', 'GotoHomePosition')
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Stop priority lane benchmark")
+    parser.add_argument("--trials", type=int, default=20, help="Trials per variant")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Fake camera response latency")
+    parser.add_argument("--stop-timeout", type=float, default=0.3, help="Dedicated stop connection timeout")
+    return parser.parse_args()
+
+
+def queue_motion(worker, cam, trial):
+    worker.submit('goto_preset', cam.goto_preset, 1)
+    for i in range(3):
+        worker.submit('move_continuous', cam.move_continuous, (0.1 * (i + 1), 0, 0), coalesce_key=DRIVE)
+        worker.submit('set_preset', cam.set_preset, trial % 8 + 1)
+
+
+def submit_stop(worker, cam, priority):
+    if priority:
+        worker.submit_priority('stop', cam.stop_priority, preempts=MOTION_COMMANDS)
+    else:
+        worker.submit('stop', cam.stop, coalesce_key=DRIVE)
+
+
+def wait_idle(worker, timeout=10):
+    deadline = monotonic() + timeout
+    while worker.queue_depth and monotonic() < deadline:
+        sleep(0.01)
+    # the command taken from the queue last is still executed
+    sleep(0.3)
+
+
+def run_trial(fake, worker, cam, trial, priority):
+    """
+    :return: (seconds from stop submit to camera receiving Stop, motion requests after Stop, camera is moving)
+    """
+    start = len(fake.requests)
+    queue_motion(worker, cam, trial)
+    # the first command is in flight
+    sleep(0.01)
+    submitted_at = monotonic()
+    submit_stop(worker, cam, priority)
+    wait_idle(worker)
+    operations = fake.timed_operations(start)
+    stops = [received_at for received_at, operation in operations if operation == 'Stop']
+    if not stops:
+        return None, 0, fake.state.moving
+    stopped_at = stops[0]
+    after_stop = sum(operation in MOTION_OPERATIONS and received_at > stopped_at
+                     for received_at, operation in operations)
+    return stopped_at - submitted_at, after_stop, fake.state.moving
+
+
+def run_variant(name, priority, args):
+    with FakeOnvifCamera(latency=args.latency_ms / 1000) as fake:
+        cam = ONVIFCameraControl(fake.addr, 'admin', 'password')
+        worker = CamCommandWorker(fake.addr)
+        worker.start()
+        latencies, after_stop, moving = [], 0, 0
+        for trial in range(args.trials):
+            latency, motion_after_stop, is_moving = run_trial(fake, worker, cam, trial, priority)
+            if latency is not None:
+                latencies.append(latency)
+            after_stop += motion_after_stop
+            moving += is_moving
+        worker.stop()
+        cam.close()
+    print(f'{name:<24} stop p50 {percentile(latencies, 50) * 1000:7.1f} ms  '
+          f'p99 {percentile(latencies, 99) * 1000:7.1f} ms  '
+          f'motion after stop {after_stop:3}  left moving {moving:3} of {args.trials}')
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    # failed and re-sent stops are reported below
+    logging.getLogger().setLevel(logging.CRITICAL)
+    set_transport_defaults(priority_timeout=args.stop_timeout)
+    print(f'{args.trials} trials, fake camera latency {args.latency_ms} ms, '
+          f'queued: goto_preset and 3 x (move_continuous, set_preset)')
+    run_variant('stop in arrival order', False, args)
+    run_variant('priority stop', True, args)
@@ -0,0 +1,111 @@
+"""
+Local visca udp load generator against a server loop handling position inquiries.
+Compares select + recvfrom + sendto per datagram (previous CamCommandTranslator io)
+with UdpBatchIO draining loop and recvmmsg/sendmmsg batches. Reports handled
+datagrams per second and per cpu second of the server thread:
+
+    cd converter
+    python -m benchmarks.bench_udp_batch --seconds 3 --clients 4
+"""
+import argparse
+import socket
+from multiprocessing import Process, Event
+from select import select
+from threading import Thread
+from time import monotonic, thread_time
+
+from UdpBatchIO import UdpBatchIO, is_mmsg_available
+from visca_tools.ViscaCommandDecoder import decode_visca_command
+from visca_tools.ViscaCommandFormer import form_pan_tilt_pos_inq_reply
+
+INQUIRY = b'\x81\x09\x06\x12\xFF'
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Visca udp batch io benchmark")
+    parser.add_argument("--seconds", type=float, default=3, help="Load duration per variant")
+    parser.add_argument("--clients", type=int, default=4, help="Amount of load generator processes")
+    return parser.parse_args()
+
+
+def generate_load(port, stop):
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.setblocking(False)
+    while not stop.is_set():
+        for _ in range(64):
+            try:
+                client.sendto(INQUIRY, ('127.0.0.1', port))
+            except (BlockingIOError, InterruptedError):
+                pass
+        try:
+            while True:
+                client.recv(64)
+        except (BlockingIOError, InterruptedError):
+            pass
+
+
+def handle(message):
+    command = decode_visca_command(message)
+    return form_pan_tilt_pos_inq_reply(command['x'] + 8, 1)
+
+
+def serve_legacy(sock, running, result):
+    handled = 0
+    started = thread_time()
+    while running():
+        ready, _, _ = select([sock], [], [], 0.01)
+        if ready:
+            message, addr = sock.recvfrom(16)
+            sock.sendto(handle(message), addr)
+            handled += 1
+    result.append((handled, thread_time() - started))
+
+
+def serve_batch(io):
+    def serve(sock, running, result):
+        handled = 0
+        started = thread_time()
+        while running():
+            ready, _, _ = select([sock], [], [], 0.01)
+            if ready:
+                datagrams = io.receive()
+                io.send([(handle(message), addr) for message, addr in datagrams])
+                handled += len(datagrams)
+        result.append((handled, thread_time() - started))
+    return serve
+
+
+def run_variant(name, make_server, seconds, clients):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    serve = make_server(sock)
+
+    stop = Event()
+    generators = [Process(target=generate_load, args=(port, stop), daemon=True) for _ in range(clients)]
+    for generator in generators:
+        generator.start()
+
+    result = []
+    deadline = monotonic() + seconds
+    server = Thread(target=serve, args=(sock, lambda: monotonic() < deadline, result))
+    started = monotonic()
+    server.start()
+    server.join()
+    elapsed = monotonic() - started
+    stop.set()
+    for generator in generators:
+        generator.join()
+    sock.close()
+
+    handled, cpu = result[0]
+    print(f'{name:<22} {handled / elapsed:10.0f} datagrams/s   {handled / cpu:10.0f} datagrams per cpu second')
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    run_variant('select+recvfrom+sendto', lambda sock: serve_legacy, args.seconds, args.clients)
+    run_variant('drain loop', lambda sock: serve_batch(UdpBatchIO(sock, use_mmsg=False)), args.seconds, args.clients)
+    if is_mmsg_available():
+        run_variant('recvmmsg/sendmmsg', lambda sock: serve_batch(UdpBatchIO(sock, use_mmsg=True)),
+                    args.seconds, args.clients)
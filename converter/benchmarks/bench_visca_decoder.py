@@ -0,0 +1,52 @@
+"""
+Compares speed of decode_visca_command and classify_visca_command on joystick-like traffic.
+Both giving the same dict or both raising is checked by tests/test_visca_decoder:
+
+    cd converter
+    python -m benchmarks.bench_visca_decoder
+"""
+import argparse
+import random
+from timeit import timeit
+
+from visca_tools.ViscaCommandClassificator import classify_visca_command
+from visca_tools.ViscaCommandDecoder import decode_visca_command, _decode
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Visca decoder benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--number", type=int, default=200000, help="Decodes per timing")
+    return parser.parse_args()
+
+
+def joystick_traffic(rnd, amount=1000):
+    traffic = []
+    for _ in range(amount):
+        kind = rnd.random()
+        if kind < 0.6:
+            speed = rnd.randrange(1, 0x18)
+            direction = rnd.choice([b'\x01\x03', b'\x02\x03', b'\x03\x01', b'\x03\x02', b'\x03\x03'])
+            traffic.append(bytes([0x81, 0x01, 0x06, 0x01, speed, speed]) + direction + b'\xFF')
+        elif kind < 0.8:
+            traffic.append(bytes([0x81, 0x01, 0x04, 0x07, rnd.choice([0x00, 0x23, 0x35]), 0xFF]))
+        else:
+            traffic.append(rnd.choice([b'\x81\x09\x06\x12\xFF', b'\x81\x09\x04\x47\xFF', b'\x81\x09\x04\x48\xFF']))
+    return traffic
+
+
+def bench(classify, traffic, number):
+    repeats = number // len(traffic)
+    seconds = timeit(lambda: [classify(message) for message in traffic], number=repeats)
+    return seconds / (repeats * len(traffic))
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    traffic = joystick_traffic(random.Random(args.seed))
+    legacy = bench(classify_visca_command, traffic, args.number)
+    decoder = bench(decode_visca_command, traffic, args.number)
+    print(f'classify_visca_command {1e9 * legacy:8.1f} ns per message')
+    print(f'decode_visca_command   {1e9 * decoder:8.1f} ns per message ({legacy / decoder:.1f}x)')
+    not_memoized = bench(_decode, traffic, args.number)
+    print(f'  without memo         {1e9 * not_memoized:8.1f} ns per message ({legacy / not_memoized:.1f}x)')
@@ -0,0 +1,42 @@
+"""
+Compares speed of precomputed replies of ViscaCommandFormer with form_visca_command, their bytes
+are checked to be equal by tests/test_visca_former:
+
+    cd converter
+    python -m benchmarks.bench_visca_former
+"""
+import argparse
+from timeit import timeit
+
+from visca_tools.ViscaCommandFormer import form_visca_command, form_syntax_error, form_ack, \
+    form_pan_tilt_pos_inq_reply, form_zoom_pos_inq_reply, form_focus_pos_inq_reply
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Visca reply former benchmark")
+    parser.add_argument("--number", type=int, default=200000, help="Replies per timing")
+    return parser.parse_args()
+
+
+def bench(form, number):
+    return timeit(form, number=number) / number
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    cases = [
+        ('Syntax_Error',
+         lambda: form_visca_command({'Command': 'Syntax_Error', 'z': 9}),
+         lambda: form_syntax_error(9)),
+        ('Pan-tiltPosInq',
+         lambda: form_visca_command({'Command': 'Pan-tiltPosInq', 'wwww': 25, 'zzzz': 0, 'y': 9}),
+         lambda: form_pan_tilt_pos_inq_reply(9, 25)),
+        ('CAM_ZoomPosInq',
+         lambda: form_visca_command({'Command': 'CAM_ZoomPosInq', 'p': 0, 'q': 0, 'r': 0, 's': 0, 'y': 9}),
+         lambda: form_zoom_pos_inq_reply(9)),
+    ]
+    for name, legacy, cached in cases:
+        legacy_time = bench(legacy, args.number)
+        cached_time = bench(cached, args.number)
+        print(f'{name:<16} form_visca_command {1e9 * legacy_time:7.1f} ns   '
+              f'precomputed {1e9 * cached_time:7.1f} ns ({legacy_time / cached_time:.1f}x)')
@@ -0,0 +1,148 @@
+"""
+Replays visca datagrams recorded with --record-packets. Every recorded camera gets CamCommandTranslator
+of its own FakeOnvifCamera, received datagrams are fed to it with the recorded client addresses
+at original or accelerated speed and replies are compared to the recorded ones. Reported are
+dispatch lateness, onvif requests executed by the fake cameras and command worker stats:
+
+    cd converter
+    python -m benchmarks.replay_packets packets.bin --speed 10 --conf cams.json
+    python -m benchmarks.replay_packets packets.bin --list
+"""
+import argparse
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime
+from time import perf_counter, sleep
+
+from CamCommandTranslator import CamCommandTranslator
+from CamStorage import CamStorage
+from CamsParser import read_config
+from PacketRecorder import RECEIVED, SENT, read_records
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from benchmarks.stats import percentile
+
+DEFAULT_PRESET_RANGE = {'default': {'min': 1, 'max': 128}}
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Visca packet recording replay")
+    parser.add_argument("path", help="Packet recording file")
+    parser.add_argument("--list", action="store_true", help="Print recorded datagrams instead of replaying them")
+    parser.add_argument("--speed", type=float, default=1, help="Replay speed factor, 0 replays without pauses")
+    parser.add_argument("--conf", help="Config file the preset client ranges are taken from by visca server port")
+    parser.add_argument("--camera", type=int, action="append", metavar="VISCA_PORT",
+                        help="Replay only cameras of these visca server ports")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Fake camera response latency")
+    parser.add_argument("--drain-timeout", type=float, default=10,
+                        help="Seconds to wait for onvif commands left in worker queues after replay")
+    return parser.parse_args()
+
+
+def list_records(records):
+    for record in records:
+        arrow = '<-' if record.direction == RECEIVED else '->'
+        print(f'{datetime.fromtimestamp(record.time).isoformat()} {record.visca_port} {record.cam_addr} '
+              f'{arrow} {record.client_addr} {record.data.hex()}')
+
+
+def get_preset_ranges(conf_path):
+    if not conf_path:
+        return {}
+    return {cam['visca_server_port']: cam['preset_client_range'] for cam in read_config(conf_path).values()}
+
+
+def start_translators(visca_ports, args):
+    preset_ranges = get_preset_ranges(args.conf)
+    fakes, cams = {}, {}
+    for visca_port in visca_ports:
+        fakes[visca_port] = FakeOnvifCamera(latency=args.latency_ms / 1000).start()
+        cams[fakes[visca_port].addr] = {
+            'visca_server_port': visca_port, 'onvif_cam_login': 'admin', 'onvif_cam_password': 'password',
+            'preset_client_range': preset_ranges.get(visca_port, DEFAULT_PRESET_RANGE)
+        }
+    storage = CamStorage(cams)
+    # visca port 0, replayed datagrams are handed to the translators directly
+    translators = {visca_port: CamCommandTranslator(0, fake.addr, 'admin', 'password', storage)
+                   for visca_port, fake in fakes.items()}
+    return fakes, translators
+
+
+def replay(records, translators, speed):
+    """
+    :return: dispatch lateness of every datagram in seconds and replies by (visca port, client addr)
+    """
+    lateness = []
+    replies = defaultdict(list)
+    first_time = records[0].time
+    started = perf_counter()
+    for record in records:
+        due = (record.time - first_time) / speed if speed else 0
+        delay = due - (perf_counter() - started)
+        if delay > 0:
+            sleep(delay)
+        lateness.append(max(0.0, perf_counter() - started - due))
+        reply = translators[record.visca_port].handle_datagram(record.data, record.client_addr)
+        if reply is not None:
+            replies[record.visca_port, record.client_addr].append(reply)
+    return lateness, replies, perf_counter() - started
+
+
+def wait_workers(translators, timeout):
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline and any(translator.worker.queue_depth for translator in translators.values()):
+        sleep(0.01)
+
+
+def compare_replies(recorded, replayed):
+    equal = differ = 0
+    for key in set(recorded) | set(replayed):
+        for recorded_reply, replayed_reply in zip(recorded.get(key, []), replayed.get(key, [])):
+            if recorded_reply == replayed_reply:
+                equal += 1
+            else:
+                differ += 1
+        differ += abs(len(recorded.get(key, [])) - len(replayed.get(key, [])))
+    return equal, differ
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    # dropped commands are counted in worker stats
+    logging.getLogger().setLevel(logging.ERROR)
+    records = read_records(args.path)
+    if args.camera:
+        records = [record for record in records if record.visca_port in args.camera]
+    if args.list:
+        list_records(records)
+        raise SystemExit(0)
+
+    received = [record for record in records if record.direction == RECEIVED]
+    if not received:
+        raise SystemExit(f'No received datagrams in {args.path}')
+    recorded_replies = defaultdict(list)
+    for record in records:
+        if record.direction == SENT:
+            recorded_replies[record.visca_port, record.client_addr].append(record.data)
+
+    fakes, translators = start_translators(sorted({record.visca_port for record in received}), args)
+    try:
+        lateness, replies, duration = replay(received, translators, args.speed)
+        wait_workers(translators, args.drain_timeout)
+        equal, differ = compare_replies(recorded_replies, replies)
+
+        print(f'{len(received)} datagrams of {len(translators)} cameras recorded in '
+              f'{received[-1].time - received[0].time:.1f} s replayed in {duration:.1f} s')
+        if args.speed:
+            print(f'dispatch lateness p50 {percentile(lateness, 50) * 1000:.2f} ms, '
+                  f'p99 {percentile(lateness, 99) * 1000:.2f} ms, max {max(lateness) * 1000:.2f} ms')
+        print(f'replies equal to recorded: {equal}, differing or missing: {differ}')
+        for visca_port, translator in translators.items():
+            operations = Counter(operation for operation, _ in fakes[visca_port].requests)
+            stats = translator.worker.stats.as_dict()
+            print(f'camera {visca_port}: onvif {dict(operations)}, submitted {stats["submitted"]}, '
+                  f'executed {stats["executed"]}, coalesced {stats["coalesced"]}, dropped {stats["dropped"]}, '
+                  f'errors {stats["errors"]}, max queue depth {stats["max_queue_depth"]}')
+    finally:
+        for visca_port, translator in translators.items():
+            translator.close()
+            fakes[visca_port].stop()
@@ -0,0 +1,28 @@
+import os
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of not empty sequence
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def process_tree_cpu(pid):
+    """
+    User and system cpu seconds of process and its children, None if /proc is not available
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as stat:
+            fields = stat.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/task/{pid}/children') as children:
+            child_pids = children.read().split()
+    except OSError:
+        return None
+    seconds = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    for child_pid in child_pids:
+        child_seconds = process_tree_cpu(int(child_pid))
+        seconds += child_seconds or 0
+    return seconds
@@ -1,20 +1,41 @@
 import logging
 import argparse
+import asyncio
+import signal
+import sys
+from functools import partial
 from threading import Thread, Lock
 from time import sleep
-from copy import deepcopy
 from onvif import ONVIFError
 
 from CamCommandTranslator import CamCommandTranslator as Translator
-from CamsParser import GoogleSheetsCamsParser, read_config
-from LoggingTools import init_logger
+from CamsParser import GoogleSheetsCamsParser, LocalConfigCache, read_config
+from AsyncServer import AsyncTranslatorServer
+from CamInitializer import CamInitializer
+from CamStorage import CamStorage, get_cam_params
+from LoggingTools import init_logger, init_worker_logger
+from ShardSupervisor import ShardSupervisor, ShardCamsReceiver
+from ConfigWatcher import FileConfigWatcher
+from onvif_tools.ONVIFTransport import set_transport_defaults, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, \
+    DEFAULT_PRIORITY_TIMEOUT
+from CamCommandWorker import set_priority_defaults, DEFAULT_PRIORITY_SLO, DEFAULT_MAX_RESENDS
+from PTZStatusPoller import set_poller_defaults, DEFAULT_IDLE_INTERVAL, DEFAULT_MOVING_INTERVAL
+from PresetWriter import set_preset_defaults, DEFAULT_RETRIES as DEFAULT_PRESET_RETRIES
+from UdpBatchIO import set_batch_defaults
+from PacketRecorder import PacketRecorder, set_recorder_defaults
+from Metrics import MetricsServer
+from Tracing import TracingPlugin, get_default_tracer, set_tracing_defaults
+from onvif_tools.ONVIFClientCache import set_client_defaults
+from onvif_tools.ONVIFRawPTZ import set_raw_ptz_defaults
 
 
 logger = logging.getLogger('Server')
-lock = Lock()
 thread_pool = {}
+thread_pool_lock = Lock()
+# configured cameras without translator thread (port conflict or thread died), started on the next refresh
+pending_cams = set()
 refresh_every_sec = 30
-QUOTA_WARNING_CAM_AMOUNT = 20
+THREAD_STOP_TIMEOUT = 1
 
 
 def get_arguments():
@@ -23,26 +44,73 @@ def get_arguments():
     parser.add_argument("--json-keyfile", metavar="PATH", help="Google api json creds")
     parser.add_argument("--spreadsheet", metavar="STRING_NAME", help="Google spreadsheet name")
     parser.add_argument("--conf", metavar="PATH", help="Config file path")
+    parser.add_argument("--config-cache", metavar="PATH",
+                        help="Local copy of the last read config, cameras are started from it before config "
+                             "source is read. Camera passwords are stored in it in plain text")
+    parser.add_argument("--record-packets", metavar="PATH",
+                        help="Record received and sent visca datagrams to binary ring file, "
+                             "with --workers every worker records to PATH.<worker number>")
+    parser.add_argument("--record-capacity", type=int, default=PacketRecorder.DEFAULT_CAPACITY, metavar="RECORDS",
+                        help=f"Amount of datagrams kept in the record file (default {PacketRecorder.DEFAULT_CAPACITY}), "
+                             f"64 bytes each")
+    parser.add_argument("--metrics-port", type=int, default=0, metavar="PORT",
+                        help="Serve cameras metrics in Prometheus format on http://0.0.0.0:PORT/metrics (default 0, "
+                             "disabled), with --workers every worker serves its cameras on PORT + worker number")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="Write stage timings of sampled visca commands to PATH in Chrome trace json format, "
+                             "with --workers every worker writes PATH.<worker number>")
+    parser.add_argument("--trace-sample-rate", type=float, default=0.01, metavar="RATE",
+                        help="Part of visca datagrams traced to --trace file (default 0.01)")
+    parser.add_argument("--trace-slow-ms", type=float, default=0, metavar="MILLISECONDS",
+                        help="Log stage breakdown of visca commands taking longer than that from datagram arrival "
+                             "to the end of the onvif call (default 0, disabled)")
+    parser.add_argument("--sync-logging", action="store_true",
+                        help="Write log records from the threads logging them instead of a single writer thread")
     parser.add_argument("--logdir", metavar="DIRECTORY", help="Directory to store log files",
                         default='./logs')
     parser.add_argument("--debug", "-d", help="Show console debug messages", action="store_true")
+    parser.add_argument("--command-queue-size", metavar="SIZE", type=int, default=32,
+                        help="Max amount of onvif commands waiting for execution per camera")
+    parser.add_argument("--onvif-connect-timeout", metavar="SECONDS", type=float, default=DEFAULT_CONNECT_TIMEOUT,
+                        help="Onvif camera http connect timeout")
+    parser.add_argument("--onvif-read-timeout", metavar="SECONDS", type=float, default=DEFAULT_READ_TIMEOUT,
+                        help="Onvif camera http response timeout")
+    parser.add_argument("--onvif-raw-ptz", action="store_true",
+                        help="Send continuous moves, stops and preset recalls as pre-rendered soap envelopes "
+                             "instead of zeep, other calls are sent by zeep. Not used with --trace or "
+                             "--trace-slow-ms, traced soap calls go through zeep")
+    parser.add_argument("--stop-timeout", metavar="SECONDS", type=float, default=DEFAULT_PRIORITY_TIMEOUT,
+                        help="Connect and response timeout of the dedicated stop connection, "
+                             "stop is re-sent after it")
+    parser.add_argument("--stop-resends", metavar="AMOUNT", type=int, default=DEFAULT_MAX_RESENDS,
+                        help="How many times stop not acknowledged by camera is re-sent")
+    parser.add_argument("--stop-slo-ms", metavar="MILLISECONDS", type=float, default=DEFAULT_PRIORITY_SLO * 1000,
+                        help="Stops acknowledged by camera later than that after the visca datagram are counted "
+                             "in onvif_priority_slo_violations_total metric")
+    parser.add_argument("--status-poll-idle", metavar="SECONDS", type=float, default=DEFAULT_IDLE_INTERVAL,
+                        help="Ptz status poll interval of idle camera, zoom position inquiries are answered "
+                             "from the polled status. 0 disables polling, zoom position is answered as 0")
+    parser.add_argument("--status-poll-moving", metavar="SECONDS", type=float, default=DEFAULT_MOVING_INTERVAL,
+                        help="Ptz status poll interval while camera is moving or has just been commanded")
+    parser.add_argument("--preset-retries", metavar="AMOUNT", type=int, default=DEFAULT_PRESET_RETRIES,
+                        help="How many times failed preset store is written again, stores are written behind "
+                             "the Pan-tiltPosInq reply")
+    parser.add_argument("--init-parallel", metavar="AMOUNT", type=int, default=8,
+                        help="Max amount of cameras initialized at the same time")
+    parser.add_argument("--init-deadline", metavar="SECONDS", type=float, default=20,
+                        help="Camera initialization time limit, camera is retried later if exceeded")
+    parser.add_argument("--asyncio", help="Serve all visca ports from a single asyncio event loop "
+                                          "instead of thread per camera", action="store_true")
+    parser.add_argument("--workers", metavar="AMOUNT", type=int, default=0,
+                        help="Spread cameras across worker processes, 0 serves all cameras in this process")
+    parser.add_argument("--visca-mmsg", help="Receive and send visca datagrams with recvmmsg/sendmmsg "
+                                             "(Linux, thread per camera mode)", action="store_true")
     return parser.parse_args()
 
 
-class CamStorage:
-    def __init__(self, cams={}):
-        self.cams = deepcopy(cams)
-
-    def get_all(self):
-        return deepcopy(self.cams)
-
-    def set_cams(self, cams):
-        self.cams = deepcopy(cams)
-
-
 class TranslatorThread(Thread):
     def __init__(self, visca_server_port, onvif_cam_addr, onvif_cam_login, onvif_cam_password,
-                       cam_storage, lock=None):
+                       cam_storage, command_queue_size=32, cam=None, started_at=None):
         Thread.__init__(self)
         self.stop = False
         self.onvif_cam_addr = onvif_cam_addr
@@ -51,7 +119,7 @@ class TranslatorThread(Thread):
         self.onvif_cam_password = onvif_cam_password
         self.cam_storage = cam_storage
         self.translator = Translator(visca_server_port, onvif_cam_addr, onvif_cam_login, onvif_cam_password,
-                                cam_storage, lock)
+                                cam_storage, command_queue_size, cam, started_at)
 
     def run(self):
         while self.onvif_cam_addr in self.cam_storage.get_all() and not self.stop:
@@ -59,58 +127,186 @@ class TranslatorThread(Thread):
                 self.translator.run_once()
             except ONVIFError as e:
                 logger.error(e)
+        self.translator.close()
 
 
-def start_new_threads(cams):
-    for onvif_cam_addr in cams:
-        if onvif_cam_addr not in thread_pool:
+def start_new_threads(diff):
+    cams = cam_storage.get_all()
+    wanted = {}
+    with thread_pool_lock:
+        candidates = list(diff.added) + list(diff.changed) + sorted(pending_cams)
+        pending_cams.clear()
+        used_ports = {thread.translator.visca_port for thread in thread_pool.values()}
+        for onvif_cam_addr in candidates:
+            if onvif_cam_addr not in cams or onvif_cam_addr in thread_pool or onvif_cam_addr in wanted:
+                continue
             visca_port = cams[onvif_cam_addr]["visca_server_port"]
-            login = cams[onvif_cam_addr]["onvif_cam_login"]
-            password = cams[onvif_cam_addr]["onvif_cam_password"]
-            used_ports = {thread.translator.visca_port for thread in thread_pool.values()}
             if visca_port in used_ports:
                 logger.error(f'Port "{visca_port}" is already used. '
                              f'Please define another port in config for {onvif_cam_addr}')
+                pending_cams.add(onvif_cam_addr)
                 continue
-            try:
-                thread_pool[onvif_cam_addr] = TranslatorThread(visca_port, onvif_cam_addr, login, password,
-                                                               cam_storage)
-            except Exception as e:
-                logger.error('Check config params.' + str(e))
-                continue
-            thread_pool[onvif_cam_addr].start()
-            if len(thread_pool) == QUOTA_WARNING_CAM_AMOUNT:
-                logger.warning(f'It is not recommended to use more than {QUOTA_WARNING_CAM_AMOUNT} cams '
-                               f'due to Google api requests quotas. '
-                               f'If you are using file config, it is ok')
+            used_ports.add(visca_port)
+            wanted[onvif_cam_addr] = get_cam_params(cams[onvif_cam_addr])
+    cam_initializer.request(wanted)
+
+
+def start_translator_thread(onvif_cam_addr, params, cam, requested_at, command_queue_size=32):
+    visca_port = params["visca_server_port"]
+    login = params["onvif_cam_login"]
+    password = params["onvif_cam_password"]
+    with thread_pool_lock:
+        used_ports = {thread.translator.visca_port for thread in thread_pool.values()}
+        if onvif_cam_addr in thread_pool or visca_port in used_ports:
+            logger.error(f'Port "{visca_port}" is already used. '
+                         f'Please define another port in config for {onvif_cam_addr}')
+            pending_cams.add(onvif_cam_addr)
+            cam.close()
+            return
+        try:
+            thread_pool[onvif_cam_addr] = TranslatorThread(visca_port, onvif_cam_addr, login, password,
+                                                           cam_storage, command_queue_size=command_queue_size,
+                                                           cam=cam, started_at=requested_at)
+        except Exception as e:
+            logger.error('Check config params.' + str(e))
+            cam.close()
+            return
+        thread_pool[onvif_cam_addr].start()
 
 
 def clear_dead_threads():
-    for thread in list(thread_pool.keys()):
-        if not thread_pool[thread].is_alive():
-            thread_pool.pop(thread)
+    cams = cam_storage.get_all()
+    with thread_pool_lock:
+        for onvif_cam_addr in list(thread_pool.keys()):
+            thread = thread_pool[onvif_cam_addr]
+            if not thread.is_alive():
+                thread_pool.pop(onvif_cam_addr)
+                if not thread.stop and onvif_cam_addr in cams:
+                    logger.error(f'Service {thread.visca_server_port} -> {onvif_cam_addr} has stopped, restarting')
+                    pending_cams.add(onvif_cam_addr)
+
 
+def log_worker_stats():
+    with thread_pool_lock:
+        for onvif_cam_addr, thread in thread_pool.items():
+            logger.debug(f'{onvif_cam_addr} queue depth {thread.translator.worker.queue_depth}, '
+                         f'stats {thread.translator.worker.stats.as_dict()}')
 
-def stop_altered_threads(cams):
-    for onvif_cam_addr in cams:
-        if onvif_cam_addr in thread_pool\
-                and is_params_changed(thread_pool[onvif_cam_addr], cams[onvif_cam_addr], onvif_cam_addr):
-            thread_pool[onvif_cam_addr].stop = True
 
+def set_tracing(trace_path, args):
+    set_tracing_defaults(trace_path, args.trace_sample_rate, args.trace_slow_ms)
+    if get_default_tracer() is not None:
+        set_client_defaults(plugins=[TracingPlugin()])
 
-def is_params_changed(translator, cam, new_onvif_cam_addr):
-    return not (translator.onvif_cam_addr == new_onvif_cam_addr and
-                translator.visca_server_port == cam['visca_server_port'] and
-                translator.onvif_cam_login == cam['onvif_cam_login'] and
-                translator.onvif_cam_password == cam['onvif_cam_password'])
+
+def configure_from_args(args, shard=None):
+    """
+    Set process wide defaults from command line arguments
+    :param shard:
+        worker number in supervisor mode, packets and traces are written to PATH.<shard>.
+        Supervisor of workers (shard is None and --workers) records and traces nothing itself
+    """
+    set_transport_defaults(args.onvif_connect_timeout, args.onvif_read_timeout, priority_timeout=args.stop_timeout)
+    set_priority_defaults(args.stop_slo_ms / 1000, args.stop_resends)
+    set_poller_defaults(args.status_poll_idle, args.status_poll_moving)
+    set_preset_defaults(args.preset_retries)
+    set_raw_ptz_defaults(args.onvif_raw_ptz)
+    set_batch_defaults(args.visca_mmsg)
+    if shard is None and args.workers:
+        return
+    suffix = '' if shard is None else f'.{shard}'
+    set_recorder_defaults(args.record_packets and f'{args.record_packets}{suffix}', args.record_capacity)
+    set_tracing(args.trace and f'{args.trace}{suffix}', args)
+
+
+def get_translators():
+    with thread_pool_lock:
+        return [thread.translator for thread in thread_pool.values()]
+
+
+def start_metrics_server(port, get_served_translators):
+    if not port:
+        return None
+    try:
+        return MetricsServer(port, get_served_translators).start()
+    except OSError as e:
+        logger.error(f'Cannot serve metrics on port {port}. {e}')
+        return None
+
+
+def stop_altered_threads(diff):
+    altered = list(diff.removed) + list(diff.changed)
+    cam_initializer.cancel(altered)
+    stopped = []
+    with thread_pool_lock:
+        pending_cams.difference_update(diff.removed)
+        for onvif_cam_addr in altered:
+            if onvif_cam_addr in thread_pool:
+                thread_pool[onvif_cam_addr].stop = True
+                stopped.append(thread_pool[onvif_cam_addr])
+
+    # translator thread notices stop flag within its select timeout
+    for thread in stopped:
+        thread.join(THREAD_STOP_TIMEOUT)
+        if thread.is_alive():
+            logger.warning(f'Service {thread.visca_server_port} -> {thread.onvif_cam_addr} '
+                           f'is not stopped in {THREAD_STOP_TIMEOUT} s')
+    clear_dead_threads()
+
+
+def serve_threads(fetch_cams, args, wait_change):
+    global cam_storage, cam_initializer
+    cam_storage = CamStorage()
+    cam_initializer = CamInitializer(partial(start_translator_thread, command_queue_size=args.command_queue_size),
+                                     max_parallel=args.init_parallel, deadline=args.init_deadline)
+    cam_initializer.start()
+    start_metrics_server(args.metrics_port, get_translators)
+    cams = dict()
+
+    while True:
+        try:
+            cams = fetch_cams()
+        except Exception as e:
+            logger.error('Error occurs during cams fetching. ' + str(e))
+
+        diff = cam_storage.set_cams(cams)
+
+        stop_altered_threads(diff)
+        start_new_threads(diff)
+        log_worker_stats()
+
+        wait_change()
+
+
+def serve_asyncio(fetch_cams, args, wait_change):
+    server = AsyncTranslatorServer(CamStorage(), args.command_queue_size,
+                                   args.init_parallel, args.init_deadline)
+    start_metrics_server(args.metrics_port, server.get_translators)
+    asyncio.run(server.serve(fetch_cams, wait_change))
+
+
+def run_shard_worker(shard, cams_queue, log_queue, args):
+    """
+    Worker process of supervisor mode, serves cameras sent by supervisor to cams_queue
+    """
+    init_worker_logger(log_queue, debug=args.debug)
+    configure_from_args(args, shard)
+    if args.metrics_port:
+        args.metrics_port += shard
+    logger.info(f'Worker {shard} has been started')
+
+    receiver = ShardCamsReceiver(cams_queue, refresh_every_sec)
+    if args.asyncio:
+        serve_asyncio(receiver.fetch, args, receiver.wait)
+    else:
+        serve_threads(receiver.fetch, args, receiver.wait)
 
 
 if __name__ == '__main__':
     args = get_arguments()
-    init_logger(args.logdir, debug=args.debug)
-    cam_storage = CamStorage()
+    init_logger(args.logdir, debug=args.debug, use_queue=not args.sync_logging)
+    configure_from_args(args)
     google_sheet = None
-    cams = dict()
 
     logger.info(
         "Visca to Onvif converter has been started. "
@@ -132,26 +328,30 @@ if __name__ == '__main__':
             logger.error('Exit. No cameras json config defined')
             exit(1)
     except Exception as e:
-        logger.error("Exit. Cannot connect to google sheet with current parameters. " + str(e))
+        logger.error("Exit. Cannot load google api json keyfile. " + str(e))
         exit(1)
 
-    while True:
-        try:
-            if args.use_google:
-                cams = google_sheet.read_config()
-            else:
-                cams = read_config(args.conf)
-        except Exception as e:
-            logger.error('Error occurs during cams fetching. ' + str(e))
+    if args.use_google:
+        fetch_cams = google_sheet.read_config
+        # unchanged spreadsheet is recognized by revision, see GoogleSheetsCamsParser
+        wait_change = partial(sleep, refresh_every_sec)
+    else:
+        fetch_cams = partial(read_config, args.conf)
+        # refresh timeout retries cameras which could not be started
+        wait_change = partial(FileConfigWatcher(args.conf).wait, refresh_every_sec)
 
-        lock.acquire()
-        cam_storage.set_cams(cams)
-        lock.release()
+    if args.config_cache:
+        config_cache = LocalConfigCache(args.config_cache, fetch_cams, wait_change)
+        fetch_cams, wait_change = config_cache.fetch, config_cache.wait
 
-        stop_altered_threads(cams)
-        sleep(2)
-        clear_dead_threads()
-        sleep(2)
-        start_new_threads(cams)
-
-        sleep(refresh_every_sec)
+    if args.workers:
+        supervisor = ShardSupervisor(args.workers, run_shard_worker, (args,))
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            supervisor.serve(fetch_cams, wait_change)
+        finally:
+            supervisor.stop()
+    elif args.asyncio:
+        serve_asyncio(fetch_cams, args, wait_change)
+    else:
+        serve_threads(fetch_cams, args, wait_change)
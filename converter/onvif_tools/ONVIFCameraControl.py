@@ -3,8 +3,13 @@ import logging
 logger = logging.getLogger(__name__)
 
 import zeep
-from onvif import ONVIFCamera, ONVIFError
+from onvif import ONVIFError
 from datetime import timedelta
+from time import monotonic
+
+from onvif_tools.ONVIFTransport import create_transport, create_priority_transport
+from onvif_tools.ONVIFClientCache import CachedONVIFCamera
+from onvif_tools.ONVIFRawPTZ import create_raw_ptz_client
 
 
 # MONKEY PATCH
@@ -17,21 +22,54 @@ zeep.xsd.simple.AnySimpleType.pythonvalue = zeep_pythonvalue
 
 ONVIFCameraControlError = ONVIFError
 
+# seconds imaging settings are cached for, setters send the cached ones with one field changed
+IMAGING_SETTINGS_TTL = 30
+
 
 class ONVIFCameraControl:
-    def __init__(self, addr, login, password):
+    def __init__(self, addr, login, password, transport=None, raw_ptz=None):
+        """
+        :param transport:
+            zeep transport shared by all camera services,
+            if None then new one with persistent keep-alive session is created
+        :param raw_ptz:
+            bool, send continuous moves, stops and preset recalls as raw soap envelopes instead of zeep,
+            if None then the process wide default of set_raw_ptz_defaults is used
+        """
         self.__check_addr(addr)
         logger.debug(f'Initializing camera {addr}')
 
-        self.__cam = ONVIFCamera(addr[0], addr[1], login, password)
+        self.__transport = create_transport() if transport is None else transport
+        self.__cam = CachedONVIFCamera(addr[0], addr[1], login, password, transport=self.__transport)
 
         self.__media_service = self.__cam.create_media_service()
         self.__ptz_service = self.__cam.create_ptz_service()
         self.__imaging_service = self.__cam.create_imaging_service()
+        # stop is sent over a connection of its own, see stop_priority
+        self.__priority_transport = create_priority_transport()
+        self.__priority_ptz_service = self.__cam.create_dedicated_service('ptz', self.__priority_transport)
+        # status is polled from a thread of its own, zeep wsse token of a service is not thread safe
+        # (UsernameDigestTokenDtDiff.apply changes and restores its created time), so it gets its own service
+        self.__status_ptz_service = self.__cam.create_dedicated_service('ptz', self.__transport)
 
         self.__profile = self.__media_service.GetProfiles()[0]
         self.__video_source = self.__get_video_sources()[0]
-        self.__status = self.__ptz_service.GetStatus({'ProfileToken': self.__profile.token})
+        # requests of frequent calls are built once and only their variable fields are set on every call,
+        # the calls are executed by the command worker of the camera one at a time
+        self.__profile_request = {'ProfileToken': self.__profile.token}
+        self.__continuous_move_request = {'ProfileToken': self.__profile.token, 'Velocity': _ptz_vector()}
+        self.__goto_preset_request = {'ProfileToken': self.__profile.token, 'PresetToken': None,
+                                      'Speed': _ptz_vector()}
+        self.__set_preset_request = {'ProfileToken': self.__profile.token, 'PresetToken': None, 'PresetName': None}
+        self.__video_source_request = {'VideoSourceToken': self.__video_source.token}
+        self.__set_imaging_settings_request = {'VideoSourceToken': self.__video_source.token,
+                                               'ImagingSettings': None}
+        self.__imaging_settings = None
+        self.__imaging_settings_at = None
+        # None if disabled, zeep sends the calls then
+        self.__raw_ptz = create_raw_ptz_client(self.__ptz_service, self.__profile.token, self.__transport, raw_ptz)
+        self.__priority_raw_ptz = create_raw_ptz_client(self.__priority_ptz_service, self.__profile.token,
+                                                        self.__priority_transport, raw_ptz)
 
         logging.debug(f'Initialized camera at {addr} successfully')
 
@@ -142,11 +180,10 @@ class ONVIFCameraControl:
             string
             if None then duplicate preset_token
         """
-        logger.debug(f'Setting preset {preset_token} ({preset_name})')
-        request = self.__ptz_service.create_type('SetPreset')
-        request.ProfileToken = self.__profile.token
-        request.PresetToken = preset_token
-        request.PresetName = preset_name
+        logger.debug('Setting preset %s (%s)', preset_token, preset_name)
+        request = self.__set_preset_request
+        request['PresetToken'] = preset_token
+        request['PresetName'] = preset_name
         return self.__ptz_service.SetPreset(request)
 
     def goto_preset(self, preset_token, ptz_velocity=(1.0, 1.0, 1.0)):
@@ -157,16 +194,22 @@ class ONVIFCameraControl:
             tuple (pan,tilt,zoom) where
             pan tilt and zoom in range [0,1]
         """
-        logger.debug(f'Moving to preset {preset_token}, speed={ptz_velocity}')
-        request = self.__ptz_service.create_type('GotoPreset')
-        request.ProfileToken = self.__profile.token
-        request.PresetToken = preset_token
-        request.Speed = self.__status.Position
-        vel = request.Speed
-        vel.PanTilt.x, vel.PanTilt.y = ptz_velocity[0], ptz_velocity[1]
-        vel.Zoom.x = ptz_velocity[2]
+        logger.debug('Moving to preset %s, speed=%s', preset_token, ptz_velocity)
+        if self.__raw_ptz is not None:
+            return self.__raw_ptz.goto_preset(preset_token, ptz_velocity)
+        request = self.__goto_preset_request
+        request['PresetToken'] = preset_token
+        _set_ptz_vector(request['Speed'], ptz_velocity)
         return self.__ptz_service.GotoPreset(request)
 
+    def get_status(self):
+        """
+        :return: PTZStatus with Position (PanTilt.x, PanTilt.y, Zoom.x) and MoveStatus (PanTilt, Zoom).
+            Sent by a ptz service of its own, so it can be called from the status poller thread
+            while the command worker calls other ptz operations
+        """
+        return self.__status_ptz_service.GetStatus(self.__profile_request)
+
     def get_presets(self):
         logger.debug(f'Getting presets')
         return self.__ptz_service.GetPresets(self.__profile.token)
@@ -197,24 +240,22 @@ class ONVIFCameraControl:
             tuple (pan,tilt,zoom) where
             pan tilt and zoom in range [-1,1]
         """
-        logger.debug(f'Continuous move {ptz_velocity} {"" if timeout is None else " for " + str(timeout)}')
-        req = self.__ptz_service.create_type('ContinuousMove')
-        req.Velocity = self.__status.Position
-        req.ProfileToken = self.__profile.token
-        vel = req.Velocity
-        vel.PanTilt.x, vel.PanTilt.y = ptz_velocity[0], ptz_velocity[1]
-        vel.Zoom.x = ptz_velocity[2]
-        # force default space
-        vel.PanTilt.space, vel.Zoom.space = None, None
+        logger.debug('Continuous move %s%s', ptz_velocity, '' if timeout is None else f' for {timeout}')
+        if timeout is not None and type(timeout) is not timedelta:
+            raise TypeError('timeout parameter is of datetime.timedelta type')
+        if self.__raw_ptz is not None:
+            return self.__raw_ptz.continuous_move(ptz_velocity, timeout)
+        req = self.__continuous_move_request
+        # vector without space is in the default one
+        _set_ptz_vector(req['Velocity'], ptz_velocity)
         if timeout is not None:
-            if type(timeout) is timedelta:
-                req.Timeout = timeout
-            else:
-                raise TypeError('timeout parameter is of datetime.timedelta type')
+            req['Timeout'] = timeout
+        else:
+            req.pop('Timeout', None)
         self.__ptz_service.ContinuousMove(req)
 
     def move_absolute(self, ptz_position, ptz_velocity=(1.0, 1.0, 1.0)):
-        logger.debug(f'Absolute move {ptz_position}')
+        logger.debug('Absolute move %s', ptz_position)
         req = self.__ptz_service.create_type['AbsoluteMove']
         req.ProfileToken = self.__profile.token
         pos = req.Position
@@ -226,7 +267,7 @@ class ONVIFCameraControl:
         self.__ptz_service.AbsoluteMove(req)
 
     def move_relative(self, ptz_position, ptz_velocity=(1.0, 1.0, 1.0)):
-        logger.debug(f'Relative move {ptz_position}')
+        logger.debug('Relative move %s', ptz_position)
         req = self.__ptz_service.create_type['RelativeMove']
         req.ProfileToken = self.__profile.token
         pos = req.Translation
@@ -239,13 +280,29 @@ class ONVIFCameraControl:
 
     def go_home(self):
         logger.debug(f'Moving home')
-        req = self.__ptz_service.create_type('GotoHomePosition')
-        req.ProfileToken = self.__profile.token
-        self.__ptz_service.GotoHomePosition(req)
+        self.__ptz_service.GotoHomePosition(self.__profile_request)
 
     def stop(self):
         logger.debug(f'Stopping movement')
-        self.__ptz_service.Stop({'ProfileToken': self.__profile.token})
+        if self.__raw_ptz is not None:
+            return self.__raw_ptz.stop()
+        self.__ptz_service.Stop(self.__profile_request)
+
+    def stop_priority(self):
+        """
+        Stop sent over a dedicated connection, so it does not wait for a free connection of the shared
+        session behind calls in flight. Should be called from one thread at a time
+        """
+        logger.debug(f'Stopping movement over priority connection')
+        if self.__priority_raw_ptz is not None:
+            return self.__priority_raw_ptz.stop()
+        # profile request is never changed, so it is shared with the command worker thread
+        self.__priority_ptz_service.Stop(self.__profile_request)
+
+    def close(self):
+        logger.debug(f'Closing camera http session')
+        self.__transport.session.close()
+        self.__priority_transport.session.close()
 
     def __get_move_options(self):
         request = self.__imaging_service.create_type('GetMoveOptions')
@@ -282,16 +339,34 @@ class ONVIFCameraControl:
 
     def __set_imaging_settings(self, imaging_settings):
         logger.debug(f'Setting imaging settings')
-        request = self.__imaging_service.create_type('SetImagingSettings')
-        request.VideoSourceToken = self.__video_source.token
-        request.ImagingSettings = imaging_settings
-        return self.__imaging_service.SetImagingSettings(request)
+        request = self.__set_imaging_settings_request
+        request['ImagingSettings'] = imaging_settings
+        try:
+            return self.__imaging_service.SetImagingSettings(request)
+        except Exception:
+            # changed cached settings may be not the camera ones
+            self.__imaging_settings = None
+            raise
 
     def __get_imaging_settings(self):
-        request = self.__imaging_service.create_type('GetImagingSettings')
-        request.VideoSourceToken = self.__video_source.token
-        return self.__imaging_service.GetImagingSettings(request)
+        """
+        :return: imaging settings cached for IMAGING_SETTINGS_TTL seconds, setters change them in place
+        """
+        now = monotonic()
+        if self.__imaging_settings is None or now - self.__imaging_settings_at > IMAGING_SETTINGS_TTL:
+            self.__imaging_settings = self.__imaging_service.GetImagingSettings(self.__video_source_request)
+            self.__imaging_settings_at = now
+        return self.__imaging_settings
 
     def __check_addr(self, addr):
         if not isinstance(addr, tuple) or not isinstance(addr[0], str) or not isinstance(addr[1], int):
-            raise TypeError(f'addr must be of type tuple(str, int)')
\ No newline at end of file
+            raise TypeError(f'addr must be of type tuple(str, int)')
+
+
+def _ptz_vector():
+    return {'PanTilt': {'x': 0.0, 'y': 0.0}, 'Zoom': {'x': 0.0}}
+
+
+def _set_ptz_vector(vector, ptz):
+    vector['PanTilt']['x'], vector['PanTilt']['y'] = ptz[0], ptz[1]
+    vector['Zoom']['x'] = ptz[2]
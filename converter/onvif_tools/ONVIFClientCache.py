@@ -0,0 +1,85 @@
+import logging
+from threading import Lock
+
+from onvif import ONVIFCamera, ONVIFService
+from onvif.client import UsernameDigestTokenDtDiff
+from zeep import Client, Settings
+from zeep.transports import Transport
+from zeep.wsdl import Document
+
+logger = logging.getLogger(__name__)
+
+_documents = {}
+_documents_lock = Lock()
+_client_defaults = {
+    'plugins': []
+}
+
+
+def set_client_defaults(plugins=None):
+    """
+    Set process wide defaults of zeep clients created by CachedONVIFCamera
+    """
+    if plugins is not None:
+        _client_defaults['plugins'] = list(plugins)
+
+
+def create_settings():
+    # the same settings onvif_zeep uses for its clients
+    settings = Settings()
+    settings.strict = False
+    settings.xml_huge_tree = True
+    return settings
+
+
+def get_wsdl_document(wsdl_path):
+    """
+    Parsed wsdl document shared by all cameras in the process. Parsing takes
+    around 0.1 s per onvif service, so it is done only once for every wsdl file
+    """
+    with _documents_lock:
+        if wsdl_path not in _documents:
+            logger.debug(f'Parsing {wsdl_path}')
+            _documents[wsdl_path] = Document(wsdl_path, Transport(), settings=create_settings())
+        return _documents[wsdl_path]
+
+
+def clear_wsdl_documents():
+    with _documents_lock:
+        _documents.clear()
+
+
+class CachedONVIFCamera(ONVIFCamera):
+    """
+    ONVIFCamera which builds service clients on top of shared parsed wsdl documents
+    instead of parsing wsdl files for every service of every camera
+    """
+    def create_onvif_service(self, name, from_template=True, portType=None):
+        name = name.lower()
+        with self.services_lock:
+            service = self.__build_service(name, self.transport, portType)
+
+            self.services[name] = service
+
+            setattr(self, name, service)
+            if not self.services_template.get(name):
+                self.services_template[name] = service
+
+        return service
+
+    def create_dedicated_service(self, name, transport, portType=None):
+        """
+        Service client sending its calls over transport of its own. It is not registered
+        in camera services, so the usual service of the same name is kept
+        """
+        with self.services_lock:
+            return self.__build_service(name.lower(), transport, portType)
+
+    def __build_service(self, name, transport, portType):
+        xaddr, wsdl_file, binding_name = self.get_definition(name, portType)
+        wsse = UsernameDigestTokenDtDiff(self.user, self.passwd, dt_diff=self.dt_diff, use_digest=self.encrypt)
+        zeep_client = Client(get_wsdl_document(wsdl_file), wsse=wsse, transport=transport,
+                             plugins=_client_defaults['plugins'], settings=create_settings())
+        return ONVIFService(xaddr, self.user, self.passwd, wsdl_file, self.encrypt, self.daemon,
+                            zeep_client=zeep_client, no_cache=self.no_cache, portType=portType,
+                            dt_diff=self.dt_diff, binding_name=binding_name, transport=transport)
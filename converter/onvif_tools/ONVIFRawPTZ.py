@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from onvif import ONVIFError
+from zeep.xsd.types.builtins import Duration
+
+logger = logging.getLogger(__name__)
+
+SOAP_ENV = 'http://www.w3.org/2003/05/soap-envelope'
+WSSE = 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd'
+WSU = 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd'
+USERNAME_TOKEN_PROFILE = 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-username-token-profile-1.0'
+SOAP_MESSAGE_SECURITY = 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-soap-message-security-1.0'
+TPTZ = 'http://www.onvif.org/ver20/ptz/wsdl'
+TT = 'http://www.onvif.org/ver10/schema'
+
+OPERATIONS = ('ContinuousMove', 'Stop', 'GotoPreset')
+
+# the way zeep renders envelopes: lxml declaration, soap-env prefix and ns<N> prefixes in document order
+_ENVELOPE_START = (f"<?xml version='1.0' encoding='utf-8'?>\n"
+                   f'<soap-env:Envelope xmlns:soap-env="{SOAP_ENV}"><soap-env:Header>'
+                   f'<wsse:Security xmlns:wsse="{WSSE}"><wsse:UsernameToken>')
+_HEADER_END = '</wsse:UsernameToken></wsse:Security></soap-env:Header><soap-env:Body>'
+_ENVELOPE_END = '</soap-env:Body></soap-env:Envelope>'
+_DIGEST = f'<wsse:Password Type="{USERNAME_TOKEN_PROFILE}#PasswordDigest">'
+_NONCE = f'</wsse:Password><wsse:Nonce EncodingType="{SOAP_MESSAGE_SECURITY}#Base64Binary">'
+_CREATED = f'</wsse:Nonce><wsu:Created xmlns:wsu="{WSU}">'
+_CREATED_END = '</wsu:Created>'
+
+_FAULT = re.compile(rb'<(?:[\w.-]+:)?Fault[\s/>]')
+_FAULT_REASON = re.compile(rb'<(?:[\w.-]+:)?Text[^>]*>([^<]*)<')
+_DURATION = Duration()
+
+_raw_ptz_defaults = {
+    'enabled': False
+}
+
+
+def set_raw_ptz_defaults(enabled=None):
+    """
+    Set process wide defaults used by create_raw_ptz_client
+    :param enabled:
+        bool, send ContinuousMove, Stop and GotoPreset with RawPTZClient instead of zeep
+    """
+    if enabled is not None:
+        _raw_ptz_defaults['enabled'] = enabled
+
+
+def create_raw_ptz_client(ptz_service, profile_token, transport, enabled=None):
+    """
+    :param ptz_service:
+        onvif ptz service of the camera, the client posts to its address with its credentials
+    :param transport:
+        zeep transport the envelopes are posted with
+    :return: RawPTZClient or None if raw envelopes are disabled or zeep plugins are set, plugins
+        (e.g. tracing of soap calls) see zeep calls only
+    """
+    enabled = _raw_ptz_defaults['enabled'] if enabled is None else enabled
+    if not enabled:
+        return None
+    if ptz_service.zeep_client.plugins:
+        logger.info('Raw ptz envelopes are not used, zeep plugins are set')
+        return None
+    return RawPTZClient(ptz_service.xaddr, profile_token, ptz_service.user, ptz_service.passwd, transport,
+                        use_digest=ptz_service.encrypt, dt_diff=ptz_service.dt_diff)
+
+
+class RawPTZClient:
+    """
+    ContinuousMove, Stop and GotoPreset of one camera sent as soap envelopes rendered from pre-built
+    parts instead of zeep schema serialization. The envelopes are byte for byte the ones zeep sends for
+    the same calls (see tests/test_raw_ptz), only request fields and the ws-security UsernameToken
+    are filled per request. Replies are checked for http status and a soap fault only, bodies of
+    the three operations are empty. Any other operation is sent by zeep
+    """
+    def __init__(self, xaddr, profile_token, login, password, transport, use_digest=True, dt_diff=None):
+        """
+        :param xaddr:
+            url of the camera ptz service
+        :param transport:
+            zeep transport the envelopes are posted with, timeouts and pooled session are its ones
+        :param dt_diff:
+            datetime.timedelta added to UsernameToken created time, the one of the onvif camera
+        """
+        self.xaddr = xaddr
+        self.transport = transport
+        self.use_digest = use_digest
+        self.dt_diff = dt_diff
+        # fixed nonce (str) and created (naive utc datetime) like zeep UsernameToken ones, random and now if None
+        self.nonce = None
+        self.created = None
+        self.__password = password.encode('utf-8') if isinstance(password, str) else password
+        self.__username = f'<wsse:Username>{escape(login)}</wsse:Username>'
+        if password is not None and not use_digest:
+            self.__username += (f'<wsse:Password Type="{USERNAME_TOKEN_PROFILE}#PasswordText">'
+                                f'{escape(password)}</wsse:Password>')
+
+        profile = f'<ns0:ProfileToken>{escape(str(profile_token))}</ns0:ProfileToken>'
+        self.__continuous_move = f'<ns0:ContinuousMove xmlns:ns0="{TPTZ}">{profile}<ns0:Velocity>'
+        self.__stop = f'<ns0:Stop xmlns:ns0="{TPTZ}">{profile}</ns0:Stop>'
+        self.__goto_preset = f'<ns0:GotoPreset xmlns:ns0="{TPTZ}">{profile}<ns0:PresetToken>'
+        self.__headers = {operation: {'SOAPAction': f'"{TPTZ}/{operation}"',
+                                      'Content-Type': f'application/soap+xml; charset=utf-8; '
+                                                      f'action="{TPTZ}/{operation}"'}
+                          for operation in OPERATIONS}
+
+    def continuous_move(self, velocity, timeout=None):
+        """
+        :param velocity:
+            tuple (pan, tilt, zoom) in range [-1, 1]
+        :param timeout:
+            datetime.timedelta or None
+        """
+        self.__post('ContinuousMove', self.render_continuous_move(velocity, timeout))
+
+    def stop(self):
+        self.__post('Stop', self.render_stop())
+
+    def goto_preset(self, preset_token, speed):
+        """
+        :param speed:
+            tuple (pan, tilt, zoom) in range [0, 1]
+        """
+        self.__post('GotoPreset', self.render_goto_preset(preset_token, speed))
+
+    def render_continuous_move(self, velocity, timeout=None):
+        body = self.__continuous_move + _ptz_vector(velocity) + '</ns0:Velocity>'
+        if timeout is not None:
+            body += f'<ns0:Timeout>{_DURATION.xmlvalue(timeout)}</ns0:Timeout>'
+        return self.__envelope(body + '</ns0:ContinuousMove>')
+
+    def render_stop(self):
+        return self.__envelope(self.__stop)
+
+    def render_goto_preset(self, preset_token, speed):
+        return self.__envelope(f'{self.__goto_preset}{escape(str(preset_token))}</ns0:PresetToken>'
+                               f'<ns0:Speed>{_ptz_vector(speed)}</ns0:Speed></ns0:GotoPreset>')
+
+    def headers(self, operation):
+        """
+        :return: http headers of the operation, the ones of zeep soap 1.2 binding
+        """
+        return self.__headers[operation]
+
+    def __envelope(self, body):
+        return (_ENVELOPE_START + self.__username + self.__password_digest() + _HEADER_END
+                + body + _ENVELOPE_END).encode('utf-8')
+
+    def __password_digest(self):
+        if not self.use_digest or self.__password is None:
+            return ''
+        nonce = os.urandom(16) if self.nonce is None else self.nonce.encode('utf-8')
+        created = datetime.utcnow() if self.created is None else self.created
+        if self.dt_diff is not None:
+            created += self.dt_diff
+        # what zeep wsse utils.get_timestamp renders
+        created = created.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+        # digest = Base64 ( SHA-1 ( nonce + created + password ) )
+        digest = base64.b64encode(hashlib.sha1(nonce + created.encode('utf-8') + self.__password).digest())
+        return (f'{_DIGEST}{digest.decode("ascii")}{_NONCE}{base64.b64encode(nonce).decode("ascii")}'
+                f'{_CREATED}{created}{_CREATED_END}')
+
+    def __post(self, operation, message):
+        try:
+            response = self.transport.post(self.xaddr, message, self.__headers[operation])
+        except Exception as e:
+            raise ONVIFError(e)
+        content = response.content
+        if response.status_code == 200 and not _FAULT.search(content):
+            return
+        reason = _FAULT_REASON.search(content)
+        if reason is not None:
+            raise ONVIFError(reason.group(1).decode('utf-8', 'replace'))
+        raise ONVIFError(f'{operation}: camera returned http status {response.status_code}')
+
+
+def _ptz_vector(ptz):
+    # pan tilt and zoom are xsd:float, zeep renders them as str(value).upper()
+    return (f'<ns1:PanTilt xmlns:ns1="{TT}" x="{str(ptz[0]).upper()}" y="{str(ptz[1]).upper()}"/>'
+            f'<ns2:Zoom xmlns:ns2="{TT}" x="{str(ptz[2]).upper()}"/>')
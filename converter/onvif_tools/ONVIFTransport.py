@@ -0,0 +1,89 @@
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from zeep.transports import Transport
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECT_TIMEOUT = 3
+DEFAULT_READ_TIMEOUT = 5
+DEFAULT_POOL_SIZE = 4
+DEFAULT_PRIORITY_TIMEOUT = 1
+
+_transport_defaults = {
+    'connect_timeout': DEFAULT_CONNECT_TIMEOUT,
+    'read_timeout': DEFAULT_READ_TIMEOUT,
+    'pool_size': DEFAULT_POOL_SIZE,
+    'priority_timeout': DEFAULT_PRIORITY_TIMEOUT
+}
+
+
+def set_transport_defaults(connect_timeout=None, read_timeout=None, pool_size=None, priority_timeout=None):
+    """
+    Set process wide defaults used by create_transport and create_priority_transport
+    """
+    if connect_timeout is not None:
+        _transport_defaults['connect_timeout'] = connect_timeout
+    if read_timeout is not None:
+        _transport_defaults['read_timeout'] = read_timeout
+    if pool_size is not None:
+        _transport_defaults['pool_size'] = pool_size
+    if priority_timeout is not None:
+        _transport_defaults['priority_timeout'] = priority_timeout
+
+
+class CachedEnvironmentSession(requests.Session):
+    """
+    Session reading proxy and certificate environment variables once per url. Plain session scans
+    the whole process environment for them on every request, which costs more cpu than building
+    a soap request. Environment changes after the first request to the url are not seen
+    """
+    def __init__(self):
+        requests.Session.__init__(self)
+        self.__environment = {}
+
+    def merge_environment_settings(self, url, proxies, stream, verify, cert):
+        if proxies:
+            return requests.Session.merge_environment_settings(self, url, proxies, stream, verify, cert)
+        key = (url, stream, verify, cert)
+        settings = self.__environment.get(key)
+        if settings is None:
+            settings = requests.Session.merge_environment_settings(self, url, proxies, stream, verify, cert)
+            self.__environment[key] = settings
+        return dict(settings)
+
+
+def create_transport(connect_timeout=None, read_timeout=None, pool_size=None):
+    """
+    Create zeep transport with its own persistent keep-alive http session.
+    One transport is meant to be shared by all onvif services of one camera,
+    so devicemgmt, media, ptz and imaging calls reuse the same pooled connections
+    :param connect_timeout:
+        float seconds, tcp connect timeout of every soap call
+    :param read_timeout:
+        float seconds, response timeout of every soap call
+    :param pool_size:
+        int, max amount of kept alive connections to the camera
+    """
+    connect_timeout = _transport_defaults['connect_timeout'] if connect_timeout is None else connect_timeout
+    read_timeout = _transport_defaults['read_timeout'] if read_timeout is None else read_timeout
+    pool_size = _transport_defaults['pool_size'] if pool_size is None else pool_size
+
+    session = CachedEnvironmentSession()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return Transport(session=session, timeout=connect_timeout + read_timeout,
+                     operation_timeout=(connect_timeout, read_timeout))
+
+
+def create_priority_transport():
+    """
+    Create zeep transport of a single connection for commands which must not wait behind
+    calls in flight on the shared transport, e.g. stop. Connect and response timeouts are both
+    priority_timeout, so a command the camera does not acknowledge is known soon and can be re-sent
+    """
+    timeout = _transport_defaults['priority_timeout']
+    return create_transport(connect_timeout=timeout, read_timeout=timeout, pool_size=1)
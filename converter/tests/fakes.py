@@ -0,0 +1,92 @@
+"""
+Fakes and helpers shared by tests and benchmarks
+"""
+from time import monotonic, sleep
+
+from gspread.exceptions import WorksheetNotFound
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from zeep.transports import Transport
+
+from CamCommandTranslator import CamCommandTranslator
+from CamStorage import CamStorage
+from CamsParser import parse_sheets
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+
+# refresh interval of sheets config in seconds
+REFRESH_EVERY_SEC = 30
+
+
+class LoopbackTransport(Transport):
+    """
+    Zeep transport answering requests with FakeOnvifCamera handlers in process
+    """
+    def __init__(self, fake):
+        Transport.__init__(self)
+        self.fake = fake
+
+    def post(self, address, message, headers):
+        status, envelope = self.fake.handle(message)
+        response = Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/soap+xml; charset=utf-8'})
+        response._content = envelope.encode()
+        response.encoding = 'utf-8'
+        return response
+
+
+def camera_sheet(i):
+    rows = [
+        ['cam ip', 'cam port', 'login', 'password', 'visca port'],
+        [f'10.0.{i // 250}.{i % 250 + 1}', '80', 'admin', f'password{i}', str(10000 + i)],
+        ['', '', '', '', ''],
+        ['client', 'min', 'max', '', ''],
+        ['default', '1', '5', '', ''],
+        [f'192.168.1.{i % 200 + 10}', '10', '20', '', ''],
+    ]
+    return f'cam {i}', rows
+
+
+def legacy_read_config(spreadsheet):
+    # previous GoogleSheetsCamsParser.read_config, worksheet metadata and values request per worksheet
+    i = 0
+    sheets = []
+    while True:
+        try:
+            worksheet = spreadsheet.get_worksheet(i)
+            sheets.append(worksheet.get_all_values())
+        except (AttributeError, WorksheetNotFound):
+            break
+        i += 1
+    return parse_sheets(sheets)
+
+
+def requests_made(api, action):
+    sheets, drive = api.count('sheets'), api.count('drive')
+    result = action()
+    return result, api.count('sheets') - sheets, api.count('drive') - drive
+
+
+def create_translator(fake, cam=None, presets=4, **kwargs):
+    """
+    :param fake:
+        FakeOnvifCamera the translator sends commands to
+    :param cam:
+        ONVIFCameraControl of the fake camera, if None then it is created
+    :return: CamCommandTranslator on a free visca port, every client uses presets 1..presets
+    """
+    storage = CamStorage({fake.addr: {
+        'visca_server_port': 0, 'onvif_cam_login': 'admin', 'onvif_cam_password': 'password',
+        'preset_client_range': {'default': {'min': 1, 'max': presets}}
+    }})
+    if cam is None:
+        cam = ONVIFCameraControl(fake.addr, 'admin', 'password')
+    return CamCommandTranslator(0, fake.addr, 'admin', 'password', storage, cam=cam, **kwargs)
+
+
+def wait_idle(translator, timeout=10, settle=0.3):
+    deadline = monotonic() + timeout
+    while translator.worker.queue_depth and monotonic() < deadline:
+        sleep(0.01)
+    # the command taken from the queue last is still executed
+    sleep(settle)
@@ -0,0 +1,143 @@
+"""
+CamInitializer with a blocking create_cam: attempts past the deadline are retried but still count toward
+max_parallel until their threads return, failed cameras are retried with exponential backoff, cancelled
+cameras are closed when ready and cancel waits for a running on_ready
+"""
+from threading import Event, Timer
+from time import monotonic, sleep
+
+import pytest
+
+from CamInitializer import CamInitializer
+
+TIMEOUT = 5
+
+
+class FakeCam:
+    def __init__(self, addr):
+        self.addr = addr
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCreateCam:
+    """
+    create_cam of the initializer, calls for an address in blocked wait for its release
+    """
+    def __init__(self, blocked=(), failing=()):
+        self.calls = []
+        self.cams = []
+        self.release = {addr: Event() for addr in blocked}
+        self.failing = set(failing)
+
+    def __call__(self, addr, params):
+        self.calls.append((addr, monotonic()))
+        if addr in self.release:
+            self.release[addr].wait()
+        if addr in self.failing:
+            raise ConnectionError(f'{addr} is unreachable')
+        cam = FakeCam(addr)
+        self.cams.append(cam)
+        return cam
+
+    def called(self, addr):
+        return [called_at for called, called_at in self.calls if called == addr]
+
+
+class Ready:
+    """
+    on_ready of the initializer
+    """
+    def __init__(self):
+        self.cams = {}
+
+    def __call__(self, addr, params, cam, requested_at):
+        self.cams[addr] = cam
+
+
+def wait_for(condition, timeout=TIMEOUT):
+    deadline = monotonic() + timeout
+    while not condition() and monotonic() < deadline:
+        sleep(0.005)
+    return condition()
+
+
+def start_initializer(create_cam, on_ready, **kwargs):
+    initializer = CamInitializer(on_ready, create_cam=create_cam, **kwargs)
+    initializer.start()
+    return initializer
+
+
+def test_abandoned_attempt_counts_toward_max_parallel_until_it_returns():
+    create_cam, ready = FakeCreateCam(blocked=['hung']), Ready()
+    initializer = start_initializer(create_cam, ready, max_parallel=1, deadline=0.2, backoff_min=0.1)
+    initializer.request({'hung': {}, 'other': {}})
+    sleep(0.6)
+    # the hung attempt is past the deadline, but its thread still holds the only slot
+    assert [addr for addr, _ in create_cam.calls] == ['hung']
+
+    create_cam.release['hung'].set()
+    assert wait_for(lambda: 'other' in ready.cams and 'hung' in ready.cams)
+    # the abandoned attempt's camera is closed, the retried one is started
+    abandoned, retried = [cam for cam in create_cam.cams if cam.addr == 'hung']
+    assert abandoned.closed and not retried.closed
+    assert ready.cams['hung'] is retried
+
+
+def test_backoff_doubles_up_to_max():
+    create_cam = FakeCreateCam(failing=['broken'])
+    initializer = start_initializer(create_cam, Ready(), backoff_min=0.1, backoff_max=0.4)
+    initializer.request({'broken': {}})
+    assert wait_for(lambda: len(create_cam.called('broken')) >= 5)
+    initializer.cancel(['broken'])
+
+    called = create_cam.called('broken')
+    gaps = [b - a for a, b in zip(called, called[1:5])]
+    for gap, backoff in zip(gaps, (0.1, 0.2, 0.4, 0.4)):
+        assert backoff <= gap < backoff + 0.1
+
+
+def test_cancelled_camera_is_closed_when_ready_and_not_retried():
+    create_cam, ready = FakeCreateCam(blocked=['slow']), Ready()
+    initializer = start_initializer(create_cam, ready, backoff_min=0.1)
+    initializer.request({'slow': {}})
+    assert wait_for(lambda: create_cam.calls)
+    initializer.cancel(['slow'])
+    create_cam.release['slow'].set()
+
+    assert wait_for(lambda: create_cam.cams and create_cam.cams[0].closed)
+    sleep(0.3)
+    assert not ready.cams
+    assert len(create_cam.calls) == 1
+
+
+def test_cancel_waits_for_running_on_ready():
+    started, release = Event(), Event()
+    finished = []
+
+    def on_ready(addr, params, cam, requested_at):
+        started.set()
+        release.wait()
+        finished.append(addr)
+
+    initializer = start_initializer(FakeCreateCam(), on_ready)
+    initializer.request({'cam': {}})
+    assert started.wait(TIMEOUT)
+    Timer(0.2, release.set).start()
+    initializer.cancel(['cam'])
+    assert finished == ['cam']
+
+
+@pytest.mark.parametrize('max_parallel', [1, 3])
+def test_at_most_max_parallel_cameras_are_initialized(max_parallel):
+    addrs = [f'cam{i}' for i in range(6)]
+    create_cam, ready = FakeCreateCam(blocked=addrs), Ready()
+    initializer = start_initializer(create_cam, ready, max_parallel=max_parallel)
+    initializer.request({addr: {} for addr in addrs})
+    sleep(0.2)
+    assert len(create_cam.calls) == max_parallel
+    for addr in addrs:
+        create_cam.release[addr].set()
+    assert wait_for(lambda: len(ready.cams) == len(addrs))
@@ -0,0 +1,74 @@
+"""
+CamStorage versions and diff_cams: added, removed and changed cameras, a preset client range change
+alone does not restart the camera, unchanged config is not published and snapshots are immutable
+"""
+import pytest
+
+from CamStorage import CamStorage, diff_cams
+
+
+def cam(port, password='password', max_preset=10):
+    return {
+        'visca_server_port': port, 'onvif_cam_login': 'admin', 'onvif_cam_password': password,
+        'preset_client_range': {'default': {'min': 1, 'max': max_preset}}
+    }
+
+
+CAMS = {'10.0.0.1': cam(10001), '10.0.0.2': cam(10002), '10.0.0.3': cam(10003)}
+
+
+def test_added_removed_and_changed():
+    new = dict(CAMS, **{'10.0.0.2': cam(10002, password='secret'), '10.0.0.4': cam(10004)})
+    del new['10.0.0.3']
+    diff = diff_cams(CAMS, new, 2)
+
+    assert diff.version == 2
+    assert list(diff.added) == ['10.0.0.4']
+    assert list(diff.removed) == ['10.0.0.3']
+    assert diff.removed['10.0.0.3']['visca_server_port'] == 10003
+    assert list(diff.changed) == ['10.0.0.2']
+    assert diff.changed['10.0.0.2']['onvif_cam_password'] == 'secret'
+    assert not diff.preset_ranges_changed
+    assert not diff.is_empty()
+
+
+def test_preset_client_range_change_does_not_restart_camera():
+    new = dict(CAMS, **{'10.0.0.1': cam(10001, max_preset=20)})
+    diff = diff_cams(CAMS, new)
+
+    assert not (diff.added or diff.removed or diff.changed)
+    assert list(diff.preset_ranges_changed) == ['10.0.0.1']
+    assert diff.preset_ranges_changed['10.0.0.1']['preset_client_range']['default']['max'] == 20
+
+
+def test_versions_are_published_on_change_only():
+    storage = CamStorage(CAMS)
+    first = storage.get_snapshot()
+    assert first.version == 0
+
+    diff = storage.set_cams({key: dict(value) for key, value in CAMS.items()})
+    assert diff.is_empty() and diff.version == 0
+    assert storage.get_snapshot() is first
+
+    diff = storage.set_cams(dict(CAMS, **{'10.0.0.4': cam(10004)}))
+    assert diff.version == 1 and list(diff.added) == ['10.0.0.4']
+    assert storage.get_snapshot().version == 1
+    assert '10.0.0.4' not in first.cams
+
+
+def test_snapshot_is_immutable():
+    source = {'10.0.0.1': cam(10001)}
+    storage = CamStorage(source)
+    cams = storage.get_all()
+    # later changes of the source dict are not seen by readers
+    source['10.0.0.1']['visca_server_port'] = 1
+    source['10.0.0.2'] = cam(10002)
+    assert cams['10.0.0.1']['visca_server_port'] == 10001
+    assert '10.0.0.2' not in cams
+
+    with pytest.raises(TypeError):
+        cams['10.0.0.2'] = cam(10002)
+    with pytest.raises(TypeError):
+        cams['10.0.0.1']['visca_server_port'] = 1
+    with pytest.raises(TypeError):
+        cams['10.0.0.1']['preset_client_range']['default']['max'] = 1
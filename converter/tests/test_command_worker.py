@@ -0,0 +1,272 @@
+"""
+CamCommandWorker order of calls: waiting commands coalesced at the queue tail only, full queue dropping.
+Priority stop against FakeOnvifCamera: stop overtakes and preempts queued motion, the watchdog re-sends
+a stop not acknowledged or overtaken by a move in flight unless a newer move superseded it
+"""
+from threading import Event
+from time import monotonic, sleep
+
+import pytest
+
+from CamCommandTranslator import DRIVE, MOTION_COMMANDS
+from CamCommandWorker import CamCommandWorker
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+from onvif_tools.ONVIFTransport import DEFAULT_PRIORITY_TIMEOUT, set_transport_defaults
+
+LATENCY = 0.02
+PRIORITY_TIMEOUT = 0.2
+MOTION_OPERATIONS = ('ContinuousMove', 'GotoPreset', 'GotoHomePosition')
+
+
+@pytest.fixture
+def camera():
+    set_transport_defaults(priority_timeout=PRIORITY_TIMEOUT)
+    with FakeOnvifCamera(latency=LATENCY) as fake:
+        cam = ONVIFCameraControl(fake.addr, 'admin', 'password')
+        worker = CamCommandWorker(fake.addr)
+        worker.start()
+        yield fake, cam, worker
+        worker.stop()
+        cam.close()
+    set_transport_defaults(priority_timeout=DEFAULT_PRIORITY_TIMEOUT)
+
+
+@pytest.fixture
+def held_worker():
+    """
+    :return: (worker, calls in the order the worker made them, event releasing the call the worker is held by)
+    """
+    worker = CamCommandWorker('test', max_queue_size=4)
+    worker.start()
+    release = Event()
+    worker.submit('hold', release.wait)
+    while worker.queue_depth:
+        sleep(0.001)
+    calls = []
+    yield worker, calls, release
+    release.set()
+    worker.stop()
+
+
+def run_queued(worker, release):
+    finished = Event()
+    release.set()
+    # waits for the whole queue, finish is not coalesced with anything
+    while not worker.submit('finish', finished.set):
+        sleep(0.001)
+    assert finished.wait(5)
+
+
+def submit_move(worker, calls, velocity):
+    return worker.submit('move_continuous', calls.append, ('move', velocity), coalesce_key=DRIVE)
+
+
+def submit_arrival_order_stop(worker, calls):
+    return worker.submit('stop', calls.append, ('stop', None), coalesce_key=DRIVE)
+
+
+def test_waiting_moves_and_zooms_are_coalesced_to_the_latest(held_worker):
+    worker, calls, release = held_worker
+    submit_move(worker, calls, (0.5, 0, 0))
+    submit_move(worker, calls, (0, 0, 0.25))
+    submit_move(worker, calls, (0.1, 0, 0))
+    run_queued(worker, release)
+    assert calls == [('move', (0.1, 0, 0))]
+    assert worker.stats.as_dict()['commands']['move_continuous']['coalesced'] == 2
+
+
+def test_stop_replaces_waiting_move_and_is_not_reordered(held_worker):
+    worker, calls, release = held_worker
+    submit_move(worker, calls, (0.5, 0, 0))
+    worker.submit('set_preset', calls.append, ('set_preset', 1))
+    submit_move(worker, calls, (0.1, 0, 0))
+    submit_arrival_order_stop(worker, calls)
+    run_queued(worker, release)
+    # only the tail is replaced, the move before the preset store is kept ahead of the stop
+    assert calls == [('move', (0.5, 0, 0)), ('set_preset', 1), ('stop', None)]
+    assert worker.stats.as_dict()['commands']['move_continuous']['coalesced'] == 1
+
+
+def test_move_after_stop_runs_after_it(held_worker):
+    worker, calls, release = held_worker
+    submit_arrival_order_stop(worker, calls)
+    worker.submit('set_preset', calls.append, ('set_preset', 1))
+    submit_move(worker, calls, (0.5, 0, 0))
+    run_queued(worker, release)
+    assert calls == [('stop', None), ('set_preset', 1), ('move', (0.5, 0, 0))]
+
+
+def test_priority_stop_runs_before_later_moves_only(held_worker):
+    worker, calls, release = held_worker
+    submit_move(worker, calls, (0.5, 0, 0))
+    worker.submit_priority('stop', calls.append, ('stop', None), preempts=MOTION_COMMANDS)
+    submit_move(worker, calls, (0.1, 0, 0))
+    run_queued(worker, release)
+    assert calls == [('stop', None), ('move', (0.1, 0, 0))]
+    assert worker.stats.as_dict()['commands']['move_continuous']['preempted'] == 1
+
+
+def test_started_command_is_not_replaced():
+    worker = CamCommandWorker('test')
+    worker.start()
+    calls, release = [], Event()
+
+    def move(velocity):
+        calls.append(('move', velocity))
+        release.wait()
+
+    worker.submit('move_continuous', move, (0.5, 0, 0), coalesce_key=DRIVE)
+    while not calls:
+        sleep(0.001)
+    submit_move(worker, calls, (0.1, 0, 0))
+    run_queued(worker, release)
+    worker.stop()
+    assert calls == [('move', (0.5, 0, 0)), ('move', (0.1, 0, 0))]
+    assert worker.stats.as_dict()['coalesced'] == 0
+
+
+def test_full_queue_drops_and_counts(held_worker):
+    worker, calls, release = held_worker
+    for preset in range(1, 5):
+        assert worker.submit('set_preset', calls.append, ('set_preset', preset))
+    assert not worker.submit('goto_preset', calls.append, ('goto_preset', 1))
+    stats = worker.stats.as_dict()
+    assert stats['dropped'] == 1 and stats['commands']['goto_preset']['dropped'] == 1
+    run_queued(worker, release)
+    assert calls == [('set_preset', preset) for preset in range(1, 5)]
+
+
+def test_stop_drops_waiting_commands_only(held_worker):
+    worker, calls, release = held_worker
+    for preset in range(1, 4):
+        worker.submit('set_preset', calls.append, ('set_preset', preset))
+    worker.submit_priority('stop', calls.append, ('stop', None), preempts=MOTION_COMMANDS)
+    worker.stop(discard_waiting=True)
+    release.set()
+    worker.join(5)
+    assert not worker.is_alive()
+    # waiting priority stop is still sent
+    assert calls == [('stop', None)]
+    assert worker.stats.as_dict()['commands']['set_preset']['dropped'] == 3
+
+
+def submit_stop(worker, cam):
+    worker.submit_priority('stop', cam.stop_priority, preempts=MOTION_COMMANDS)
+
+
+def wait_idle(worker, timeout=10):
+    deadline = monotonic() + timeout
+    while worker.queue_depth and monotonic() < deadline:
+        sleep(0.01)
+    # the command taken from the queue last is still executed
+    sleep(0.3)
+
+
+def wait_stopped(fake, timeout=10):
+    deadline = monotonic() + timeout
+    while fake.state.moving and monotonic() < deadline:
+        sleep(0.005)
+
+
+def test_priority_stop_overtakes_queued_motion(camera):
+    fake, cam, worker = camera
+    start = len(fake.requests)
+    worker.submit('goto_preset', cam.goto_preset, 1)
+    for i in range(3):
+        worker.submit('move_continuous', cam.move_continuous, (0.1 * (i + 1), 0, 0), coalesce_key=DRIVE)
+        worker.submit('set_preset', cam.set_preset, i + 1)
+    # the preset recall is in flight
+    sleep(0.01)
+    submit_stop(worker, cam)
+    wait_idle(worker)
+
+    operations = [operation for _, operation in fake.timed_operations(start)]
+    stop = operations.index('Stop')
+    assert not any(operation in MOTION_OPERATIONS for operation in operations[stop:])
+    # stop is not queued behind the preset stores
+    assert stop < len(operations) - 1
+    assert worker.stats.as_dict()['commands']['move_continuous']['preempted'] == 3
+    assert not fake.state.moving
+
+
+def test_stop_cancels_waiting_moves_and_recalls(camera):
+    fake, cam, worker = camera
+    release = Event()
+    worker.submit('hold', release.wait)
+    sleep(0.01)
+    start = len(fake.requests)
+    worker.submit('goto_preset', cam.goto_preset, 1)
+    worker.submit('move_continuous', cam.move_continuous, (0.5, 0, 0), coalesce_key=DRIVE)
+    worker.submit('set_preset', cam.set_preset, 2)
+    worker.submit('go_home', cam.go_home)
+    submit_stop(worker, cam)
+    sleep(0.1)
+    release.set()
+    wait_idle(worker)
+
+    assert fake.operations()[start:] == ['Stop', 'SetPreset']
+    commands = worker.stats.as_dict()['commands']
+    assert [commands[name]['preempted'] for name in ('goto_preset', 'move_continuous', 'go_home')] == [1, 1, 1]
+    assert commands['set_preset']['executed'] == 1
+
+
+def test_stalled_stop_is_resent(camera):
+    fake, cam, worker = camera
+    worker.submit('move_continuous', cam.move_continuous, (0.5, 0, 0), coalesce_key=DRIVE)
+    wait_idle(worker)
+    fake.stall_next('Stop', PRIORITY_TIMEOUT * 3)
+    submit_stop(worker, cam)
+    wait_stopped(fake)
+    wait_idle(worker)
+
+    assert not fake.state.moving
+    stats = worker.stats.as_dict()
+    assert stats['commands']['stop']['resends'] >= 1
+    assert stats['commands']['stop']['slo_violations'] == 1
+
+
+def test_stop_overtaken_by_move_in_flight_is_resent(camera):
+    fake, cam, worker = camera
+    # camera applies the move when it answers, after the stop
+    fake.stall_next('ContinuousMove', LATENCY * 10)
+    worker.submit('move_continuous', cam.move_continuous, (0.5, 0, 0), coalesce_key=DRIVE)
+    sleep(0.01)
+    submit_stop(worker, cam)
+    sleep(LATENCY * 12)
+    wait_idle(worker)
+
+    assert not fake.state.moving
+    assert worker.stats.as_dict()['commands']['stop']['resends'] == 1
+    assert fake.operations().count('Stop') == 2
+
+
+def test_stalled_stop_is_not_resent_after_newer_move(camera):
+    fake, cam, worker = camera
+    start = len(fake.requests)
+    fake.stall_next('Stop', PRIORITY_TIMEOUT * 2)
+    submit_stop(worker, cam)
+    sleep(0.01)
+    worker.submit('move_continuous', cam.move_continuous, (0.5, 0, 0), coalesce_key=DRIVE)
+    sleep(PRIORITY_TIMEOUT * 2)
+    wait_idle(worker)
+
+    assert worker.stats.as_dict()['commands']['stop']['resends'] == 0
+    assert fake.operations()[start:].count('Stop') == 1
+
+
+def test_overtaken_stop_is_not_resent_after_newer_move(camera):
+    fake, cam, worker = camera
+    fake.stall_next('ContinuousMove', LATENCY * 10)
+    worker.submit('move_continuous', cam.move_continuous, (0.5, 0, 0), coalesce_key=DRIVE)
+    sleep(0.01)
+    submit_stop(worker, cam)
+    sleep(LATENCY * 4)
+    # operator moves the camera again before the move in flight finishes
+    worker.submit('move_continuous', cam.move_continuous, (0, 0.5, 0), coalesce_key=DRIVE)
+    sleep(LATENCY * 10)
+    wait_idle(worker)
+
+    assert worker.stats.as_dict()['commands']['stop']['resends'] == 0
+    assert fake.operations().count('Stop') == 1
+    assert fake.state.moving
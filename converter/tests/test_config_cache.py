@@ -0,0 +1,112 @@
+"""
+LocalConfigCache: cached cameras are served before the config source is read, so a failing source does not
+leave the converter without cameras, the cache is written atomically and only when cameras change
+"""
+import os
+
+import pytest
+
+from CamsParser import LocalConfigCache, read_config
+
+
+def cams(port):
+    return {('10.0.0.1', 80): {
+        'onvif_cam_login': 'admin', 'onvif_cam_password': 'password', 'visca_server_port': port,
+        'preset_client_range': {'default': {'min': 1, 'max': 10}}
+    }}
+
+
+class Source:
+    """
+    fetch_cams and wait_change of the config source
+    """
+    def __init__(self, cams=None):
+        self.cams = cams
+        self.fetches = 0
+        self.waits = 0
+
+    def fetch(self):
+        self.fetches += 1
+        if self.cams is None:
+            raise ValueError('Config source is unreachable')
+        return self.cams
+
+    def wait(self):
+        self.waits += 1
+
+
+def create_cache(path, source):
+    return LocalConfigCache(str(path), source.fetch, source.wait)
+
+
+def test_source_is_cached(tmp_path):
+    path = tmp_path / 'cams_cache.json'
+    source = Source(cams(10001))
+    assert create_cache(path, source).fetch() == cams(10001)
+    assert read_config(str(path)) == cams(10001)
+
+
+def test_cache_is_served_first_when_source_fails(tmp_path):
+    path = tmp_path / 'cams_cache.json'
+    create_cache(path, Source(cams(10001))).fetch()
+
+    source = Source()
+    cache = create_cache(path, source)
+    assert cache.fetch() == cams(10001)
+    assert source.fetches == 0
+    # source is read right after the cached cameras are started
+    cache.wait()
+    assert source.waits == 0
+    with pytest.raises(ValueError):
+        cache.fetch()
+    cache.wait()
+    assert source.waits == 1
+    assert read_config(str(path)) == cams(10001)
+
+
+def test_source_replaces_cached_cameras(tmp_path):
+    path = tmp_path / 'cams_cache.json'
+    create_cache(path, Source(cams(10001))).fetch()
+
+    cache = create_cache(path, Source(cams(10002)))
+    assert cache.fetch() == cams(10001)
+    cache.wait()
+    assert cache.fetch() == cams(10002)
+    assert read_config(str(path)) == cams(10002)
+
+
+def test_unchanged_cameras_are_not_written(tmp_path):
+    path = tmp_path / 'cams_cache.json'
+    cache = create_cache(path, Source(cams(10001)))
+    cache.fetch()
+    written = os.stat(path).st_ino
+    cache.fetch()
+    assert os.stat(path).st_ino == written
+
+
+def test_cache_is_written_atomically(tmp_path, monkeypatch):
+    path = tmp_path / 'cams_cache.json'
+    create_cache(path, Source(cams(10001))).fetch()
+    before = path.read_bytes()
+
+    def replace(src, dst):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(os, 'replace', replace)
+    cache = create_cache(path, Source(cams(10002)))
+    cache.fetch()
+    cache.wait()
+    assert cache.fetch() == cams(10002)
+
+    # failed write leaves the previous cache and no temporary files
+    assert path.read_bytes() == before
+    assert sorted(os.listdir(tmp_path)) == ['cams_cache.json']
+
+
+def test_broken_cache_is_ignored(tmp_path):
+    path = tmp_path / 'cams_cache.json'
+    path.write_text('{"cams": [')
+    source = Source(cams(10001))
+    assert create_cache(path, source).fetch() == cams(10001)
+    assert source.fetches == 1
+    assert read_config(str(path)) == cams(10001)
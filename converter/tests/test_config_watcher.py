@@ -0,0 +1,74 @@
+"""
+FileConfigWatcher with inotify and with stat polling: a save by atomic rename and an in-place write are
+noticed, other files of the directory are not, and a config file with broken json is not read as no cameras
+"""
+import json
+import os
+from threading import Timer
+
+import pytest
+
+import ConfigWatcher
+from CamsParser import read_config
+from ConfigWatcher import FileConfigWatcher
+
+POLL_INTERVAL = 0.05
+TIMEOUT = 5
+
+
+def config(port):
+    return {"cams": [{
+        "cam_ip": "10.0.0.1", "cam_port": 80, "cam_login": "admin", "cam_password": "password",
+        "visca_server_port": port, "preset_client_range": {"default": {"min": 1, "max": 10}}
+    }]}
+
+
+def save_by_rename(path, text):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as tmp:
+        tmp.write(text)
+    os.replace(tmp_path, path)
+
+
+def save_in_place(path, text):
+    with open(path, 'w') as file:
+        file.write(text)
+
+
+@pytest.fixture(params=['inotify', 'polling'])
+def watched(request, tmp_path, monkeypatch):
+    if request.param == 'inotify' and ConfigWatcher._inotify_functions is None:
+        pytest.skip('inotify is not available')
+    if request.param == 'polling':
+        monkeypatch.setattr(ConfigWatcher, '_inotify_functions', None)
+    path = tmp_path / 'cams.json'
+    path.write_text(json.dumps(config(10001)))
+    watcher = FileConfigWatcher(str(path), poll_interval=POLL_INTERVAL)
+    yield str(path), watcher
+    watcher.close()
+
+
+@pytest.mark.parametrize('save', [save_by_rename, save_in_place])
+def test_save_is_noticed(watched, save):
+    path, watcher = watched
+    Timer(0.1, save, (path, json.dumps(config(10002)))).start()
+    assert watcher.wait(TIMEOUT)
+    assert read_config(path)[('10.0.0.1', 80)]['visca_server_port'] == 10002
+
+
+def test_no_change_times_out(watched):
+    path, watcher = watched
+    save_by_rename(os.path.join(os.path.dirname(path), 'other.json'), '{}')
+    assert not watcher.wait(POLL_INTERVAL * 4)
+
+
+def test_broken_json_raises_instead_of_no_cameras(watched):
+    path, watcher = watched
+    # cameras of the previous config are kept by the refresh loop when reading fails
+    save_by_rename(path, json.dumps(config(10002))[:-5])
+    assert watcher.wait(TIMEOUT)
+    with pytest.raises(ValueError):
+        read_config(path)
+    save_by_rename(path, json.dumps({"cams": [{"cam_ip": "10.0.0.1"}]}))
+    with pytest.raises(ValueError):
+        read_config(path)
@@ -0,0 +1,148 @@
+"""
+Metrics of CamCommandTranslator against FakeOnvifCamera in Prometheus text exposition format: every sample
+follows HELP and TYPE of its family, label values are quoted, histogram buckets are cumulative and end with
++Inf equal to count, counters follow the commands sent. MetricsServer serves them on /metrics only
+"""
+import re
+from collections import defaultdict
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from Metrics import CONTENT_TYPE, LATENCY_BUCKETS, Histogram, MetricsServer, render_metrics
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from tests.fakes import create_translator, wait_idle
+
+METRIC_NAME = r'[a-zA-Z_:][a-zA-Z0-9_:]*'
+SAMPLE = re.compile(rf'^({METRIC_NAME})(?:{{(.*)}})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\.)*)"')
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+CLIENT = ('127.0.0.1', 50000)
+DRIVE_LEFT = b'\x81\x01\x06\x01\x08\x08\x01\x03\xFF'
+DRIVE_STOP = b'\x81\x01\x06\x01\x08\x08\x03\x03\xFF'
+PRESET_STORE = b'\x81\x09\x06\x12\xFF'
+ZOOM_POS_INQ = b'\x81\x09\x04\x47\xFF'
+
+
+def parse_exposition(text):
+    """
+    Checks text exposition format rules
+    :return: ({family: type}, {(name, labels): value})
+    """
+    assert text.endswith('\n')
+    types, samples = {}, {}
+    family = None
+    lines = text[:-1].split('\n')
+    for i, line in enumerate(lines):
+        if line.startswith('# HELP '):
+            family = line.split(' ')[2]
+            assert family not in types, f'{family} is declared twice'
+            assert lines[i + 1].startswith(f'# TYPE {family} ')
+            types[family] = lines[i + 1].split(' ')[3]
+            assert types[family] in ('counter', 'gauge', 'histogram')
+            if types[family] == 'counter':
+                assert family.endswith('_total')
+            continue
+        if line.startswith('# TYPE '):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, label_text, value = match.groups()
+        labels = LABEL.findall(label_text or '')
+        assert ','.join(f'{key}="{item}"' for key, item in labels) == (label_text or ''), line
+        suffixes = HISTOGRAM_SUFFIXES if types.get(family) == 'histogram' else ('',)
+        # samples are grouped after their family
+        assert any(name == family + suffix for suffix in suffixes), line
+        key = (name, tuple(labels))
+        assert key not in samples, f'{line} is duplicated'
+        samples[key] = float(value)
+    return types, samples
+
+
+def histograms(types, samples):
+    """
+    :return: {(family, labels without le): (list of (le, count), sum, count)}
+    """
+    result = defaultdict(lambda: ([], None, None))
+    for (name, labels), value in samples.items():
+        family = name.rsplit('_', 1)[0]
+        if types.get(family) != 'histogram':
+            continue
+        key = (family, tuple(label for label in labels if label[0] != 'le'))
+        buckets, total, count = result[key]
+        if name.endswith('_bucket'):
+            buckets.append((dict(labels)['le'], value))
+        elif name.endswith('_sum'):
+            total = value
+        else:
+            count = value
+        result[key] = (buckets, total, count)
+    return result
+
+
+def value(samples, name, **labels):
+    for (sample_name, sample_labels), sample_value in samples.items():
+        if sample_name == name and labels.items() <= dict(sample_labels).items():
+            return sample_value
+    return None
+
+
+def test_histogram_buckets_include_their_bound():
+    histogram = Histogram()
+    for observed in (0.001, LATENCY_BUCKETS[0], 0.3, 100):
+        histogram.observe(observed)
+    counts = dict(histogram.cumulative_counts())
+    assert counts[LATENCY_BUCKETS[0]] == 2
+    assert counts[0.25] == 2 and counts[0.5] == 3
+    assert counts[LATENCY_BUCKETS[-1]] == 3 and counts['+Inf'] == 4
+    assert histogram.sum == pytest.approx(100.306)
+
+
+@pytest.fixture
+def translator():
+    with FakeOnvifCamera(latency=0.01) as fake:
+        translator = create_translator(fake)
+        wait_idle(translator)
+        yield translator
+        translator.close()
+
+
+def test_render_metrics_exposition(translator):
+    for message in (DRIVE_LEFT, DRIVE_STOP, PRESET_STORE, ZOOM_POS_INQ, ZOOM_POS_INQ):
+        translator.handle_datagram(message, CLIENT)
+        wait_idle(translator, settle=0.05)
+    wait_idle(translator)
+    types, samples = parse_exposition(render_metrics([translator]))
+
+    camera = f'{translator.onvif_cam_addr[0]}:{translator.onvif_cam_addr[1]}'
+    assert {dict(labels)['camera'] for _, labels in samples} == {camera}
+    assert value(samples, 'visca_datagrams_received_total') == 5
+    assert value(samples, 'visca_commands_total', command='CAM_ZoomPosInq') == 2
+    assert value(samples, 'onvif_call_duration_seconds_count', operation='move_continuous') == 1
+    assert value(samples, 'onvif_preset_stores_total', result='written') == 1
+    assert value(samples, 'onvif_command_queue_depth') == 0
+
+    found = histograms(types, samples)
+    assert ('onvif_call_duration_seconds', (('camera', camera), ('visca_port', str(translator.visca_port)),
+                                            ('operation', 'move_continuous'))) in found
+    for (family, labels), (buckets, total, count) in found.items():
+        bounds = [le for le, _ in buckets]
+        assert bounds[-1] == '+Inf'
+        assert [float(le) for le in bounds[:-1]] == sorted(float(le) for le in bounds[:-1])
+        counts = [bucket_count for _, bucket_count in buckets]
+        assert counts == sorted(counts), (family, labels)
+        assert counts[-1] == count and total is not None
+
+
+def test_metrics_server(translator):
+    server = MetricsServer(0, lambda: [translator], host='127.0.0.1').start()
+    try:
+        with urlopen(f'http://127.0.0.1:{server.port}/metrics', timeout=5) as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            parse_exposition(response.read().decode())
+        with pytest.raises(HTTPError) as error:
+            urlopen(f'http://127.0.0.1:{server.port}/', timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.stop()
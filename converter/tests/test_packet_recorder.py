@@ -0,0 +1,104 @@
+"""
+PacketRecorder and read_records: records come back in order with their camera and client, the ring keeps
+the newest capacity records after wraparound, recording continues after reopening and a file of another
+capacity is started over
+"""
+import pytest
+
+from PacketRecorder import PacketRecorder, HEADER_SIZE, RECORD, RECEIVED, SENT, MAX_DATA_SIZE, make_camera_id, \
+    read_records
+
+CAPACITY = 8
+CAMERA_ID = make_camera_id(5001, ('10.0.0.1', 80))
+CLIENT = ('127.0.0.1', 50000)
+
+
+def datagram(i):
+    return bytes([0x81, 0x01, i % 256, 0xFF])
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'packets.rec')
+
+
+def record(recorder, first, amount, direction=RECEIVED):
+    recorder.record(direction, CAMERA_ID, [(datagram(i), CLIENT) for i in range(first, first + amount)])
+
+
+def test_records_are_read_back(path):
+    recorder = PacketRecorder(path, CAPACITY)
+    record(recorder, 0, 3)
+    recorder.record(SENT, make_camera_id(5002, ('camera.local', 80)), [(b'\x90\x41\xFF', ('10.0.0.9', 52381))])
+    recorder.close()
+
+    records = read_records(path)
+    assert [r.seq for r in records] == [0, 1, 2, 3]
+    assert [r.data for r in records[:3]] == [datagram(i) for i in range(3)]
+    assert {(r.visca_port, r.cam_addr, r.client_addr, r.direction) for r in records[:3]} == \
+        {(5001, ('10.0.0.1', 80), CLIENT, RECEIVED)}
+    # camera host which is not an ipv4 address is recorded as zeros
+    assert records[3][2:] == (5002, ('0.0.0.0', 0), ('10.0.0.9', 52381), SENT, b'\x90\x41\xFF')
+    assert records[0].time <= records[3].time
+
+
+@pytest.mark.parametrize('amount', [CAPACITY - 1, CAPACITY, CAPACITY + 1, CAPACITY * 3 + 5])
+def test_ring_keeps_newest_records(path, amount):
+    recorder = PacketRecorder(path, CAPACITY)
+    # written in batches, so wraparound happens inside a batch too
+    for first in range(0, amount, 3):
+        record(recorder, first, min(3, amount - first))
+    recorder.close()
+
+    records = read_records(path)
+    newest = range(max(0, amount - CAPACITY), amount)
+    assert [r.seq for r in records] == list(newest)
+    assert [r.data for r in records] == [datagram(i) for i in newest]
+
+
+def test_long_datagram_is_truncated(path):
+    recorder = PacketRecorder(path, CAPACITY)
+    recorder.record(RECEIVED, CAMERA_ID, [(bytes(range(MAX_DATA_SIZE + 10)), CLIENT)])
+    recorder.close()
+    assert read_records(path)[0].data == bytes(range(MAX_DATA_SIZE))
+
+
+def test_recording_continues_after_reopen(path):
+    recorder = PacketRecorder(path, CAPACITY)
+    record(recorder, 0, CAPACITY - 2)
+    recorder.close()
+    recorder = PacketRecorder(path, CAPACITY)
+    record(recorder, CAPACITY - 2, 5)
+    recorder.close()
+
+    assert [r.seq for r in read_records(path)] == list(range(3, CAPACITY + 3))
+
+
+def test_recording_of_other_capacity_is_started_over(path):
+    recorder = PacketRecorder(path, CAPACITY)
+    record(recorder, 0, 5)
+    recorder.close()
+    recorder = PacketRecorder(path, CAPACITY * 2)
+    record(recorder, 100, 2)
+    recorder.close()
+
+    assert [r.data for r in read_records(path)] == [datagram(100), datagram(101)]
+
+
+def test_record_interrupted_by_stop_is_skipped(path):
+    recorder = PacketRecorder(path, CAPACITY)
+    record(recorder, 0, CAPACITY + 2)
+    recorder.close()
+    # the newest record was being written: header counts it, its slot still holds the overwritten one
+    with open(path, 'r+b') as recording:
+        recording.seek(HEADER_SIZE + (CAPACITY + 1) % CAPACITY * RECORD.size)
+        recording.write(bytes(8))
+
+    assert [r.seq for r in read_records(path)] == list(range(2, CAPACITY + 1))
+
+
+def test_other_file_is_rejected(path):
+    with open(path, 'wb') as other:
+        other.write(bytes(128))
+    with pytest.raises(ValueError):
+        read_records(path)
@@ -0,0 +1,90 @@
+"""
+Preset recalls with PresetIndex, CamCommandTranslator against FakeOnvifCamera travelling to presets:
+travel rate is measured from finished recalls, a recall of the preset the camera settled at is skipped
+and a recall after the camera was moved by someone else is sent
+"""
+from time import monotonic, sleep
+
+import pytest
+
+from PTZStatusPoller import WAKE_PERIOD
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from benchmarks.LoadGenerator import preset_recall
+from tests.fakes import create_translator
+
+LATENCY = 0.01
+TRAVEL_RATE = 2.0
+CLIENT = ('127.0.0.1', 50000)
+PRESETS = {
+    '1': [0.0, 0.0, 0.0],
+    '2': [0.8, 0.3, 0.6],
+    '3': [-0.6, -0.2, 1.0],
+}
+
+
+@pytest.fixture
+def fake():
+    with FakeOnvifCamera(latency=LATENCY, travel_rate=TRAVEL_RATE) as fake:
+        fake.state.presets.update({token: list(position) for token, position in PRESETS.items()})
+        yield fake
+
+
+@pytest.fixture
+def translator(fake):
+    translator = create_translator(fake, presets=len(PRESETS))
+    deadline = monotonic() + 10
+    while (not translator.preset_index.loaded or translator.status_poller.status is None) \
+            and monotonic() < deadline:
+        sleep(0.01)
+    yield translator
+    translator.close()
+
+
+def recall(fake, translator, token):
+    """
+    :return: GotoPreset requests sent for the recall
+    """
+    start = len(fake.requests)
+    translator.handle_datagram(preset_recall(int(token)), CLIENT)
+    deadline = monotonic() + 10
+    while monotonic() < deadline:
+        with fake.state.lock:
+            fake.state.update()
+            arrived = fake.state.target is None
+        if arrived and 'GotoPreset' in fake.operations()[start:]:
+            break
+        sleep(0.01)
+    # settled status completes the goto and measures travel rate
+    sleep(WAKE_PERIOD + 0.3)
+    return fake.operations()[start:].count('GotoPreset')
+
+
+def test_travel_rate_is_measured(fake, translator):
+    index = translator.preset_index
+    assert recall(fake, translator, '2') == 1
+    assert index.gotos_measured >= 1
+    assert index.travel_rate == pytest.approx(TRAVEL_RATE, rel=0.3)
+    # 0.7 s from preset 2 to preset 3 at the fake rate
+    estimate = index.estimate_arrival('3')
+    assert estimate == pytest.approx(0.7, rel=0.3)
+
+
+def test_recall_of_preset_camera_sits_at_is_skipped(fake, translator):
+    recall(fake, translator, '2')
+    start = len(fake.requests)
+    for _ in range(5):
+        translator.handle_datagram(preset_recall(2), CLIENT)
+    sleep(0.3)
+    assert fake.operations()[start:].count('GotoPreset') == 0
+    assert translator.stats.skipped_gotos == 5
+
+
+def test_recall_after_camera_was_moved_elsewhere_is_sent(fake, translator):
+    recall(fake, translator, '2')
+    # moved behind the translator's back, settled status shows it away from the preset
+    with fake.state.lock:
+        fake.state.update()
+        fake.state.position = [position + 0.2 for position in fake.state.position]
+    sleep(translator.status_poller.idle_interval + 0.3)
+    assert recall(fake, translator, '2') == 1
+    assert translator.stats.skipped_gotos == 0
@@ -0,0 +1,125 @@
+"""
+Preset stores written behind the Pan-tiltPosInq reply by PresetWriter, CamCommandTranslator against
+FakeOnvifCamera: redundant stores are skipped, failed stores are retried unless motion is waiting
+and stores keep their order between motion commands
+"""
+from time import monotonic, sleep
+
+import pytest
+
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from tests.fakes import create_translator, wait_idle
+
+LATENCY = 0.01
+PRESETS = 4
+PRESET_STORE = b'\x81\x09\x06\x12\xFF'
+DRIVE_LEFT = b'\x81\x01\x06\x01\x08\x08\x01\x03\xFF'
+DRIVE_RIGHT = b'\x81\x01\x06\x01\x08\x08\x02\x03\xFF'
+DRIVE_STOP = b'\x81\x01\x06\x01\x08\x08\x03\x03\xFF'
+CLIENT = ('127.0.0.1', 50000)
+
+
+@pytest.fixture
+def fake():
+    with FakeOnvifCamera(latency=LATENCY) as fake:
+        yield fake
+
+
+@pytest.fixture
+def translator(fake):
+    translator = create_translator(fake, presets=PRESETS)
+    wait_idle(translator)
+    yield translator
+    translator.close()
+
+
+def store(translator, count):
+    for _ in range(count):
+        translator.handle_datagram(PRESET_STORE, CLIENT)
+    wait_idle(translator)
+
+
+def move(translator):
+    translator.handle_datagram(DRIVE_LEFT, CLIENT)
+    sleep(0.1)
+    translator.handle_datagram(DRIVE_STOP, CLIENT)
+    wait_idle(translator)
+
+
+def written(fake, start):
+    return fake.operations()[start:].count('SetPreset')
+
+
+def test_repeated_stores_without_motion_are_skipped(fake, translator):
+    move(translator)
+    start = len(fake.requests)
+    store(translator, PRESETS * 5)
+    assert written(fake, start) == PRESETS
+    assert translator.preset_writer.skipped == PRESETS * 4
+
+
+def test_stores_after_move_are_written_again(fake, translator):
+    move(translator)
+    store(translator, PRESETS)
+    move(translator)
+    start = len(fake.requests)
+    store(translator, PRESETS)
+    assert written(fake, start) == PRESETS
+
+
+def test_failed_store_is_retried(fake, translator):
+    writer = translator.preset_writer
+    move(translator)
+    fake.fail_next('SetPreset', 1)
+    start = len(fake.requests)
+    store(translator, 1)
+    assert (writer.retried, writer.failed, writer.written) == (1, 0, 1)
+    assert written(fake, start) == 2
+
+
+def test_retry_gives_way_to_waiting_motion(fake, translator):
+    writer = translator.preset_writer
+    move(translator)
+    fake.fail_next('SetPreset', 3)
+    start = len(fake.requests)
+    translator.handle_datagram(PRESET_STORE, CLIENT)
+    # the first write fails at once, the move is submitted before its retry
+    sleep(LATENCY * 5)
+    translator.handle_datagram(DRIVE_LEFT, CLIENT)
+    wait_idle(translator)
+    translator.handle_datagram(DRIVE_STOP, CLIENT)
+    wait_idle(translator)
+
+    assert (writer.retried, writer.failed) == (0, 1)
+    operations = [operation for operation in fake.operations()[start:] if operation != 'GetStatus']
+    assert operations[:2] == ['SetPreset', 'ContinuousMove']
+
+
+def test_store_between_moves_is_written_in_order(fake, translator):
+    move(translator)
+    start = len(fake.requests)
+    translator.handle_datagram(DRIVE_LEFT, CLIENT)
+    translator.handle_datagram(PRESET_STORE, CLIENT)
+    translator.handle_datagram(DRIVE_RIGHT, CLIENT)
+    wait_idle(translator)
+    translator.handle_datagram(DRIVE_STOP, CLIENT)
+    wait_idle(translator)
+    operations = [operation for operation in fake.operations()[start:] if operation != 'GetStatus']
+    assert operations[:3] == ['ContinuousMove', 'SetPreset', 'ContinuousMove']
+
+
+def test_mirrored_presets_at_the_settled_position_are_skipped(fake):
+    with fake.state.lock:
+        fake.state.presets.update({str(token): list(fake.state.position) for token in range(1, PRESETS + 1)})
+    translator = create_translator(fake, presets=PRESETS)
+    writer = translator.preset_writer
+    deadline = monotonic() + 10
+    while (not writer.index.loaded or translator.status_poller.status is None) and monotonic() < deadline:
+        sleep(0.01)
+    start = len(fake.requests)
+    store(translator, PRESETS)
+    translator.close()
+
+    assert len(writer.index) == PRESETS
+    assert written(fake, start) == 0
+    assert writer.skipped == PRESETS
@@ -0,0 +1,113 @@
+"""
+RawPTZClient envelopes against zeep ones and ONVIFCameraControl with raw envelopes against FakeOnvifCamera
+"""
+import base64
+import hashlib
+import re
+from datetime import datetime, timedelta
+from itertools import product
+
+import pytest
+from onvif import ONVIFError
+from zeep.wsdl.utils import etree_to_string
+
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+from onvif_tools.ONVIFClientCache import CachedONVIFCamera
+from onvif_tools.ONVIFRawPTZ import RawPTZClient
+from tests.fakes import LoopbackTransport
+
+VELOCITIES = ((0.1, -0.05, 0), (1e-7, 1 / 3, 1), (-1.0, 1, -0.5), (0.25, 0.0, 1.0))
+TIMEOUTS = (None, timedelta(seconds=1.5), timedelta(milliseconds=200))
+PRESET_TOKENS = (1, 128, '7', 'a&<b>"c')
+PROFILE_TOKENS = ('profile_1', 'p&<1>')
+# login, password, digest, camera time offset
+CREDENTIALS = (
+    ('admin', 'password', True, None),
+    ('op&<>"', 'pä<ss', True, timedelta(hours=-1, seconds=7)),
+    ('admin', 'pass&word', False, None),
+)
+NONCES = ('abcdefghijklmnop', 'Ωnonce<&>0123456')
+CREATED = (datetime(2026, 1, 2, 3, 4, 5, 678901), datetime(1999, 12, 31, 23, 59, 59))
+
+
+@pytest.fixture(scope='module')
+def fake():
+    with FakeOnvifCamera() as fake:
+        yield fake
+
+
+@pytest.fixture(scope='module', params=CREDENTIALS, ids=('digest', 'escaped digest dt_diff', 'text'))
+def ptz_service(request, fake):
+    login, password, digest, dt_diff = request.param
+    cam = CachedONVIFCamera(fake.host, fake.port, login, password, encrypt=digest, transport=LoopbackTransport(fake))
+    cam.dt_diff = dt_diff
+    return cam.create_ptz_service(), cam.transport, request.param
+
+
+def zeep_message(service, operation, params):
+    """
+    :return: (envelope bytes, http headers) zeep posts for the call
+    """
+    binding = service.ws_client._binding
+    envelope, headers = binding._create(operation, (), params, client=service.zeep_client,
+                                        options=service.ws_client._binding_options)
+    return etree_to_string(envelope), headers
+
+
+def cases(profile_token):
+    for velocity, timeout in product(VELOCITIES, TIMEOUTS):
+        params = {'ProfileToken': profile_token, 'Velocity': _vector(velocity)}
+        if timeout is not None:
+            params['Timeout'] = timeout
+        yield 'ContinuousMove', params, lambda raw: raw.render_continuous_move(velocity, timeout)
+    yield 'Stop', {'ProfileToken': profile_token}, lambda raw: raw.render_stop()
+    for token, speed in product(PRESET_TOKENS, VELOCITIES):
+        params = {'ProfileToken': profile_token, 'PresetToken': token, 'Speed': _vector(speed)}
+        yield 'GotoPreset', params, lambda raw: raw.render_goto_preset(token, speed)
+
+
+@pytest.mark.parametrize('profile_token, nonce, created', list(product(PROFILE_TOKENS, NONCES, CREATED)))
+def test_envelopes_equal_zeep_ones(ptz_service, profile_token, nonce, created):
+    service, transport, (login, password, digest, dt_diff) = ptz_service
+    raw = RawPTZClient(service.xaddr, profile_token, login, password, transport, use_digest=digest, dt_diff=dt_diff)
+    service.zeep_client.wsse.nonce = raw.nonce = nonce
+    service.zeep_client.wsse.created = raw.created = created
+    for operation, params, render in cases(profile_token):
+        expected, expected_headers = zeep_message(service, operation, params)
+        assert render(raw) == expected, operation
+        assert raw.headers(operation) == expected_headers, operation
+
+
+def test_camera_calls(fake):
+    # priority stop is sent over a transport of its own, to the fake camera over http
+    cam = ONVIFCameraControl(fake.addr, 'admin', 'password', transport=LoopbackTransport(fake), raw_ptz=True)
+    start = len(fake.requests)
+    cam.move_continuous((0.5, -0.25, 0.125))
+    with fake.state.lock:
+        assert fake.state.velocity == [0.5, -0.25, 0.125]
+    cam.stop_priority()
+    cam.goto_preset(1)
+    cam.stop()
+    assert fake.operations()[start:] == ['ContinuousMove', 'Stop', 'GotoPreset', 'Stop']
+    assert all(digest_valid(raw_body, b'password') for _, raw_body in fake.requests[start:])
+    cam.close()
+
+
+def test_fault_raises_onvif_error(fake):
+    cam = ONVIFCameraControl(fake.addr, 'admin', 'password', transport=LoopbackTransport(fake), raw_ptz=True)
+    fake.fail_next('ContinuousMove')
+    with pytest.raises(ONVIFError, match='failure injected'):
+        cam.move_continuous((0.1, 0, 0))
+    cam.close()
+
+
+def digest_valid(raw_body, password):
+    nonce, created, digest = (re.search(rb'<%s[^>]*>([^<]*)<' % name, raw_body).group(1)
+                              for name in (b'wsse:Nonce', b'wsu:Created', b'wsse:Password'))
+    expected = base64.b64encode(hashlib.sha1(base64.b64decode(nonce) + created + password).digest())
+    return digest == expected
+
+
+def _vector(ptz):
+    return {'PanTilt': {'x': ptz[0], 'y': ptz[1]}, 'Zoom': {'x': ptz[2]}}
@@ -0,0 +1,80 @@
+"""
+GoogleSheetsCamsParser against FakeSheetsApi: batched reading, revision skip and quota back off
+"""
+from time import sleep
+
+import gspread
+import pytest
+
+from CamsParser import GoogleSheetsCamsParser, parse_sheets
+from benchmarks.FakeSheetsApi import FakeSheetsApi
+from tests.fakes import REFRESH_EVERY_SEC, camera_sheet, legacy_read_config, requests_made
+
+CAMS = 30
+
+
+@pytest.fixture
+def api():
+    api = FakeSheetsApi(quota_per_minute=10 ** 9)
+    api.set_sheets([camera_sheet(i) for i in range(CAMS)])
+    return api
+
+
+def create_parser(api, **kwargs):
+    client = gspread.Client(None, session=api.session())
+    return GoogleSheetsCamsParser(None, api.spreadsheet_name, client=client, **kwargs), client
+
+
+def test_cams_equal_worksheet_by_worksheet_reading(api):
+    parser, client = create_parser(api)
+    legacy = legacy_read_config(client.open(api.spreadsheet_name))
+    cams, sheets, _ = requests_made(api, parser.read_config)
+    assert len(cams) == CAMS
+    assert cams == legacy
+    # spreadsheet properties fetched by gspread open and one read of all worksheets
+    assert sheets == 2
+
+
+def test_unchanged_revision_skips_sheets_request(api):
+    parser, _ = create_parser(api)
+    cams = parser.read_config()
+    result, sheets, drive = requests_made(api, parser.read_config)
+    assert result == cams
+    assert (sheets, drive) == (0, 1)
+
+
+def test_edit_is_read(api):
+    parser, _ = create_parser(api)
+    parser.read_config()
+    api.set_cell(0, 4, 2, '9')
+    cams, sheets, drive = requests_made(api, parser.read_config)
+    assert (sheets, drive) == (1, 1)
+    assert cams[('10.0.0.1', 80)]['preset_client_range']['default']['max'] == 9
+    assert cams == parse_sheets([rows for _, rows in api.sheets])
+
+
+def test_refreshes_with_edits_fit_in_quota():
+    api = FakeSheetsApi(quota_per_minute=60)
+    api.set_sheets([camera_sheet(i) for i in range(CAMS)])
+    parser, _ = create_parser(api)
+    for refresh in range(40):
+        api.clock += REFRESH_EVERY_SEC
+        if refresh % 10 == 9:
+            api.set_cell(refresh % CAMS, 4, 2, str(5 + refresh))
+        assert parser.read_config() == parse_sheets([rows for _, rows in api.sheets]), refresh
+
+
+def test_backs_off_on_quota_errors_keeping_previous_cams(api):
+    parser, _ = create_parser(api, backoff_min=0.2, backoff_max=0.4)
+    cams = parser.read_config()
+    api.set_cell(0, 4, 2, '9')
+    api.fail_next = 3
+    for attempt in range(3):
+        result, sheets, drive = requests_made(api, parser.read_config)
+        assert result == cams and sheets + drive == 1, attempt
+        # no requests while backing off
+        result, sheets, drive = requests_made(api, parser.read_config)
+        assert result == cams and sheets + drive == 0, attempt
+        sleep(min(0.4, 0.2 * 2 ** attempt) + 0.05)
+    result = parser.read_config()
+    assert result[('10.0.0.1', 80)]['preset_client_range']['default']['max'] == 9
@@ -0,0 +1,117 @@
+"""
+PTZStatusPoller with a blocking get_status: a stop requested during a poll is not lost, a woken idle
+poller polls at once and a stream of wakes keeps polls moving_interval apart. Zoom position inquiries
+of CamCommandTranslator against FakeOnvifCamera are answered from polled status without GetStatus
+"""
+from threading import Event
+from time import monotonic, sleep
+from types import SimpleNamespace
+
+import pytest
+
+from PTZStatusPoller import PTZStatusPoller, DEFAULT_IDLE_INTERVAL, DEFAULT_MOVING_INTERVAL, \
+    set_poller_defaults, visca_zoom
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from tests.fakes import create_translator
+
+IDLE_INTERVAL = 5.0
+MOVING_INTERVAL = 0.1
+ZOOM_POS_INQ = b'\x81\x09\x04\x47\xFF'
+CLIENT = ('127.0.0.1', 50000)
+
+
+def idle_status(zoom=0.0):
+    position = SimpleNamespace(PanTilt=SimpleNamespace(x=0.0, y=0.0), Zoom=SimpleNamespace(x=zoom))
+    return SimpleNamespace(Position=position, MoveStatus=SimpleNamespace(PanTilt='IDLE', Zoom='IDLE'))
+
+
+class BlockingStatus:
+    """
+    get_status of the poller, calls wait for release if it is cleared
+    """
+    def __init__(self):
+        self.calls = []
+        self.release = Event()
+        self.release.set()
+        self.entered = Event()
+
+    def __call__(self):
+        self.calls.append(monotonic())
+        self.entered.set()
+        self.release.wait()
+        return idle_status()
+
+
+@pytest.fixture
+def poller():
+    get_status = BlockingStatus()
+    poller = PTZStatusPoller('test', get_status, IDLE_INTERVAL, MOVING_INTERVAL)
+    poller.start()
+    while poller.status is None:
+        sleep(0.001)
+    yield poller, get_status
+    get_status.release.set()
+    poller.stop()
+    poller.join(IDLE_INTERVAL * 2)
+
+
+def test_stop_during_poll_is_not_lost():
+    get_status = BlockingStatus()
+    get_status.release.clear()
+    poller = PTZStatusPoller('test', get_status, IDLE_INTERVAL, MOVING_INTERVAL)
+    poller.start()
+    assert get_status.entered.wait(5)
+    poller.stop()
+    get_status.release.set()
+    # does not wait for the idle interval
+    poller.join(IDLE_INTERVAL / 2)
+    assert not poller.is_alive()
+
+
+def test_woken_idle_poller_polls_at_once(poller):
+    poller, get_status = poller
+    sleep(MOVING_INTERVAL)
+    polls = len(get_status.calls)
+    poller.wake()
+    sleep(MOVING_INTERVAL / 2)
+    assert len(get_status.calls) == polls + 1
+
+
+def test_stream_of_wakes_keeps_polls_moving_interval_apart(poller):
+    poller, get_status = poller
+    start = len(get_status.calls)
+    deadline = monotonic() + 1
+    while monotonic() < deadline:
+        poller.wake()
+        sleep(0.01)
+    calls = get_status.calls[start:]
+    assert len(calls) <= 1 / MOVING_INTERVAL + 1
+    assert min(b - a for a, b in zip(calls, calls[1:])) >= MOVING_INTERVAL * 0.95
+
+
+@pytest.fixture
+def fake():
+    set_poller_defaults(idle_interval=IDLE_INTERVAL)
+    with FakeOnvifCamera(latency=0.01) as fake:
+        yield fake
+    set_poller_defaults(DEFAULT_IDLE_INTERVAL, DEFAULT_MOVING_INTERVAL)
+
+
+def reply_zoom(reply):
+    return reply[2] << 12 | reply[3] << 8 | reply[4] << 4 | reply[5]
+
+
+def test_zoom_inquiry_is_answered_from_polled_status(fake):
+    with fake.state.lock:
+        fake.state.position[2] = 0.5
+    translator = create_translator(fake)
+    deadline = monotonic() + 10
+    while translator.status_poller.status is None and monotonic() < deadline:
+        sleep(0.01)
+    start = len(fake.requests)
+    replies = [translator.handle_datagram(ZOOM_POS_INQ, CLIENT) for _ in range(20)]
+    operations = fake.operations()[start:]
+    translator.close()
+
+    assert {reply_zoom(reply) for reply in replies} == {visca_zoom(0.5)}
+    assert 'GetStatus' not in operations
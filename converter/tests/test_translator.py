@@ -0,0 +1,37 @@
+"""
+CamCommandTranslator against FakeOnvifCamera
+"""
+from time import monotonic
+
+import pytest
+
+from benchmarks.FakeOnvifCamera import FakeOnvifCamera
+from onvif_tools.ONVIFCameraControl import ONVIFCameraControl
+from tests.fakes import create_translator
+
+LATENCY = 0.05
+
+
+@pytest.fixture
+def fake():
+    with FakeOnvifCamera(latency=LATENCY) as fake:
+        yield fake
+
+
+def test_close_with_full_queue_drops_moves_and_closes_camera(fake):
+    cam = ONVIFCameraControl(fake.addr, 'admin', 'password')
+    translator = create_translator(fake, cam=cam, command_queue_size=8)
+    close = cam.close
+    closed = []
+    cam.close = lambda: closed.append(monotonic()) or close()
+    worker = translator.worker
+    while worker.submit('move_continuous', cam.move_continuous, (0.5, 0, 0)):
+        pass
+    start = len(fake.requests)
+    started = monotonic()
+    translator.close()
+
+    assert closed and closed[0] - started < LATENCY * 4
+    assert not worker.is_alive()
+    # only the move in flight reaches the camera
+    assert fake.operations()[start:].count('ContinuousMove') <= 1
@@ -0,0 +1,82 @@
+"""
+UdpBatchIO on loopback with the recvfrom/sendto drain loop and with recvmmsg/sendmmsg: the same datagrams,
+addresses and order as plain sockets, batches of max_batch, truncation to max_datagram_size and replies
+longer than a sendmmsg slot
+"""
+import socket
+from select import select
+
+import pytest
+
+from UdpBatchIO import UdpBatchIO, is_mmsg_available
+
+MAX_BATCH = 8
+MAX_DATAGRAM_SIZE = 16
+TIMEOUT = 5
+
+
+@pytest.fixture(params=[False, True], ids=['drain', 'mmsg'])
+def sockets(request):
+    if request.param and not is_mmsg_available():
+        pytest.skip('recvmmsg/sendmmsg are not available')
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    clients = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(3)]
+    for client in clients:
+        client.bind(('127.0.0.1', 0))
+        client.settimeout(TIMEOUT)
+    io = UdpBatchIO(server, max_batch=MAX_BATCH, max_datagram_size=MAX_DATAGRAM_SIZE, use_mmsg=request.param)
+    assert io.use_mmsg == request.param
+    yield io, server, clients
+    for sock in [server] + clients:
+        sock.close()
+
+
+def messages(amount):
+    # lengths from 1 to past max_datagram_size, the longer ones are truncated
+    return [bytes([0x81, i]) + bytes(range(i % (MAX_DATAGRAM_SIZE + 4))) for i in range(amount)]
+
+
+def receive_all(io, server, amount):
+    received = []
+    while len(received) < amount:
+        ready, _, _ = select([server], [], [], TIMEOUT)
+        assert ready, f'{len(received)} of {amount} datagrams received'
+        batch = io.receive()
+        assert len(batch) <= MAX_BATCH
+        received.extend(batch)
+    assert io.receive() == []
+    return received
+
+
+def test_receive_matches_recvfrom(sockets):
+    io, server, clients = sockets
+    sent = []
+    for i, data in enumerate(messages(MAX_BATCH * 3 + 5)):
+        client = clients[i % len(clients)]
+        client.sendto(data, server.getsockname())
+        sent.append((data[:MAX_DATAGRAM_SIZE], client.getsockname()))
+
+    assert receive_all(io, server, len(sent)) == sent
+
+
+def test_send_matches_sendto(sockets):
+    io, server, clients = sockets
+    replies = [(data, clients[i % len(clients)].getsockname()) for i, data in enumerate(messages(MAX_BATCH * 2 + 3))]
+    # longer than a sendmmsg slot, sent with sendto
+    replies.insert(5, (bytes(range(UdpBatchIO.SEND_SLOT_SIZE + 36)), clients[0].getsockname()))
+    io.send(replies)
+
+    for client in clients:
+        expected = [data for data, addr in replies if addr == client.getsockname()]
+        received = [client.recvfrom(1024) for _ in expected]
+        assert sorted(data for data, _ in received) == sorted(expected)
+        assert {addr for _, addr in received} == {server.getsockname()}
+
+
+def test_send_keeps_order_of_slot_sized_replies(sockets):
+    io, server, clients = sockets
+    client = clients[0]
+    replies = [(data, client.getsockname()) for data in messages(MAX_BATCH * 3)]
+    io.send(replies)
+    assert [client.recvfrom(1024)[0] for _ in replies] == [data for data, _ in replies]
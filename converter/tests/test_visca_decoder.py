@@ -0,0 +1,70 @@
+"""
+decode_visca_command against classify_visca_command: the same dict or both raise on every structured
+visca command and on seeded random messages
+"""
+import random
+from itertools import product
+
+import pytest
+
+from visca_tools.ViscaCommandClassificator import classify_visca_command
+from visca_tools.ViscaCommandDecoder import decode_visca_command, DECODERS
+
+ADDRESSES = (1, 2, 15)
+SEEDS = range(8)
+RANDOM_MESSAGES = 25000
+
+
+def structured_messages(x, category, command_bytes):
+    prefix = bytes([0x80 + x, category]) + command_bytes
+    for byte in range(256):
+        yield prefix + bytes([byte, 0xFF])
+    for p, q in product(range(256), (0x01, 0x02, 0x03)):
+        yield prefix + bytes([0x18, 0x14, p % 4, q, 0xFF])
+    yield prefix + bytes([0x18, 0x14, 0, 1, 2, 3, 0, 0, 0, 0, 0xFF])
+    yield prefix + bytes([0x18, 0x14, 0, 1, 2, 3, 0, 0, 0, 0])
+    yield prefix + bytes([0x2F, 0x14, 0xF0, 0xF0, 0xF0, 0xF0, 0xFF])
+    for length in range(0, 12):
+        yield prefix + bytes(length)
+
+
+def random_messages(amount, rnd):
+    keys = list(DECODERS)
+    for _ in range(amount):
+        length = rnd.randrange(0, 17)
+        message = bytes(rnd.randrange(256) for _ in range(length))
+        if length >= 4 and rnd.random() < 0.7:
+            category, command_bytes = rnd.choice(keys)
+            message = bytes([0x80 + rnd.randrange(16), category]) + command_bytes + message[4:]
+        yield message
+
+
+def outcome(classify, message):
+    try:
+        command = classify(message)
+    except Exception:
+        return 'error'
+    return dict(command.to_dict() if hasattr(command, 'to_dict') else command)
+
+
+def assert_equivalent(messages):
+    for message in messages:
+        expected = outcome(classify_visca_command, message)
+        assert outcome(decode_visca_command, message) == expected, message.hex()
+
+
+@pytest.mark.parametrize('x', ADDRESSES)
+def test_address_set(x):
+    assert_equivalent(bytes([0x80 + x, 0x20 + p, 0xFF]) for p in range(16))
+
+
+@pytest.mark.parametrize('x, command', list(product(ADDRESSES, DECODERS)),
+                         ids=[f'{x}-{category:02x}{command_bytes.hex()}'
+                              for x, (category, command_bytes) in product(ADDRESSES, DECODERS)])
+def test_structured_messages(x, command):
+    assert_equivalent(structured_messages(x, *command))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_random_messages(seed):
+    assert_equivalent(random_messages(RANDOM_MESSAGES, random.Random(seed)))
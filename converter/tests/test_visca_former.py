@@ -0,0 +1,43 @@
+"""
+Precomputed replies of ViscaCommandFormer against form_visca_command: the same bytes for every reply address
+"""
+import pytest
+
+from visca_tools.ViscaCommandFormer import form_visca_command, form_syntax_error, form_ack, \
+    form_pan_tilt_pos_inq_reply, form_zoom_pos_inq_reply, form_focus_pos_inq_reply
+
+ADDRESSES = range(16)
+
+
+@pytest.mark.parametrize('z', ADDRESSES)
+def test_syntax_error_and_ack(z):
+    assert form_syntax_error(z) == form_visca_command({'Command': 'Syntax_Error', 'z': z})
+    assert form_ack(z) == form_visca_command({'Command': 'Ack', 'z': z})
+
+
+@pytest.mark.parametrize('y', ADDRESSES)
+def test_pan_tilt_pos_inq_reply(y):
+    # more presets than the memo keeps, so it is cleared on the way
+    for preset in range(0, 0x10000, 7):
+        expected = form_visca_command({'Command': 'Pan-tiltPosInq', 'wwww': preset, 'zzzz': 0, 'y': y})
+        assert form_pan_tilt_pos_inq_reply(y, preset) == expected
+        # memoized reply is the same on the second call
+        assert form_pan_tilt_pos_inq_reply(y, preset) == expected
+    for zzzz in (1, 0x1234, 0xFFFF):
+        expected = form_visca_command({'Command': 'Pan-tiltPosInq', 'wwww': 25, 'zzzz': zzzz, 'y': y})
+        assert form_pan_tilt_pos_inq_reply(y, 25, zzzz) == expected
+        assert form_pan_tilt_pos_inq_reply(y, 25, zzzz) == expected
+
+
+@pytest.mark.parametrize('y', ADDRESSES)
+def test_zoom_and_focus_pos_inq_replies(y):
+    zero = {'p': 0, 'q': 0, 'r': 0, 's': 0, 'y': y}
+    assert form_zoom_pos_inq_reply(y) == form_visca_command(dict(zero, Command='CAM_ZoomPosInq'))
+    for p in range(16):
+        for q in range(16):
+            for r, s in ((0, 15), (q, p)):
+                description = {'p': p, 'q': q, 'r': r, 's': s, 'y': y}
+                assert form_zoom_pos_inq_reply(y, p, q, r, s) == \
+                    form_visca_command(dict(description, Command='CAM_ZoomPosInq'))
+                assert form_focus_pos_inq_reply(y, p, q, r, s) == \
+                    form_visca_command(dict(description, Command='CAM_FocusPosInq'))
@@ -5,6 +5,9 @@ def classify_visca_command(message):
     def is_message_inquiry():
         return message[0] // 0x10 == 0x08 and message[1] == 0x09
 
+    def is_message_cancel():
+        return message[0] // 0x10 == 0x08 and message[1] // 0x10 == 0x02
+
     def handle_message(command_handler_definer):
         command_indicator = message[2:4]
         if command_indicator not in command_handler_definer:
@@ -21,7 +24,9 @@ def classify_visca_command(message):
         return handle_message(INQUIRY_COMMAND_HANDLER_DEFINER)
 
     def CommandCancel():
-        classified_command = {'command': 'CommandCancel'}
+        classified_command = {'command': 'CommandCancel',
+                              'p': message[1] % 0x10,
+                              'x': x}
         return classified_command
 
     def Home():
@@ -123,7 +128,6 @@ def classify_visca_command(message):
         return bytes([y[0] << 4 | y[1], y[2] << 4 | y[3]])
 
     CONTROL_COMMAND_HANDLER_DEFINER = {
-        b'': CommandCancel,
         b'\x06\x04': Home,
         b'\x04\x07': CAM_Zoom,
         b'\x04\x47': CAM_Zoom,
@@ -152,5 +156,7 @@ def classify_visca_command(message):
         return handle_control_message()
     elif is_message_inquiry():
         return handle_inquiry_message()
+    elif is_message_cancel():
+        return CommandCancel()
     else:
         return UNKNOWN_COMMAND
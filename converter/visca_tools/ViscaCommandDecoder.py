@@ -0,0 +1,187 @@
+"""
+Table driven visca command decoder, a faster drop-in for classify_visca_command.
+Decoders are looked up by (message type byte, command bytes) in a table built at import,
+constant commands are preallocated and decoded commands are memoized by message bytes.
+Returns immutable ViscaCommand objects with the same keys and values as classify_visca_command dicts
+"""
+
+
+class ViscaCommand(tuple):
+    """
+    Immutable decoded visca command. Fields are accessed like dict keys: command['x']
+    """
+    __slots__ = ()
+    fields = ()
+    _index = {}
+
+    def __new__(cls, *values):
+        return tuple.__new__(cls, values)
+
+    def __getitem__(self, key):
+        return tuple.__getitem__(self, self._index[key])
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, key, default=None):
+        if key in self._index:
+            return tuple.__getitem__(self, self._index[key])
+        return default
+
+    def keys(self):
+        return self.fields
+
+    def to_dict(self):
+        return dict(zip(self.fields, tuple.__iter__(self)))
+
+    def __repr__(self):
+        return f'{type(self).__name__}{self.to_dict()}'
+
+
+def _command_type(name, fields):
+    return type(name, (ViscaCommand,), {
+        '__slots__': (),
+        'fields': fields,
+        '_index': {field: i for i, field in enumerate(fields)}
+    })
+
+
+Unknown = _command_type('Unknown', ('command',))
+Simple = _command_type('Simple', ('command', 'x'))
+Home = _command_type('Home', ('command', 'function', 'x'))
+CommandCancel = _command_type('CommandCancel', ('command', 'p', 'x'))
+CAM_ZoomVariable = _command_type('CAM_ZoomVariable', ('command', 'function', 'p', 'x'))
+CAM_ZoomDirect = _command_type('CAM_ZoomDirect', ('command', 'function', 'p', 'q', 'r', 's', 'x'))
+Pan_tiltDrive = _command_type('Pan_tiltDrive', ('command', 'function', 'VV', 'WW', 'x'))
+Pan_tiltAbsolute = _command_type('Pan_tiltAbsolute', ('command', 'function', 'VV', 'WW', 'YYYY', 'ZZZZ', 'x'))
+
+CONTROL = 0x01
+INQUIRY = 0x09
+CANCEL = 0x02
+MEMO_SIZE = 4096
+
+UNKNOWN_WITHOUT_X = Unknown('unknown')
+UNKNOWN = tuple(Simple('unknown', x) for x in range(16))
+HOME = tuple(Home('Home', 'Home', x) for x in range(16))
+# COMMAND_CANCEL[x][socket number]
+COMMAND_CANCEL = tuple(tuple(CommandCancel('CommandCancel', p, x) for p in range(16)) for x in range(16))
+PAN_TILT_POS_INQ = tuple(Simple('Pan-tiltPosInq', x) for x in range(16))
+CAM_ZOOM_POS_INQ = tuple(Simple('CAM_ZoomPosInq', x) for x in range(16))
+CAM_FOCUS_POS_INQ = tuple(Simple('CAM_FocusPosInq', x) for x in range(16))
+
+
+def _zoom_variable_function(speed_byte):
+    if speed_byte // 0x10 == 0x02:
+        return 'Tele'
+    elif speed_byte // 0x10 == 0x03:
+        return 'Wide'
+    elif speed_byte == 0:
+        return 'Stop'
+    return None
+
+
+# CAM_ZOOM_VARIABLE[x][speed byte], None for bytes classify_visca_command fails on
+CAM_ZOOM_VARIABLE = tuple(
+    tuple(None if _zoom_variable_function(byte) is None
+          else CAM_ZoomVariable('CAM_Zoom', _zoom_variable_function(byte), byte % 0x10, x)
+          for byte in range(256))
+    for x in range(16)
+)
+
+PAN_TILT_DIRECTIONS = {
+    b'\x03\x03': 'Stop',
+    b'\x02\x02': 'DownRight',
+    b'\x01\x02': 'DownLeft',
+    b'\x02\x01': 'Upright',
+    b'\x01\x01': 'Upleft',
+    b'\x02\x03': 'Right',
+    b'\x01\x03': 'Left',
+    b'\x03\x02': 'Down',
+    b'\x03\x01': 'Up',
+}
+
+
+def _home(message, x):
+    return HOME[x]
+
+
+def _pan_tilt_pos_inq(message, x):
+    return PAN_TILT_POS_INQ[x]
+
+
+def _cam_zoom_pos_inq(message, x):
+    return CAM_ZOOM_POS_INQ[x]
+
+
+def _cam_focus_pos_inq(message, x):
+    return CAM_FOCUS_POS_INQ[x]
+
+
+def _cam_zoom(message, x):
+    args = message[2:-1]
+    if args[0:2] == b'\x04\x47':
+        return CAM_ZoomDirect('CAM_Zoom', 'Direct', args[2] // 0x10, args[3] // 0x10, args[4] // 0x10,
+                              args[5] // 0x10, x)
+    command = CAM_ZOOM_VARIABLE[x][args[2]]
+    if command is None:
+        raise ValueError(f'Unknown CAM_Zoom function {args[2]:#04x}')
+    return command
+
+
+def _pan_tilt_drive(message, x):
+    args = message[2:-1]
+    VV = args[2]
+    WW = args[3]
+    if args[1] == 0x01:
+        function = PAN_TILT_DIRECTIONS.get(args[4:][-3:])
+        if function is None:
+            return UNKNOWN[x]
+        return Pan_tiltDrive('Pan_tiltDrive', function, VV, WW, x)
+    return Pan_tiltAbsolute('Pan_tiltDrive', 'AbsolutePosition', VV, WW,
+                            _get_YYYY_from_0Y0Y0Y0Y(args[4:8]), _get_YYYY_from_0Y0Y0Y0Y(args[8:12]), x)
+
+
+def _get_YYYY_from_0Y0Y0Y0Y(y):
+    return bytes([y[0] << 4 | y[1], y[2] << 4 | y[3]])
+
+
+# (message type byte, command bytes) -> decoder
+DECODERS = {
+    (CONTROL, b'\x06\x04'): _home,
+    (CONTROL, b'\x04\x07'): _cam_zoom,
+    (CONTROL, b'\x04\x47'): _cam_zoom,
+    (CONTROL, b'\x06\x01'): _pan_tilt_drive,
+    (CONTROL, b'\x06\x02'): _pan_tilt_drive,
+    (INQUIRY, b'\x06\x12'): _pan_tilt_pos_inq,
+    (INQUIRY, b'\x04\x48'): _cam_focus_pos_inq,
+    (INQUIRY, b'\x04\x47'): _cam_zoom_pos_inq,
+}
+
+_memo = {}
+
+
+def decode_visca_command(message):
+    if type(message) is not bytes:
+        raise ValueError('Visca command decoder require message of bytes')
+
+    command = _memo.get(message)
+    if command is None:
+        command = _decode(message)
+        if len(_memo) >= MEMO_SIZE:
+            _memo.clear()
+        _memo[message] = command
+    return command
+
+
+def _decode(message):
+    if len(message) < 3:
+        return UNKNOWN_WITHOUT_X
+    x = message[0] % 0x10
+    if message[0] // 0x10 != 0x08:
+        return UNKNOWN[x]
+    if message[1] // 0x10 == CANCEL:
+        return COMMAND_CANCEL[x][message[1] % 0x10]
+    decoder = DECODERS.get((message[1], message[2:4]))
+    if decoder is None:
+        return UNKNOWN[x]
+    return decoder(message, x)
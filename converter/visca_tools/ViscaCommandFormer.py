@@ -84,4 +84,65 @@ DESCRIPTION_HANDLER_DEFINER = {
         'Pan-tiltPosInq': Pan_tiltPosInq,
         'CAM_ZoomPosInq': CAM_ZoomPosInq,
         'CAM_FocusPosInq': CAM_FocusPosInq
-    }
\ No newline at end of file
+    }
+
+# Precomputed and memoized replies, so answering an inquiry is a lookup instead of forming bytes.
+# Indexed by y (z), the value is the same as form_visca_command gives for the same description
+REPLY_MEMO_SIZE = 4096
+
+ACK_REPLIES = tuple(Ack({'z': z}) for z in range(16))
+SYNTAX_ERROR_REPLIES = tuple(Syntax_Error({'z': z}) for z in range(16))
+ZERO_POSITION_REPLIES = tuple(ypqts_inquiry_responce({'y': y, 'p': 0, 'q': 0, 'r': 0, 's': 0}) for y in range(16))
+
+_pan_tilt_pos_inq_replies = tuple({} for _ in range(16))
+_ypqrs_inquiry_replies = tuple({} for _ in range(16))
+
+
+def form_ack(z):
+    if 0 <= z < 16:
+        return ACK_REPLIES[z]
+    return Ack({'z': z})
+
+
+def form_syntax_error(z):
+    if 0 <= z < 16:
+        return SYNTAX_ERROR_REPLIES[z]
+    return Syntax_Error({'z': z})
+
+
+def form_pan_tilt_pos_inq_reply(y, wwww, zzzz=0):
+    if not 0 <= y < 16:
+        return Pan_tiltPosInq({'y': y, 'wwww': wwww, 'zzzz': zzzz})
+    replies = _pan_tilt_pos_inq_replies[y]
+    key = wwww if zzzz == 0 else (wwww, zzzz)
+    reply = replies.get(key)
+    if reply is None:
+        reply = Pan_tiltPosInq({'y': y, 'wwww': wwww, 'zzzz': zzzz})
+        if len(replies) >= REPLY_MEMO_SIZE:
+            replies.clear()
+        replies[key] = reply
+    return reply
+
+
+def form_zoom_pos_inq_reply(y, p=0, q=0, r=0, s=0):
+    return _form_ypqrs_inquiry_reply(y, p, q, r, s)
+
+
+def form_focus_pos_inq_reply(y, p=0, q=0, r=0, s=0):
+    return _form_ypqrs_inquiry_reply(y, p, q, r, s)
+
+
+def _form_ypqrs_inquiry_reply(y, p, q, r, s):
+    if not 0 <= y < 16:
+        return ypqts_inquiry_responce({'y': y, 'p': p, 'q': q, 'r': r, 's': s})
+    if not (p or q or r or s):
+        return ZERO_POSITION_REPLIES[y]
+    replies = _ypqrs_inquiry_replies[y]
+    key = (p, q, r, s)
+    reply = replies.get(key)
+    if reply is None:
+        reply = ypqts_inquiry_responce({'y': y, 'p': p, 'q': q, 'r': r, 's': s})
+        if len(replies) >= REPLY_MEMO_SIZE:
+            replies.clear()
+        replies[key] = reply
+    return reply